@@ -0,0 +1,37 @@
+import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Upper bound on blocking broker/HTTP/model calls running at once per process
+BLOCKING_IO_WORKERS = int(os.getenv("BLOCKING_IO_WORKERS", "16"))
+
+_executor = ThreadPoolExecutor(max_workers=BLOCKING_IO_WORKERS, thread_name_prefix="blocking-io")
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Runs a synchronous call on the bounded blocking-I/O pool and awaits it,
+    so async endpoints don't stall the event loop on broker or HTTP round trips.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+def submit_blocking(func, *args, **kwargs):
+    """Fire-and-forget variant of run_blocking for work the caller doesn't wait on."""
+    future = _executor.submit(func, *args, **kwargs)
+    future.add_done_callback(_log_failure)
+    return future
+
+
+def _log_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        print(f"❌ Background task failed: {future.exception()}")
+
+
+def shutdown_blocking_pool(wait: bool = False):
+    _executor.shutdown(wait=wait, cancel_futures=True)
@@ -7,6 +7,7 @@ import xgboost as xgb
 import joblib
 import plotly.graph_objects as go
 import plotly.io as pio
+from xgb_forecaster import XGBForecaster, make_direct_training_set, HORIZON_ATTR
 
 # --------------------
 # Load dataset
@@ -95,26 +96,20 @@ print(f"➡️ R²:   {r2:.4f}")
 minutes_per_day = 390
 n_future = 5 * minutes_per_day
 
-last_features = df.iloc[-1][feature_cols].values.reshape(1, -1)
-future_preds = []
-
-for _ in range(n_future):
-    # Predict next close
-    next_close = best_model.predict(last_features)[0]
-    future_preds.append(next_close)
-
-    # Shift lag features
-    last_row = last_features.flatten()
-    new_lags = np.roll(last_row[-window:], 1)
-    new_lags[0] = next_close
-
-    # Construct new feature vector
-    new_features = np.concatenate([
-        last_row[:9],  # keep OHLCV+indicators same (static)
-        new_lags
-    ])
+# --------------------
+# Direct Multi-Horizon Model
+# --------------------
+# Same features plus the step count h as one extra column, trained on the close
+# h bars ahead; a whole forecast then needs a single batched predict
+X_direct, y_direct = make_direct_training_set(X_train, df["close"].values[:split], horizon=n_future)
+direct_model = xgb.XGBRegressor(objective="reg:squarederror", n_jobs=-1, **random_search.best_params_)
+direct_model.fit(X_direct, y_direct)
+direct_model.get_booster().set_attr(**{HORIZON_ATTR: str(n_future)})
 
-    last_features = new_features.reshape(1, -1)
+# Recursive forecast keeps the lags unscaled and scales each row like training
+forecaster = XGBForecaster(best_model, scaler, window=window, direct_model=direct_model)
+last_features = df.iloc[-1][feature_cols].to_numpy(dtype=float)
+future_preds = forecaster.recursive(last_features, n_future)
 
 # --------------------
 # Build forecast DataFrame
@@ -158,6 +153,9 @@ fig.show()
 best_model.save_model("xgb_model.json")
 print("✅ XGBoost Model saved as xgb_model.json")
 
+direct_model.save_model("xgb_direct_model.json")
+print("✅ Direct multi-horizon model saved as xgb_direct_model.json")
+
 # --------------------
 # Save Model + Scaler
 # --------------------
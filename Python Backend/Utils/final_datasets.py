@@ -1,6 +1,8 @@
+import os
 import pandas as pd
 import pandas_ta as ta
 from datetime import date
+from dags.Features.tools.candle_store import get_candle_store, TOOLS_DATA_DIR
 
 def add_features(df):
     df['ema_50'] = ta.ema(df['close'], length=50)
@@ -22,20 +24,34 @@ def add_features(df):
     return df
 
 
-def generate_final_dataset(company_name: str):
+def load_candles(company_name: str, symbol: str = None, interval: str = "ONE_MINUTE") -> pd.DataFrame:
+    """
+    Loads candles from the columnar candle store when it has the symbol,
+    falling back to the legacy per-company CSV.
+    """
+    if symbol:
+        store = get_candle_store()
+        if store.last_timestamp(symbol, interval) is not None:
+            return store.read(symbol, interval)
+
+    candle_path = os.path.join(TOOLS_DATA_DIR, "candlestick_data", f"{company_name.lower()}_candles_angel.csv")
+    candles_df = pd.read_csv(candle_path)
+    candles_df['timestamp'] = pd.to_datetime(candles_df['timestamp'])
+    return candles_df
+
+
+def generate_final_dataset(company_name: str, symbol: str = None, interval: str = "ONE_MINUTE"):
     """
     Generates the final dataset with technical indicators and sentiment scores for a given company.
     Saves the final CSV to ../Final_Datasets/final_dataset_{company_name}.csv
     """
-    candle_path = f"../dags/Features/tools/Tools_Data/candlestick_data/{company_name.lower()}_candles_angel.csv"
     news_path = f"../dags/Features/tools/Tools_Data/indian_stock_news/{company_name.lower()}_news.csv"
     
     # Load data
-    candles_df = pd.read_csv(candle_path)
+    candles_df = load_candles(company_name, symbol, interval)
     news_df = pd.read_csv(news_path)
 
     # Convert dates
-    candles_df['timestamp'] = pd.to_datetime(candles_df['timestamp'])
     news_df['date'] = pd.to_datetime(news_df['date']).dt.date
 
     # Aggregate sentiment
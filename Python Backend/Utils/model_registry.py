@@ -0,0 +1,263 @@
+"""
+model_registry.py
+
+Forecast models keyed by (symbol, kind, version).
+
+Layout:
+    <root>/<SYMBOL>/<kind>/<version>/schema.json   (+ the artifacts it names)
+
+schema.json:
+    {"model": "model.h5", "scaler": "scaler.pkl", "features": ["open", ...]}
+    xgb models may also name an optional "direct_model".
+
+- A symbol without its own models falls back to <root>/DEFAULT, then to the
+  SBI artifacts shipped in Utils/.
+- Artifacts load on first use. Loaded models are kept in an LRU bounded by
+  MODEL_CACHE_MB (sized by artifact bytes on disk).
+- Version directories are rescanned every MODEL_SCAN_INTERVAL seconds, so
+  dropping in a new version switches traffic to it without a restart. Write
+  schema.json last: a version without it is ignored.
+"""
+
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional
+
+import joblib
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# -------- CONFIG --------
+MODEL_DIR = os.getenv("MODEL_REGISTRY_DIR", "Utils/models")
+MODEL_CACHE_BYTES = int(float(os.getenv("MODEL_CACHE_MB", "512")) * 1024 * 1024)
+SCAN_INTERVAL = float(os.getenv("MODEL_SCAN_INTERVAL", "30"))
+DEFAULT_SYMBOL = "DEFAULT"
+SCHEMA_FILE = "schema.json"
+
+# Models trained before the registry existed (SBI only), used when nothing else matches
+LEGACY_MODELS = {
+    "seq2seq": {
+        "model": "sbi_seq2seq_model.h5",
+        "scaler": "sbi_scaler.pkl",
+        "features": ["open", "high", "low", "close", "volume"],
+    },
+    "xgb": {
+        "model": "xgb_model.json",
+        "scaler": "sbi_xgb_scaler.pkl",
+        "direct_model": "xgb_direct_model.json",
+        "features": None,  # filled from xgb_forecaster.FEATURE_COLS
+    },
+}
+LEGACY_DIR = "Utils"
+
+
+class ModelSpec(NamedTuple):
+    symbol: str
+    kind: str
+    version: str
+    path: str
+    schema: dict
+
+
+class LoadedModel(NamedTuple):
+    spec: ModelSpec
+    model: object          # Seq2SeqEngine or XGBForecaster
+    scaler: object
+    features: List[str]
+    size_bytes: int
+
+
+# -------- loaders --------
+def _load_seq2seq(spec: ModelSpec):
+    from tensorflow.keras.models import load_model
+    from Utils.seq2seq_inference import Seq2SeqEngine
+
+    engine = Seq2SeqEngine(load_model(os.path.join(spec.path, spec.schema["model"])))
+    engine.warmup()
+    return engine
+
+
+def _load_xgb(spec: ModelSpec, scaler):
+    import xgboost as xgb
+    from Utils.xgb_forecaster import XGBForecaster
+
+    model_path = os.path.join(spec.path, spec.schema["model"])
+    if model_path.endswith(".pkl"):
+        model = joblib.load(model_path)
+    else:
+        model = xgb.XGBRegressor()
+        model.load_model(model_path)
+
+    # The direct multi-horizon model is optional; without it every forecast is recursive
+    direct_model = None
+    direct_name = spec.schema.get("direct_model")
+    if direct_name and os.path.exists(os.path.join(spec.path, direct_name)):
+        direct_model = xgb.Booster(model_file=os.path.join(spec.path, direct_name))
+    return XGBForecaster(model, scaler, direct_model=direct_model)
+
+
+def _schema_features(kind: str, schema: dict) -> List[str]:
+    if schema.get("features"):
+        return list(schema["features"])
+    if kind == "xgb":
+        from Utils.xgb_forecaster import FEATURE_COLS
+        return list(FEATURE_COLS)
+    raise ValueError(f"No feature schema for {kind} model")
+
+
+def _version_key(version: str):
+    # "v10" sorts after "v9"; plain timestamps and numbers sort naturally
+    digits = "".join(ch for ch in version if ch.isdigit())
+    return (int(digits) if digits else -1, version)
+
+
+class ModelRegistry:
+    """Lazily loaded, LRU-cached forecast models with per-symbol selection."""
+
+    def __init__(self, root: str = MODEL_DIR, budget_bytes: int = MODEL_CACHE_BYTES,
+                 scan_interval: float = SCAN_INTERVAL):
+        self.root = root
+        self.budget_bytes = budget_bytes
+        self.scan_interval = scan_interval
+        self._lock = threading.Lock()
+        self._load_locks: Dict[tuple, threading.Lock] = {}
+        self._cache: "OrderedDict[tuple, LoadedModel]" = OrderedDict()
+        self._scans: Dict[tuple, tuple] = {}   # (symbol, kind) -> (scanned_at, versions)
+        self.loads = 0
+        self.evictions = 0
+
+    # -------- discovery --------
+    def versions(self, symbol: str, kind: str) -> List[str]:
+        """Published versions of a symbol's model, oldest first (rescanned every scan_interval)."""
+        key = (symbol.upper(), kind)
+        cached = self._scans.get(key)
+        if cached and time.time() - cached[0] < self.scan_interval:
+            return cached[1]
+
+        kind_dir = os.path.join(self.root, key[0], kind)
+        versions = []
+        if os.path.isdir(kind_dir):
+            versions = sorted(
+                (name for name in os.listdir(kind_dir)
+                 if os.path.isfile(os.path.join(kind_dir, name, SCHEMA_FILE))),
+                key=_version_key,
+            )
+        self._scans[key] = (time.time(), versions)
+        return versions
+
+    def resolve(self, symbol: str, kind: str, version: Optional[str] = None) -> ModelSpec:
+        """Picks the model for a symbol: its own, else DEFAULT, else the legacy SBI artifacts."""
+        if kind not in LEGACY_MODELS:
+            raise ValueError(f"Unknown model kind '{kind}'. Choose from {sorted(LEGACY_MODELS)}.")
+
+        for candidate in (symbol.upper(), DEFAULT_SYMBOL):
+            versions = self.versions(candidate, kind)
+            if version is not None:
+                versions = [v for v in versions if v == version]
+            if versions:
+                chosen = versions[-1]
+                path = os.path.join(self.root, candidate, kind, chosen)
+                with open(os.path.join(path, SCHEMA_FILE), "r", encoding="utf-8") as f:
+                    schema = json.load(f)
+                return ModelSpec(candidate, kind, chosen, path, schema)
+
+        if version not in (None, "legacy"):
+            raise KeyError(f"No {kind} model version '{version}' for {symbol}")
+        return ModelSpec(DEFAULT_SYMBOL, kind, "legacy", LEGACY_DIR, LEGACY_MODELS[kind])
+
+    # -------- loading --------
+    def _size(self, spec: ModelSpec) -> int:
+        size = 0
+        for field in ("model", "scaler", "direct_model"):
+            name = spec.schema.get(field)
+            if name and os.path.exists(os.path.join(spec.path, name)):
+                size += os.path.getsize(os.path.join(spec.path, name))
+        return size
+
+    def _load(self, spec: ModelSpec) -> LoadedModel:
+        started = time.time()
+        scaler = joblib.load(os.path.join(spec.path, spec.schema["scaler"]))
+        features = _schema_features(spec.kind, spec.schema)
+
+        # A model must come with the scaler it was trained with
+        n_scaled = getattr(scaler, "n_features_in_", len(features))
+        if n_scaled != len(features):
+            raise ValueError(
+                f"{spec.symbol}/{spec.kind}/{spec.version}: scaler expects {n_scaled} features, "
+                f"schema lists {len(features)}"
+            )
+
+        if spec.kind == "seq2seq":
+            model = _load_seq2seq(spec)
+        else:
+            model = _load_xgb(spec, scaler)
+
+        self.loads += 1
+        print(f"📦 Loaded {spec.kind} model {spec.symbol}/{spec.version} in {time.time() - started:.2f}s")
+        return LoadedModel(spec, model, scaler, features, self._size(spec))
+
+    def _evict(self, keep: tuple):
+        used = sum(m.size_bytes for m in self._cache.values())
+        for key in list(self._cache):
+            if used <= self.budget_bytes:
+                break
+            if key == keep:
+                continue
+            used -= self._cache.pop(key).size_bytes
+            self.evictions += 1
+            print(f"♻️ Evicted model {key} from memory")
+
+    def get(self, symbol: str, kind: str, version: Optional[str] = None) -> LoadedModel:
+        """Returns the loaded model for a symbol, loading it on first use."""
+        spec = self.resolve(symbol, kind, version)
+        key = (spec.symbol, spec.kind, spec.version)
+
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # Concurrent requests for the same model wait for one load
+        with load_lock:
+            with self._lock:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    return self._cache[key]
+            loaded = self._load(spec)
+            with self._lock:
+                self._cache[key] = loaded
+                self._evict(keep=key)
+            return loaded
+
+    def status(self) -> dict:
+        with self._lock:
+            warm = [
+                {"symbol": s, "kind": k, "version": v, "size_bytes": m.size_bytes}
+                for (s, k, v), m in self._cache.items()
+            ]
+        return {
+            "warm": warm,
+            "used_bytes": sum(m["size_bytes"] for m in warm),
+            "budget_bytes": self.budget_bytes,
+            "loads": self.loads,
+            "evictions": self.evictions,
+        }
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry() -> ModelRegistry:
+    """Returns the process-wide model registry."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelRegistry()
+    return _registry
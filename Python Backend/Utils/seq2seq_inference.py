@@ -0,0 +1,57 @@
+import numpy as np
+import tensorflow as tf
+
+
+class Seq2SeqEngine:
+    """
+    Compiled inference path for the seq2seq LSTM forecaster.
+
+    model.predict() builds a tf.data pipeline and a fresh execution context on
+    every call, which dominates the cost for the small batches a forecast
+    needs. Here the model is traced once into a tf.function with a fixed input
+    signature, and the whole autoregressive rollout (predict HORIZON bars,
+    slide the window, repeat) runs inside a single graph call. The layers and
+    weights are the model's own, so the numbers match model.predict.
+    """
+
+    def __init__(self, model: tf.keras.Model):
+        self.model = model
+        _, self.window, self.n_features = model.input_shape
+        self.horizon = model.output_shape[1]
+
+        seq_spec = tf.TensorSpec([None, self.window, self.n_features], tf.float32)
+        self._predict = tf.function(self._forward, input_signature=[seq_spec])
+        self._rollout = tf.function(
+            self._rollout_graph, input_signature=[seq_spec, tf.TensorSpec([], tf.int32)]
+        )
+
+    def _forward(self, seq):
+        return self.model(seq, training=False)
+
+    def _rollout_graph(self, seq, steps):
+        preds = tf.TensorArray(tf.float32, size=steps)
+        for i in tf.range(steps):
+            pred = self.model(seq, training=False)  # (N, horizon, 4)
+            preds = preds.write(i, pred)
+
+            # extend window with predictions (keep last volume repeated)
+            last_vol = tf.repeat(seq[:, -1:, 4:5], self.horizon, axis=1)
+            seq = tf.concat([seq[:, self.horizon:], tf.concat([pred, last_vol], axis=2)], axis=1)
+
+        # (steps, N, horizon, 4) -> (N, steps * horizon, 4)
+        stacked = tf.transpose(preds.stack(), [1, 0, 2, 3])
+        return tf.reshape(stacked, [tf.shape(seq)[0], steps * self.horizon, -1])
+
+    def predict(self, seq: np.ndarray) -> np.ndarray:
+        """One forward pass. seq: (N, window, n_features) scaled inputs."""
+        return self._predict(tf.convert_to_tensor(seq, tf.float32)).numpy()
+
+    def rollout(self, seq: np.ndarray, steps: int) -> np.ndarray:
+        """Runs `steps` autoregressive predictions. Returns (N, steps * horizon, 4)."""
+        return self._rollout(tf.convert_to_tensor(seq, tf.float32), tf.constant(steps, tf.int32)).numpy()
+
+    def warmup(self):
+        """Traces both graphs up front so the first request doesn't pay for it."""
+        dummy = np.zeros((1, self.window, self.n_features), dtype=np.float32)
+        self.predict(dummy)
+        self.rollout(dummy, 1)
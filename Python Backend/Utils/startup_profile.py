@@ -0,0 +1,70 @@
+import sys
+import time
+import importlib
+import threading
+from contextlib import contextmanager
+
+# Wall-clock start of the process as seen by the first import of this module
+PROCESS_START = time.time()
+
+_lock = threading.Lock()
+_phases = []       # [{"name", "stage", "seconds", "ok", "error"}], in completion order
+_ready_at = None
+_timed_imports = set()
+
+
+@contextmanager
+def timed(name: str, stage: str = "import"):
+    """
+    Records how long a block takes under `stage` ("import", "warmup" or
+    "first_use"). Failures are recorded and re-raised.
+    """
+    started = time.perf_counter()
+    entry = {"name": name, "stage": stage, "ok": True, "error": None}
+    try:
+        yield
+    except Exception as e:
+        entry["ok"], entry["error"] = False, str(e)
+        raise
+    finally:
+        entry["seconds"] = round(time.perf_counter() - started, 4)
+        with _lock:
+            _phases.append(entry)
+        status = "✅" if entry["ok"] else "❌"
+        print(f"{status} [{stage}] {name}: {entry['seconds']:.2f}s")
+
+
+def mark_ready():
+    """Marks the moment the server started accepting requests."""
+    global _ready_at
+    _ready_at = time.time()
+    print(f"🚀 Ready to serve {_ready_at - PROCESS_START:.2f}s after start")
+
+
+def report() -> dict:
+    with _lock:
+        phases = list(_phases)
+    totals = {}
+    for phase in phases:
+        totals[phase["stage"]] = round(totals.get(phase["stage"], 0.0) + phase["seconds"], 4)
+    return {
+        "ready_after_seconds": round(_ready_at - PROCESS_START, 4) if _ready_at else None,
+        "uptime_seconds": round(time.time() - PROCESS_START, 1),
+        "totals": totals,
+        "phases": phases,
+    }
+
+
+def lazy_import(module: str, stage: str = "first_use"):
+    """
+    Imports a module on first use, recording how long the first import took.
+    Always goes through importlib, so a caller racing the warm-up thread waits
+    on the module's import lock instead of getting a half-initialized module.
+    """
+    with _lock:
+        first = module not in _timed_imports and module not in sys.modules
+        _timed_imports.add(module)
+    if not first:
+        return importlib.import_module(module)
+    with timed(module, stage):
+        return importlib.import_module(module)
@@ -0,0 +1,130 @@
+"""
+xgb_forecaster.py
+
+Multi-step close forecasts from the XGBoost close model.
+
+Two modes:
+- recursive: one prediction per minute, each fed back as lag_close_1 for the
+  next step. Raw closes live in a preallocated buffer that is written
+  backwards, so the 60 lags are always a contiguous view; only that slice is
+  rescaled into a reused feature row before booster.inplace_predict.
+- direct: a second model trained with the horizon as an extra feature
+  predicts every step from the same last row, so a whole forecast is one
+  batched inplace_predict call.
+
+Usage:
+    forecaster = XGBForecaster(model, scaler, direct_model=direct_model)
+    preds = forecaster.forecast(last_features, n_steps=390)
+"""
+
+import numpy as np
+import xgboost as xgb
+
+# -------- CONFIG --------
+WINDOW = 60
+STATIC_FEATURES = ["open", "high", "low", "close", "volume", "RSI", "MACD", "MACD_signal", "MACD_hist"]
+FEATURE_COLS = STATIC_FEATURES + [f"lag_close_{i}" for i in range(1, WINDOW + 1)]
+# Booster attribute holding the longest horizon a direct model was trained for
+HORIZON_ATTR = "horizon"
+
+
+def _booster(model) -> xgb.Booster:
+    return model.get_booster() if hasattr(model, "get_booster") else model
+
+
+def make_direct_training_set(X_scaled: np.ndarray, close: np.ndarray, horizon: int,
+                             samples_per_row: int = 4, seed: int = 42):
+    """
+    Builds training data for the direct model: each feature row is paired with
+    `samples_per_row` random horizons h in 1..horizon (appended as a column)
+    and the close h bars later as the target.
+    """
+    rng = np.random.default_rng(seed)
+    n_rows = len(X_scaled)
+    rows = np.repeat(np.arange(n_rows), samples_per_row)
+    steps = rng.integers(1, horizon + 1, size=len(rows))
+    valid = rows + steps < n_rows
+    rows, steps = rows[valid], steps[valid]
+
+    X = np.hstack([X_scaled[rows], steps[:, None].astype(X_scaled.dtype)])
+    y = np.asarray(close)[rows + steps]
+    return X, y
+
+
+class XGBForecaster:
+    """Recursive and direct multi-step forecasts over unscaled feature rows."""
+
+    def __init__(self, model, scaler, window: int = WINDOW, direct_model=None):
+        self.booster = _booster(model)
+        self.window = window
+        self.n_features = len(scaler.scale_)
+        self.n_static = self.n_features - window
+
+        # MinMaxScaler.transform is x * scale_ + min_; applied by hand so only
+        # the lag slice has to be rescaled between steps
+        self.scale = np.asarray(scaler.scale_, dtype=np.float64)
+        self.offset = np.asarray(scaler.min_, dtype=np.float64)
+        self.clip = scaler.feature_range if getattr(scaler, "clip", False) else None
+
+        self.direct = _booster(direct_model) if direct_model is not None else None
+        self.direct_horizon = 0
+        if self.direct is not None:
+            self.direct_horizon = int(self.direct.attr(HORIZON_ATTR) or 0)
+
+    def _scale(self, values: np.ndarray, cols: slice, out: np.ndarray):
+        np.multiply(values, self.scale[cols], out=out)
+        out += self.offset[cols]
+        if self.clip is not None:
+            np.clip(out, self.clip[0], self.clip[1], out=out)
+
+    def recursive(self, features: np.ndarray, n_steps: int) -> np.ndarray:
+        """
+        features: one unscaled row in FEATURE_COLS order.
+        Returns n_steps predicted closes. Static features stay fixed; each
+        prediction becomes lag_close_1 of the next step.
+        """
+        features = np.asarray(features, dtype=np.float64).ravel()
+        ns, window = self.n_static, self.window
+
+        row = np.empty((1, self.n_features), dtype=np.float32)
+        static = np.empty(ns)
+        self._scale(features[:ns], slice(0, ns), static)
+        row[0, :ns] = static
+
+        # Newest close sits at the lowest index; writing predictions backwards
+        # keeps lags[pos:pos + window] == [lag_1, ..., lag_window]
+        lags = np.empty(n_steps + window)
+        lags[n_steps:] = features[ns:]
+        scaled_lags = np.empty(window)
+        lag_cols = slice(ns, self.n_features)
+
+        preds = np.empty(n_steps)
+        for step in range(n_steps):
+            pos = n_steps - step
+            self._scale(lags[pos:pos + window], lag_cols, scaled_lags)
+            row[0, ns:] = scaled_lags
+            y = float(self.booster.inplace_predict(row)[0])
+            preds[step] = y
+            lags[pos - 1] = y
+        return preds
+
+    def direct_forecast(self, features: np.ndarray, n_steps: int) -> np.ndarray:
+        """All n_steps closes from the direct model in one batched call."""
+        if self.direct is None:
+            raise ValueError("No direct multi-horizon model loaded")
+        if n_steps > self.direct_horizon:
+            raise ValueError(f"Direct model covers {self.direct_horizon} steps, asked for {n_steps}")
+
+        scaled = np.empty(self.n_features)
+        self._scale(np.asarray(features, dtype=np.float64).ravel(), slice(None), scaled)
+
+        X = np.empty((n_steps, self.n_features + 1), dtype=np.float32)
+        X[:, :-1] = scaled
+        X[:, -1] = np.arange(1, n_steps + 1)
+        return self.direct.inplace_predict(X).astype(np.float64)
+
+    def forecast(self, features: np.ndarray, n_steps: int, mode: str = "auto") -> np.ndarray:
+        """mode: "recursive", "direct", or "auto" (direct when it covers n_steps)."""
+        if mode == "direct" or (mode == "auto" and 0 < n_steps <= self.direct_horizon):
+            return self.direct_forecast(features, n_steps)
+        return self.recursive(features, n_steps)
@@ -1,54 +1,52 @@
-from fastapi import FastAPI, WebSocket, HTTPException, WebSocketDisconnect, APIRouter, Query
-from pydantic import BaseModel
-from typing import List, Optional
-from dags.Features.tools.candlestick_tool import AngelOneCandlestickTool
-from dags.Features.tools.yfinance_tool import YFinanceFundamentalsTool
-from dags.Features.tools.stock_news_tool import IndianStockNewsTool
-from fastapi.middleware.cors import CORSMiddleware
-from websocket_manager import ConnectionManager
-import json
-import httpx
-import csv
-import io
-import asyncio
-import requests
-import pandas as pd
-from io import StringIO
-from starlette.websockets import WebSocketState
-import datetime
-from main import run
-from fastapi.responses import FileResponse
-from main import run
-from tensorflow.keras.models import load_model
-import numpy as np
-import joblib
-import traceback
-import xgboost as xgb
-from ta.momentum import RSIIndicator
-from ta.trend import MACD
-import chromadb
-from groq import Groq
-from dotenv import load_dotenv
-load_dotenv()
-
-# ---------------- RAG imports ----------------
-from pydantic import BaseModel
-from fastapi import HTTPException
-from dags.Features.RAG import  query_interface as rag_module
-
+from Utils.startup_profile import timed, mark_ready, report as startup_report, lazy_import
+
+with timed("web stack"):
+    import os
+    import json
+    import asyncio
+    import traceback
+    import numpy as np
+    import pandas as pd
+    from typing import List, Optional
+    from pydantic import BaseModel
+    from fastapi import FastAPI, WebSocket, HTTPException, WebSocketDisconnect, Query
+    from fastapi.middleware.cors import CORSMiddleware
+    from fastapi.responses import StreamingResponse
+    from starlette.websockets import WebSocketState
+    from dotenv import load_dotenv
+    load_dotenv()
+
+with timed("app modules"):
+    from websocket_manager import ConnectionManager, MODES as WS_MODES
+    from Utils.blocking import run_blocking, shutdown_blocking_pool
+    from Utils.model_registry import get_model_registry, LoadedModel, DEFAULT_SYMBOL
+    from report_jobs import get_report_queue, shutdown_report_queue, QueueFull, REPORT_JOB_TIMEOUT
+
+
+# ---------------- Lazy subsystems ----------------
+# CrewAI tools, the report crew and the RAG stack each take seconds to import,
+# so they load on first use (or in the background warm-up below) instead of
+# holding up startup.
+def candlestick_module():
+    return lazy_import("dags.Features.tools.candlestick_tool")
+
+def yfinance_module():
+    return lazy_import("dags.Features.tools.yfinance_tool")
+
+def news_module():
+    return lazy_import("dags.Features.tools.stock_news_tool")
+
+def crew_module():
+    return lazy_import("main")
+
+def rag_module():
+    return lazy_import("dags.Features.RAG.query_interface")
 
 
 app = FastAPI()
 
-WINDOW = 60
-HORIZON = 10
-FEATURES = ["open", "high", "low", "close", "volume"]
-
-model = load_model("Utils/sbi_seq2seq_model.h5")
-scaler = joblib.load("Utils/sbi_scaler.pkl") 
-
-xgb_model = joblib.load("Utils/sbi_xgboost_close_model.pkl")
-scaler = joblib.load("Utils/sbi_xgb_scaler.pkl")
+# Forecast models are looked up per symbol and loaded on first use
+model_registry = get_model_registry()
 
 
 
@@ -63,7 +61,116 @@ app.add_middleware(
 
 
 
-manager = ConnectionManager()
+manager = ConnectionManager(poll_interval=60)
+
+# ---------------- Startup ----------------
+# Comma-separated subsystems to load in the background once the server is up
+# ("tools", "models", "rag", "crew"); empty disables warm-up
+STARTUP_WARMUP = [c.strip() for c in os.getenv("STARTUP_WARMUP", "tools,models,rag,crew").split(",") if c.strip()]
+
+def _warm_models():
+    for kind in ("seq2seq", "xgb"):
+        model_registry.get(DEFAULT_SYMBOL, kind)
+
+WARMUP_STEPS = {
+    "tools": lambda: (candlestick_module(), yfinance_module(), news_module()),
+    "models": _warm_models,
+    # Loads the shared embedder too, so the first question doesn't pay for it
+    "rag": lambda: (rag_module().get_router().companies(), rag_module().embed_query("warm up")),
+    "crew": crew_module,
+}
+
+_warmup_state = {}
+
+
+def _warm(name: str):
+    _warmup_state[name] = "running"
+    try:
+        with timed(name, stage="warmup"):
+            WARMUP_STEPS[name]()
+        _warmup_state[name] = "done"
+    except Exception as e:
+        # A subsystem that can't warm up (e.g. missing API key) only fails its own endpoints
+        _warmup_state[name] = f"failed: {e}"
+
+
+async def warm_up():
+    for name in STARTUP_WARMUP:
+        if name not in WARMUP_STEPS:
+            print(f"⚠️ Unknown warm-up step '{name}', skipping")
+            continue
+        await run_blocking(_warm, name)
+
+
+@app.on_event("startup")
+async def start_warm_up():
+    mark_ready()
+    if STARTUP_WARMUP:
+        asyncio.create_task(warm_up())
+
+
+@app.get("/health/startup")
+def startup_health():
+    """Where startup time went: import phases, background warm-up and first-use loads."""
+    return {**startup_report(), "warmup": _warmup_state}
+
+
+@app.on_event("shutdown")
+async def shutdown_pools():
+    shutdown_blocking_pool()
+    shutdown_report_queue()
+
+
+def store_candle_records(df: pd.DataFrame) -> list:
+    """
+    Turns candle store rows into the records the socket has always sent:
+    string values with UTC "%Y-%m-%dT%H:%M:%SZ" timestamps.
+    """
+    if df.empty:
+        return []
+    utc = df["timestamp"].dt.tz_convert("UTC").dt.tz_localize(None).to_numpy(dtype="datetime64[s]")
+    records = df.astype(str)
+    records["timestamp"] = np.char.add(np.datetime_as_string(utc, unit="s"), "Z")
+    columns = list(records.columns)
+    return [dict(zip(columns, row)) for row in records.itertuples(index=False, name=None)]
+
+
+def candle_fetcher(params: dict):
+    """
+    Builds the upstream poll for one candlestick topic, shared by all its subscribers.
+    Each tick syncs the local candle store and reads back only the bars since the
+    previous tick (the last one again, as it may still be forming); a tick where the
+    sync found nothing new reads nothing. The Cloudinary CSV upload runs in the background.
+    """
+    since = None
+
+    async def fetch() -> dict:
+        nonlocal since
+        candlesticks = await run_blocking(candlestick_module)
+        tool = candlesticks.AngelOneCandlestickTool()
+        try:
+            result = await run_blocking(
+                tool.sync,
+                company_name=params["company_name"],
+                stock_name=params["stock_name"],
+                exchange=params["exchange"],
+                interval=params["interval"],
+                upload="background",
+            )
+        except candlesticks.CandleFetchError as e:
+            return {"error": str(e)}
+
+        if since is not None and result.status == "unchanged":
+            return {"data": []}
+        store = candlesticks.get_candle_store()
+        df = await run_blocking(store.read, result.symbol, result.interval, start=since)
+        if not df.empty:
+            since = df["timestamp"].iloc[-1]
+        return {"data": store_candle_records(df)}
+
+    return fetch
+
+
 @app.websocket("/ws/candlestick")
 async def websocket_endpoint(websocket: WebSocket):
     await manager.connect(websocket)
@@ -79,56 +186,25 @@ async def websocket_endpoint(websocket: WebSocket):
                 await websocket.send_json({"error": f"Missing required field: {field}"})
                 return
 
-        tool = AngelOneCandlestickTool()
+        mode = params.get("mode", "full")
+        if mode not in WS_MODES:
+            await websocket.send_json({"error": f"Invalid mode '{mode}'. Choose from {WS_MODES}."})
+            return
+
+        # Clients watching the same symbol share one upstream poller
+        topic = (params["stock_name"].upper(), params["exchange"].upper(), params["interval"].upper())
+        await manager.subscribe(websocket, topic, candle_fetcher(params), mode=mode)
 
+        # Updates are pushed by the topic poller; here we only handle client requests
+        # such as {"action": "resync"} after a delta client notices a gap in "seq".
         while websocket.application_state == WebSocketState.CONNECTED:
+            message = await websocket.receive_text()
             try:
-                result = tool._run(
-                    company_name=params["company_name"],
-                    stock_name=params["stock_name"],
-                    exchange=params["exchange"],
-                    interval=params["interval"]
-                )
-
-                csv_url = result if isinstance(result, str) else result.get("message")
-                if not csv_url or not csv_url.startswith("http"):
-                    await websocket.send_json({"error": f"Invalid CSV URL: {csv_url}"})
-                    break
-
-                async with httpx.AsyncClient() as client:
-                    response = await client.get(csv_url)
-                    decoded = response.content.decode("utf-8")
-                    reader = csv.DictReader(io.StringIO(decoded))
-                    records = []
-
-                    for row in reader:
-                        try:
-                            ts = row.get("timestamp") or row.get("date")
-                            if ts.endswith("Z"):
-                                dt = datetime.datetime.strptime(ts, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=datetime.timezone.utc)
-                            else:
-                                dt = datetime.datetime.fromisoformat(ts).astimezone(datetime.timezone.utc)
-
-                            row["timestamp"] = dt.strftime("%Y-%m-%dT%H:%M:%SZ")
-                            records.append(row)
-                        except Exception as e:
-                            print(f"Error normalizing row: {e}")
-
-                if websocket.application_state == WebSocketState.CONNECTED:
-                    await websocket.send_json({"data": records})
-                else:
-                    print("WebSocket is disconnected before sending data.")
-                    break
-
-                await asyncio.sleep(60)
-
-            except Exception as e:
-                print("Loop error:", e)
-                if websocket.application_state == WebSocketState.CONNECTED:
-                    await websocket.send_json({"error": str(e)})
-                else:
-                    print("WebSocket is disconnected. Exiting loop.")
-                    break
+                action = json.loads(message).get("action")
+            except (ValueError, AttributeError):
+                continue
+            if action == "resync":
+                await manager.resync(websocket, topic)
 
     except WebSocketDisconnect:
         print("WebSocket client disconnected.")
@@ -155,15 +231,6 @@ class Candle(BaseModel):
     close: float
     volume: float
     
-class ForecastRequest(BaseModel):
-    company_name: str
-    stock_name: str
-    exchange: str
-    interval: str   # e.g. "5m", "15m", "1d"
-    lookback: int   # number of candles to fetch for forecasting
-    horizon: int  # how many minutes to predict
-
-
 class RatioItem(BaseModel):
     Metric: str
     Value: str
@@ -186,24 +253,80 @@ def generate_report(
     company_name: str = Query(..., description="Company name"),
     stock_ticker: str = Query(..., description="Stock ticker symbol, e.g., RELIANCE.NSE")
 ):
+    """Blocking variant kept for existing clients; runs through the report job queue."""
     try:
-        cloud_url = run(company_name, stock_ticker)
+        job, _ = get_report_queue().submit(company_name, stock_ticker)
+        job.wait(REPORT_JOB_TIMEOUT)
+        job.expired()
+        if job.status != "succeeded":
+            return {"status": "error", "message": job.error or f"Report job {job.status}", "job_id": job.id}
         return {
             "status": "success",
             "company": company_name,
             "stock_ticker": stock_ticker,
-            "report_url": cloud_url
+            "report_url": job.report_url
         }
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
 
+class ReportJobRequest(BaseModel):
+    company_name: str
+    stock_ticker: str   # e.g. RELIANCE.NSE
+
+
+# Seconds between progress checks on an event stream
+REPORT_EVENT_POLL = 1.0
+
+
+@app.post("/reports/jobs", status_code=202)
+def create_report_job(request: ReportJobRequest):
+    """Queues a report and returns its job id right away. Same-day duplicates share one job."""
+    try:
+        job, is_new = get_report_queue().submit(request.company_name, request.stock_ticker)
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return {**job.to_dict(), "deduplicated": not is_new and not job.cached}
+
+
+def _get_report_job(job_id: str):
+    job = get_report_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown report job {job_id}")
+    return job
+
+
+@app.get("/reports/jobs/{job_id}")
+def get_report_job(job_id: str):
+    return _get_report_job(job_id).to_dict()
+
+
+@app.get("/reports/jobs/{job_id}/events")
+async def stream_report_job(job_id: str):
+    """Server-sent events: one event per pipeline step, ending with the job's final status."""
+    job = _get_report_job(job_id)
+
+    async def events():
+        seq = 0
+        while True:
+            done = job.wait(0)
+            for event in job.events_since(seq):
+                seq = event["seq"] + 1
+                yield f"event: {event['stage']}\ndata: {json.dumps(event)}\n\n"
+            if done:
+                break
+            job.expired()
+            await asyncio.sleep(REPORT_EVENT_POLL)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
 @app.post("/candlesticks/")
 async def add_candlestick(request: StockRequest):
     print("Received:", request)
     try:
-        tool = AngelOneCandlestickTool()
-        result = tool._run(
+        tool = (await run_blocking(candlestick_module)).AngelOneCandlestickTool()
+        result = await tool._arun(
             company_name=request.company_name,
             stock_name=request.stock_name,
             exchange=request.exchange,
@@ -217,7 +340,7 @@ async def add_candlestick(request: StockRequest):
 @app.post("/balance-sheet-and-ratios/")
 async def add_balance_sheet(symbol: str):
     try:
-        tool = YFinanceFundamentalsTool()
+        tool = (await run_blocking(yfinance_module)).YFinanceFundamentalsTool()
         result = await tool._arun(symbol)
         urls = result.strip().split("\n")
 
@@ -233,46 +356,60 @@ async def add_balance_sheet(symbol: str):
 @app.get("/news/{company_name}")
 def get_news(company_name: str):
     try:
-        tool = IndianStockNewsTool()
+        tool = news_module().IndianStockNewsTool()
         result = tool._run(company_name)
         return {"result": result}
     except Exception as e:
         return {"error": str(e)}
 
-def make_forecast(candles: list[dict], n_minutes: int):
-    df = pd.DataFrame(candles)
-    df = df.sort_values("timestamp")
+def model_info(loaded: LoadedModel) -> dict:
+    return {"symbol": loaded.spec.symbol, "kind": loaded.spec.kind, "version": loaded.spec.version}
+
 
-    # scale features
-    seq = scaler.transform(df[FEATURES].values)[-WINDOW:]
+def make_forecast(candles, n_minutes: int, loaded: LoadedModel):
+    """candles: OHLCV records or DataFrame, oldest first."""
+    return make_forecast_batch([candles], n_minutes, loaded)[0]
 
-    last_seq = seq.copy()
-    preds = []
 
-    for _ in range(n_minutes // HORIZON + 1):
-        pred = model.predict(last_seq.reshape(1, WINDOW, len(FEATURES)), verbose=0)[0]  # (horizon, 4)
-        preds.append(pred)
+def make_forecast_batch(candle_sets: list, n_minutes: int, loaded: LoadedModel) -> list:
+    """
+    Forecasts several symbols with one seq2seq model. Their last window bars
+    are stacked into one (N, window, features) batch, so each autoregressive
+    step is a single model call for all symbols. Returns one list of forecast
+    records per input, in order.
+    """
+    engine, scaler = loaded.model, loaded.scaler
+    windows, last_timestamps = [], []
+    for candles in candle_sets:
+        df = pd.DataFrame(candles)
+        df = df.sort_values("timestamp")
+        if len(df) < engine.window:
+            raise ValueError(f"Need at least {engine.window} candles to forecast, got {len(df)}")
 
-        # extend window with predictions (keep last volume repeated)
-        last_vol = last_seq[-1, 4]
-        step_concat = np.hstack([pred, np.full((pred.shape[0], 1), last_vol)])
-        last_seq = np.vstack([last_seq[HORIZON:], step_concat])
+        # scale features
+        windows.append(scaler.transform(df[loaded.features].values)[-engine.window:])
+        last_timestamps.append(pd.to_datetime(df["timestamp"].iloc[-1]))
 
-    preds = np.vstack(preds)[:n_minutes]
+    last_seq = np.stack(windows)  # (N, window, features)
 
-    # inverse transform
-    preds_inv = scaler.inverse_transform(
-        np.hstack([preds, np.zeros((preds.shape[0], 1))])
-    )[:, :4]
+    # all autoregressive steps run inside one compiled graph call
+    preds = engine.rollout(last_seq, n_minutes // engine.horizon + 1)[:, :n_minutes]
 
-    # build timestamps
-    last_ts = pd.to_datetime(df["timestamp"].iloc[-1])
-    future_idx = pd.date_range(start=last_ts, periods=n_minutes + 1, freq="T")[1:]
+    forecasts = []
+    for symbol_preds, last_ts in zip(preds, last_timestamps):
+        # inverse transform
+        preds_inv = scaler.inverse_transform(
+            np.hstack([symbol_preds, np.zeros((symbol_preds.shape[0], 1))])
+        )[:, :4]
 
-    forecast_df = pd.DataFrame(preds_inv, columns=["open","high","low","close"])
-    forecast_df.insert(0, "timestamp", future_idx)
+        # build timestamps
+        future_idx = pd.date_range(start=last_ts, periods=n_minutes + 1, freq="T")[1:]
 
-    return forecast_df.to_dict(orient="records")
+        forecast_df = pd.DataFrame(preds_inv, columns=["open","high","low","close"])
+        forecast_df.insert(0, "timestamp", future_idx)
+        forecasts.append(forecast_df.to_dict(orient="records"))
+
+    return forecasts
 
 class ForecastRequest(BaseModel):
     company_name: str
@@ -281,66 +418,150 @@ class ForecastRequest(BaseModel):
     interval: Optional[str] = "ONE_MINUTE"   # default interval = 1 minute
     horizon: Optional[int] = 30           # default horizon = 30 minutes
 
-@app.post("/forecast/")
-async def forecast(request: ForecastRequest):
+# Bars read from the candle store per forecast; enough for the 60-bar window plus indicator warm-up
+FORECAST_LOOKBACK = 500
+
+
+async def load_forecast_candles(request: ForecastRequest) -> pd.DataFrame:
+    """Updates the symbol's candles and returns the latest OHLCV bars straight from the local store."""
+    candlesticks = await run_blocking(candlestick_module)
+    tool = candlesticks.AngelOneCandlestickTool()
     try:
-        # Step 1: Get OHLCV CSV link
-        tool = AngelOneCandlestickTool()
-        result = tool._run(
+        df = await run_blocking(
+            tool.fetch_dataframe,
             company_name=request.company_name,
             stock_name=request.stock_name,
             exchange=request.exchange,
-            interval=request.interval
+            interval=request.interval,
+            lookback=FORECAST_LOOKBACK,
+            upload="background",
         )
+    except candlesticks.CandleFetchError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if df.empty:
+        raise HTTPException(status_code=400, detail=f"No candles stored for {request.stock_name}")
+    return df[["timestamp", "open", "high", "low", "close", "volume"]]
 
-        csv_url = result if isinstance(result, str) else result.get("message")
-        if not csv_url or not csv_url.startswith("http"):
-            raise HTTPException(status_code=400, detail=f"Invalid CSV URL: {csv_url}")
-
-        # Step 2: Download and parse candles
-        response = requests.get(csv_url)
-        decoded = response.content.decode("utf-8")
-        df = pd.read_csv(StringIO(decoded))
-
-        # Ensure correct order
-        df = df.sort_values("timestamp")
 
-        # Step 3: Prepare candles for model
-        candles = df[["timestamp", "open", "high", "low", "close", "volume"]].to_dict(orient="records")
+@app.post("/forecast/")
+async def forecast(request: ForecastRequest):
+    try:
+        # Step 1: Bring the local candle store up to date and read the latest bars from it
+        # (the Cloudinary upload of the CSV export happens in the background)
+        candles = await load_forecast_candles(request)
 
-        # Step 4: Call forecast helper
-        predictions = make_forecast(candles, n_minutes=request.horizon)
+        # Step 2: Pick this symbol's model (loaded on first use) and call forecast helper
+        loaded = await run_blocking(model_registry.get, request.stock_name, "seq2seq")
+        predictions = await run_blocking(make_forecast, candles, request.horizon, loaded)
 
         return {
             "company": request.company_name,
             "stock": request.stock_name,
             "exchange": request.exchange,
             "interval": request.interval,
+            "model": model_info(loaded),
             "forecast": predictions
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         print("Forecast error:", str(e))
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
 
 
-# ------------------ Helper ------------------
-def load_xgb_model(path="Utils/xgb_model.json"):
-    model = xgb.XGBRegressor()
-    model.load_model(path)
-    return model
+class BatchSymbol(BaseModel):
+    company_name: str
+    stock_name: str
+
+
+class BatchForecastRequest(BaseModel):
+    symbols: List[BatchSymbol]
+    exchange: str = "NSE"
+    interval: Optional[str] = "ONE_MINUTE"
+    horizon: Optional[int] = 30
 
-xgb_model = load_xgb_model()
 
+MAX_BATCH_SYMBOLS = 100
 
 
-# Load model + scaler
-xgb_model = xgb.XGBRegressor()
-xgb_model.load_model("Utils/xgb_model.json")
-scaler = joblib.load("Utils/sbi_xgb_scaler.pkl")
+@app.post("/forecast/batch/")
+async def forecast_batch(request: BatchForecastRequest):
+    """Forecasts a watchlist in one call: candles are fetched concurrently and inference is batched."""
+    if not request.symbols:
+        raise HTTPException(status_code=400, detail="No symbols given")
+    if len(request.symbols) > MAX_BATCH_SYMBOLS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SYMBOLS} symbols per batch")
+
+    try:
+        # Step 1: Fetch every symbol's candles concurrently
+        requests_ = [
+            ForecastRequest(
+                company_name=item.company_name,
+                stock_name=item.stock_name,
+                exchange=request.exchange,
+                interval=request.interval,
+                horizon=request.horizon,
+            )
+            for item in request.symbols
+        ]
+        results = await asyncio.gather(
+            *(load_forecast_candles(r) for r in requests_), return_exceptions=True
+        )
+
+        # Step 2: Group symbols that share a model
+        errors, groups = {}, {}
+        for item, result in zip(request.symbols, results):
+            if isinstance(result, HTTPException):
+                errors[item.stock_name] = result.detail
+                continue
+            if isinstance(result, Exception):
+                errors[item.stock_name] = str(result)
+                continue
+            try:
+                loaded = await run_blocking(model_registry.get, item.stock_name, "seq2seq")
+            except Exception as e:
+                errors[item.stock_name] = f"Model load failed: {e}"
+                continue
+            if len(result) < loaded.model.window:
+                errors[item.stock_name] = f"Need at least {loaded.model.window} candles to forecast, got {len(result)}"
+                continue
+            key = (loaded.spec.symbol, loaded.spec.version)
+            groups.setdefault(key, (loaded, []))[1].append((item, result))
+
+        # Step 3: One batched forecast per model
+        forecasts, models = {}, {}
+        for loaded, ready in groups.values():
+            predictions = await run_blocking(
+                make_forecast_batch, [candles for _, candles in ready], request.horizon, loaded
+            )
+            for (item, _), preds in zip(ready, predictions):
+                forecasts[item.stock_name] = preds
+                models[item.stock_name] = model_info(loaded)
+
+        return {
+            "exchange": request.exchange,
+            "interval": request.interval,
+            "forecasts": forecasts,
+            "models": models,
+            "errors": errors,
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print("Batch forecast error:", str(e))
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
+
+
+# ------------------ Helper ------------------
+def make_xgb_forecast(candles, n_minutes: int, loaded: LoadedModel):
+    """candles: OHLCV records or DataFrame, oldest first."""
+    from ta.momentum import RSIIndicator
+    from ta.trend import MACD
 
-def make_xgb_forecast(candles: list, n_minutes: int = 60):
     # Convert to DataFrame
     df = pd.DataFrame(candles)
 
@@ -359,48 +580,20 @@ def make_xgb_forecast(candles: list, n_minutes: int = 60):
     df["rolling_mean"] = df["close"].rolling(5).mean().bfill()
     df["rolling_std"] = df["close"].rolling(5).std().bfill()
 
-    window = 60
+    forecaster = loaded.model
+    window = forecaster.window
     for lag in range(1, window + 1):
         df[f"lag_close_{lag}"] = df["close"].shift(lag)
 
     df = df.dropna().reset_index(drop=True)
 
-    # Feature columns (must match training)
-    feature_cols = (
-        ["open", "high", "low", "close", "volume", "RSI", "MACD", "MACD_signal", "MACD_hist"]
-        + [f"lag_close_{i}" for i in range(1, window + 1)]
-    )
-
-    last_features = df.iloc[-1][feature_cols].values.reshape(1, -1)
-
-    # Scale features
-    last_features_scaled = scaler.transform(last_features)
+    # Unscaled feature row (must match training); the forecaster scales it
+    last_features = df.iloc[-1][loaded.features].to_numpy(dtype=float)
 
     # ------------------------
-    # Recursive Forecast
+    # Multi-step Forecast
     # ------------------------
-    preds = []
-    last_row = last_features_scaled.copy()
-
-    for _ in range(n_minutes):
-        # Predict
-        y_pred = xgb_model.predict(last_row)[0]
-        preds.append(y_pred)
-
-        # Roll lag features manually
-        last_raw = last_row.flatten()
-
-        # Replace the "close" with new prediction
-        # NOTE: Here we only update lag features with new y_pred
-        new_lags = np.roll(last_raw[-window:], 1)
-        new_lags[0] = y_pred
-
-        # Keep OHLCV+indicators static
-        static_features = last_raw[:9]
-
-        # Combine new features
-        new_features = np.concatenate([static_features, new_lags])
-        last_row = new_features.reshape(1, -1)
+    preds = forecaster.forecast(last_features, n_minutes)
 
     # Build forecast DataFrame
     future_dates = pd.date_range(df["timestamp"].iloc[-1], periods=n_minutes + 1, freq="T")[1:]
@@ -413,45 +606,45 @@ def make_xgb_forecast(candles: list, n_minutes: int = 60):
 @app.post("/forecast/xgb/")
 async def forecast_xgb(request: ForecastRequest):
     try:
-        # Step 1: Get OHLCV CSV link
-        tool = AngelOneCandlestickTool()
-        result = tool._run(
-            company_name=request.company_name,
-            stock_name=request.stock_name,
-            exchange=request.exchange,
-            interval=request.interval
-        )
-
-        csv_url = result if isinstance(result, str) else result.get("message")
-        if not csv_url or not csv_url.startswith("http"):
-            raise HTTPException(status_code=400, detail=f"Invalid CSV URL: {csv_url}")
-
-        # Step 2: Download and parse candles
-        response = requests.get(csv_url)
-        decoded = response.content.decode("utf-8")
-        df = pd.read_csv(StringIO(decoded))
-
-        df = df.sort_values("timestamp")
-
-        candles = df[["timestamp", "open", "high", "low", "close", "volume"]].to_dict(orient="records")
+        # Step 1: Bring the local candle store up to date and read the latest bars from it
+        candles = await load_forecast_candles(request)
 
-        # Step 3: Call XGB forecast
-        predictions = make_xgb_forecast(candles, n_minutes=request.horizon)
+        # Step 2: Pick this symbol's model (loaded on first use) and call XGB forecast
+        loaded = await run_blocking(model_registry.get, request.stock_name, "xgb")
+        predictions = await run_blocking(make_xgb_forecast, candles, request.horizon, loaded)
 
         return {
             "company": request.company_name,
             "stock": request.stock_name,
             "exchange": request.exchange,
             "interval": request.interval,
+            "model": model_info(loaded),
             "forecast": predictions
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         print("XGB Forecast error:", str(e))
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
 
 
+@app.get("/llm/metrics")
+def llm_metrics():
+    """LLM rate limiter state per provider (queue wait, throttled time, 429s, per-key usage) and response cache stats."""
+    return {
+        "rate_limits": lazy_import("dags.Features.rate_limiter").metrics(),
+        "cache": lazy_import("dags.Features.llm_cache").get_llm_cache().stats(),
+    }
+
+
+@app.get("/models/")
+def list_models():
+    """Forecast models currently held in memory and the registry's cache budget."""
+    return model_registry.status()
+
+
 # ---------------- RAG Endpoint ----------------
 class QueryRequest(BaseModel):
     query: str
@@ -463,12 +656,41 @@ class QueryResponse(BaseModel):
 def rag_ask(request: QueryRequest):
     """Agentic RAG endpoint"""
     try:
-        answer = rag_module.agentic_rag(request.query)  # <-- call from module
+        answer = rag_module().agentic_rag(request.query)  # <-- call from module
         return QueryResponse(answer=answer)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"RAG error: {str(e)}")
 
 
+@app.post("/rag/ask/stream")
+async def rag_ask_stream(request: QueryRequest):
+    """
+    Server-sent events: "context" with the retrieved chunks as soon as Chroma
+    returns, then one "token" event per piece of the answer, then "done".
+    """
+    rag = await run_blocking(rag_module)
+
+    async def events():
+        try:
+            decision, chunks = await run_blocking(rag.retrieve_context, request.query)
+            context = {"retrieved": decision.retrieve, "router": decision.source, "chunks": chunks or []}
+            yield f"event: context\ndata: {json.dumps(context)}\n\n"
+
+            async for token in rag.stream_answer(rag.answer_messages(request.query, chunks)):
+                yield f"event: token\ndata: {json.dumps({'text': token})}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'detail': f'RAG error: {e}'})}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/rag/metrics")
+def rag_metrics():
+    """Retrieval router hit rate and decision latency, query-embedding and retrieval cache stats."""
+    return rag_module().router_stats()
+
+
 @app.get("/rag")
 def rag_root():
     return {"message": "RAG API is running 🚀"}
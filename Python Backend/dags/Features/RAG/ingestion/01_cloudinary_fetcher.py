@@ -3,8 +3,12 @@
 01_cloudinary_fetcher.py
 
 - Lists CSV files in configured Cloudinary folders (supports pagination).
-- Optionally downloads each CSV into ./data/raw/<folder>/
-- Produces ./data/manifest.json containing metadata for each file:
+- Optionally downloads each CSV into ./data/raw/<folder>/, several at a time
+  over a pooled HTTP session
+- Skips files whose Cloudinary version/bytes/etag are unchanged and whose
+  local copy is intact; resumes interrupted .tmp downloads with Range requests
+- Produces ./data/manifest.json containing metadata for each file (written
+  atomically, in batches):
     {
       "files": {
         "<filename.csv>": {
@@ -12,7 +16,9 @@
            "secure_url": "...",
            "folder": "...",
            "local_path": "...",   # only if downloaded
-           "etag": "<sha1-of-url>", 
+           "version": 1680000000,
+           "bytes": 12345,
+           "etag": "<cloudinary etag, if provided>",
            "downloaded_at": 1680000000
         }, ...
       },
@@ -24,14 +30,16 @@ import os
 import sys
 import json
 import time
-import hashlib
 import argparse
 from pathlib import Path
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Optional
 from dotenv import load_dotenv
 load_dotenv()
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import cloudinary
 import cloudinary.api
 
@@ -51,6 +59,11 @@ DEFAULT_FOLDERS = [
 
 # Max results per Cloudinary page
 PAGE_SIZE = 500
+# Parallel downloads (one pooled connection each)
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", "8"))
+# Manifest is written after this many finished downloads (and at the end)
+MANIFEST_FLUSH_EVERY = int(os.getenv("FETCH_MANIFEST_FLUSH_EVERY", "50"))
+DOWNLOAD_CHUNK = 1 << 16
 
 
 # -------- Helpers --------
@@ -73,8 +86,15 @@ def init_cloudinary():
     )
 
 
-def sha1(s: str) -> str:
-    return hashlib.sha1(s.encode("utf-8")).hexdigest()
+def make_session(workers: int = FETCH_WORKERS) -> requests.Session:
+    """HTTP session with a connection pool sized for the download workers and retries on transient errors."""
+    session = requests.Session()
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=frozenset({"GET"}))
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
 
 
 def ensure_dirs():
@@ -101,15 +121,17 @@ def load_manifest() -> Dict[str, Any]:
 
 def save_manifest(manifest: Dict[str, Any]):
     manifest["generated_at"] = int(time.time())
-    with MANIFEST_PATH.open("w", encoding="utf-8") as f:
+    tmp_path = MANIFEST_PATH.with_suffix(".json.tmp")
+    with tmp_path.open("w", encoding="utf-8") as f:
         json.dump(manifest, f, indent=2, ensure_ascii=False)
+    tmp_path.replace(MANIFEST_PATH)
 
 
 # -------- Cloudinary listing & download --------
 def list_cloudinary_csvs(folders: List[str]) -> List[Dict[str, Any]]:
     """
     Returns list of dicts:
-      { public_id, secure_url, folder, filename }
+      { public_id, secure_url, folder, filename, version, bytes, etag }
     Only returns items whose URL ends with .csv (case-insensitive).
     """
     resources = []
@@ -140,6 +162,9 @@ def list_cloudinary_csvs(folders: List[str]) -> List[Dict[str, Any]]:
                             "secure_url": url,
                             "folder": folder,
                             "filename": filename,
+                            "version": item.get("version"),
+                            "bytes": item.get("bytes"),
+                            "etag": item.get("etag"),
                         }
                     )
             next_cursor = resp.get("next_cursor")
@@ -148,26 +173,107 @@ def list_cloudinary_csvs(folders: List[str]) -> List[Dict[str, Any]]:
     return resources
 
 
-def download_to_local(url: str, folder: Path, filename: str) -> Path:
+def download_to_local(session: requests.Session, url: str, folder: Path, filename: str,
+                      expected_bytes: Optional[int] = None, version=None) -> Path:
     """
     Downloads CSV url to folder/filename. Returns Path.
-    Uses streaming to avoid loading whole file in memory.
+    Streams into a .tmp file named after the Cloudinary version; a partial
+    .tmp left by an interrupted run is resumed with a Range request.
     """
     folder.mkdir(parents=True, exist_ok=True)
     local_path = folder / filename
-    tmp_path = folder / (filename + ".tmp")
-    with requests.get(url, stream=True, timeout=60) as r:
-        r.raise_for_status()
-        with tmp_path.open("wb") as f:
-            for chunk in r.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
+    tmp_path = folder / f"{filename}.v{version}.tmp"
+    # Partial downloads of older versions can't be resumed
+    for stale in folder.glob(f"{filename}.*tmp"):
+        if stale != tmp_path:
+            stale.unlink(missing_ok=True)
+
+    offset = tmp_path.stat().st_size if tmp_path.exists() else 0
+    if expected_bytes is not None and offset > expected_bytes:
+        tmp_path.unlink()
+        offset = 0
+
+    if expected_bytes is None or offset < expected_bytes:
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        with session.get(url, stream=True, timeout=60, headers=headers) as r:
+            if r.status_code == 416:
+                # Nothing left to fetch past our offset; start over
+                tmp_path.unlink(missing_ok=True)
+                return download_to_local(session, url, folder, filename, expected_bytes, version)
+            r.raise_for_status()
+            # 200 means the server ignored the range: rewrite from scratch
+            mode = "ab" if offset and r.status_code == 206 else "wb"
+            with tmp_path.open(mode) as f:
+                for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK):
+                    if chunk:
+                        f.write(chunk)
+
+    size = tmp_path.stat().st_size
+    if expected_bytes is not None and size != expected_bytes:
+        raise IOError(f"incomplete download ({size}/{expected_bytes} bytes), will resume next run")
     tmp_path.replace(local_path)
     return local_path
 
 
+def is_unchanged(item: Dict[str, Any], existing: Optional[Dict[str, Any]], download: bool) -> bool:
+    """True if Cloudinary reports the same version/bytes/etag and the local copy is intact."""
+    if not existing or existing.get("version") is None:
+        return False
+    for field in ("version", "bytes", "etag"):
+        if item.get(field) is not None and item.get(field) != existing.get(field):
+            return False
+    if download:
+        local_path = existing.get("local_path")
+        if not local_path or not os.path.exists(local_path):
+            return False
+        if item.get("bytes") is not None and os.path.getsize(local_path) != item["bytes"]:
+            return False
+    return True
+
+
+def fetch_one(session: requests.Session, item: Dict[str, Any], download: bool,
+              existing: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Manifest entry for `item`; `existing` is its current entry, kept as the fallback copy on failure."""
+    filename = normalize_filename(item["filename"])
+    url = item["secure_url"]
+    folder = item["folder"]
+
+    entry = {
+        "public_id": item["public_id"],
+        "secure_url": url,
+        "folder": folder,
+        "filename": filename,
+        "version": item.get("version"),
+        "bytes": item.get("bytes"),
+        "etag": item.get("etag"),
+        "downloaded_at": None,
+        "local_path": None,
+    }
+
+    if download:
+        safe_folder = folder.replace("/", "_")
+        out_folder = RAW_DIR / safe_folder
+        try:
+            local_path = download_to_local(session, url, out_folder, filename,
+                                           expected_bytes=item.get("bytes"), version=item.get("version"))
+            entry["downloaded_at"] = int(time.time())
+            entry["local_path"] = str(local_path).replace("\\", "/")
+            print(f"    ✓ downloaded -> {local_path}")
+        except Exception as e:
+            print(f"    ! download failed for {filename}: {e}", file=sys.stderr)
+            # Not recorded as fetched, so the next run retries it; the last good copy stays in use
+            entry["version"] = None
+            if existing:
+                entry["local_path"] = existing.get("local_path")
+                entry["downloaded_at"] = existing.get("downloaded_at")
+    else:
+        print(f"    • metadata-only, no download: {filename}")
+
+    return entry
+
+
 # -------- Main ingestion-runner --------
-def run(folders: List[str], download: bool = True, force_download: bool = False):
+def run(folders: List[str], download: bool = True, force_download: bool = False, workers: int = FETCH_WORKERS):
     init_cloudinary()
     ensure_dirs()
     manifest = load_manifest()
@@ -175,51 +281,39 @@ def run(folders: List[str], download: bool = True, force_download: bool = False)
 
     print(f"[info] discovered {len(found)} CSV resources across folders")
 
+    todo = []
     for item in found:
-        filename = normalize_filename(item["filename"])
-        url = item["secure_url"]
-        folder = item["folder"]
-        key = filename  # manifest key = clean filename
-
-        etag = sha1(url)
-        existing = manifest["files"].get(key)
-
-        # Skip if unchanged
-        if existing and existing.get("etag") == etag and not force_download:
-            print(f"  ↩ skip (unchanged): {filename}")
+        key = normalize_filename(item["filename"])  # manifest key = clean filename
+        if not force_download and is_unchanged(item, manifest["files"].get(key), download):
             continue
+        todo.append(item)
+    print(f"[info] {len(found) - len(todo)} unchanged, {len(todo)} to fetch with {workers} workers")
 
-        print(f"  ↗ processing: {filename} (folder={folder})")
-        entry = {
-            "public_id": item["public_id"],
-            "secure_url": url,
-            "folder": folder,
-            "filename": filename,
-            "etag": etag,
-            "downloaded_at": None,
-            "local_path": None,
-        }
-
-        if download:
-            safe_folder = folder.replace("/", "_")
-            out_folder = RAW_DIR / safe_folder
-            try:
-                local_path = download_to_local(url, out_folder, filename)
-                entry["downloaded_at"] = int(time.time())
-                entry["local_path"] = str(local_path).replace("\\", "/")
-                print(f"    ✓ downloaded -> {local_path}")
-            except Exception as e:
-                print(f"    ! download failed for {filename}: {e}", file=sys.stderr)
-        else:
-            print(f"    • metadata-only, no download")
-
-        manifest["files"][key] = entry
+    session = make_session(workers)
+    done = 0
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cloudinary-fetch") as pool:
+            futures = [
+                pool.submit(fetch_one, session, item, download,
+                            manifest["files"].get(normalize_filename(item["filename"])))
+                for item in todo
+            ]
+            for future in as_completed(futures):
+                entry = future.result()
+                manifest["files"][entry["filename"]] = entry
+                done += 1
+                if done % MANIFEST_FLUSH_EVERY == 0:
+                    save_manifest(manifest)
+    finally:
+        # Keep whatever finished, even if the run was interrupted
         save_manifest(manifest)
+        session.close()
 
     # show summary
     print("\nSummary:")
     print(f"  manifest path: {MANIFEST_PATH.resolve()}")
     print(f"  local raw dir: {RAW_DIR.resolve()}")
+    print(f"  fetched this run: {done}")
     print(f"  total files in manifest: {len(manifest['files'])}")
 
 
@@ -229,7 +323,8 @@ def parse_args():
     ap.add_argument("--list", action="store_true", help="Only list found CSVs (no download)")
     ap.add_argument("--download", action="store_true", help="Download CSVs (default behavior)")
     ap.add_argument("--folders", nargs="*", help="Override folders to scan")
-    ap.add_argument("--force", action="store_true", help="Force re-download even if etag matches")
+    ap.add_argument("--force", action="store_true", help="Force re-download even if version/bytes/etag match")
+    ap.add_argument("--workers", type=int, default=FETCH_WORKERS, help="Parallel downloads")
     return ap.parse_args()
 
 
@@ -243,7 +338,7 @@ def main():
         return
     # default to download behavior if --download passed or neither flag passed
     download = True if (args.download or not args.list) else False
-    run(folders, download=download, force_download=args.force)
+    run(folders, download=download, force_download=args.force, workers=args.workers)
 
 
 if __name__ == "__main__":
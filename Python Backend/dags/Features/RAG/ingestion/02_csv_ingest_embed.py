@@ -5,47 +5,66 @@
 - Loads manifest.json produced by 01_cloudinary_fetcher.py
 - For each file listed in manifest:
     - Parse filename to extract company name + doc type
-    - Load CSV rows into text chunks
-    - Add metadata (company, doc_type, filename, row_index)
-- Embeds chunks using a local sentence-transformer
-- Stores them into a ChromaDB collection
+    - Stream CSV rows into chunks that end on row boundaries, each starting
+      with the header row
+    - Add metadata (company, doc_type, filename, row_index, row_end)
+- Embeds chunks using the shared sentence-transformer from vector_store.py
+  (multi-process on CPU), the same model that embeds queries
+- Stores them into a ChromaDB collection; upserts run on a writer thread
+  behind a bounded queue while the next batch is being encoded
+- With RAG_COMPANY_COLLECTIONS=true, also keeps one collection per company
+  for company-scoped retrieval; files ingested before it was turned on are
+  copied over from the main collection (no re-embedding)
+
+Ingestion is incremental: the manifest's "ingested" section records a content
+hash per file and per chunk. Unchanged files are skipped without being read,
+only new or changed chunks are embedded, and chunks that no longer exist are
+deleted from the collection.
 
 Usage:
     python ingestion/02_csv_ingest_embed.py --persist
     python ingestion/02_csv_ingest_embed.py --reset --persist
 
 Dependencies:
-    pip install chromadb sentence-transformers pandas
+    pip install chromadb sentence-transformers
 """
 
+import io
 import os
+import sys
+import csv
 import json
+import time
+import queue
+import hashlib
 import argparse
+import threading
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterator, List
 
-import pandas as pd
-from sentence_transformers import SentenceTransformer
-import chromadb
 from chromadb.config import Settings
 
+# Scripts run from this folder; the shared RAG modules live one level up
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from retrieval import COMPANY_COLLECTIONS, partition_name, bump_generations
+from vector_store import COLLECTION_NAME, get_chroma_client, get_embedder, forget_collection
+
 # -------- CONFIG --------
 DATA_DIR = Path("data")
 RAW_DIR = DATA_DIR / "raw"   # where actual csv files live
 MANIFEST_PATH = DATA_DIR / "manifest.json"
 CHROMA_DIR = DATA_DIR / "chroma"
 
-COLLECTION_NAME = "stock_data"
-EMBED_MODEL_NAME = "all-MiniLM-L6-v2"
-
-# Initialize Chroma client
-chroma_client = chromadb.PersistentClient(
-    path="vector_store"  # this is where embeddings will be saved
-)
-
-# Initialize SentenceTransformer model
-model = SentenceTransformer(EMBED_MODEL_NAME)
-
+# Max chunks per embed + upsert round (<= 5000 to avoid chroma error)
+BATCH_SIZE = 5000
+# Target chunk size; rows are never split, so a single long row can exceed it
+CHUNK_CHARS = int(os.getenv("INGEST_CHUNK_CHARS", "1000"))
+# Sentences per forward pass inside each encoder process
+EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", "64"))
+# Encoder processes; 1 encodes in this process
+EMBED_WORKERS = int(os.getenv("INGEST_EMBED_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+# Encoded batches waiting for the Chroma writer before encoding pauses
+UPSERT_QUEUE_SIZE = int(os.getenv("INGEST_UPSERT_QUEUE_SIZE", "2"))
 
 # -------- Helpers --------
 def load_manifest() -> Dict[str, Any]:
@@ -55,6 +74,46 @@ def load_manifest() -> Dict[str, Any]:
         return json.load(f)
 
 
+def save_manifest(manifest: Dict[str, Any]):
+    """Writes the manifest atomically so a crash mid-write never loses ingest state."""
+    tmp_path = MANIFEST_PATH.with_suffix(".json.tmp")
+    with tmp_path.open("w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    tmp_path.replace(MANIFEST_PATH)
+
+
+def file_hash(file_path: str) -> str:
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def assign_chunk_ids(chunks: List[Dict[str, Any]], source: str) -> Dict[str, str]:
+    """
+    Gives each chunk a content-addressed id ({source file stem}_{hash}), so
+    unchanged chunks keep their id when rows are added or removed around them.
+    The source file is part of the id: identical chunks in two files must not
+    share one, or deleting one file's orphan would remove the other's chunk.
+    Returns {id: chunk hash}.
+    """
+    stem = Path(source).stem
+    seen = {}
+    for chunk in chunks:
+        digest = text_hash(chunk["text"])
+        # Identical chunks within a file get an occurrence suffix
+        n = seen.get(digest, 0)
+        seen[digest] = n + 1
+        chunk["id"] = f"{stem}_{digest[:20]}" + (f"_{n}" if n else "")
+        chunk["hash"] = digest
+    return {c["id"]: c["hash"] for c in chunks}
+
+
 def parse_filename(filename: str) -> Dict[str, str]:
     """
     Example: 'reliance_candlesticks.csv' -> company='reliance', doc_type='candlesticks'
@@ -88,102 +147,337 @@ def normalize_path(file_path: str) -> str:
     return file_path  # last fallback
 
 
-def csv_to_chunks(file_path: str, company: str, doc_type: str, chunk_size: int = 500) -> List[Dict[str, Any]]:
+def _row_text(row: List[str]) -> str:
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator="\n").writerow(row)
+    return buf.getvalue()
+
+
+def iter_csv_chunks(file_path: str, company: str, doc_type: str,
+                    max_chars: int = CHUNK_CHARS) -> Iterator[Dict[str, Any]]:
+    """
+    Streams a CSV into chunks of whole rows, each starting with the header row,
+    so no row or number is cut in half. Rows are read lazily, one at a time.
+    """
+    source = os.path.basename(file_path)
+    with open(file_path, "r", encoding="utf-8", errors="replace", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if not header:
+            return
+        header_text = _row_text(header)
+
+        rows, size, first_row, index = [], len(header_text), 0, 0
+        for row_number, row in enumerate(reader):
+            if not row:
+                continue
+            text = _row_text(row)
+            if rows and size + len(text) > max_chars:
+                yield {
+                    "text": header_text + "".join(rows),
+                    "metadata": {"company": company, "doc_type": doc_type, "source": source,
+                                 "row_index": first_row, "row_end": row_number - 1},
+                }
+                index += 1
+                rows, size, first_row = [], len(header_text), row_number
+            rows.append(text)
+            size += len(text)
+        if rows:
+            yield {
+                "text": header_text + "".join(rows),
+                "metadata": {"company": company, "doc_type": doc_type, "source": source,
+                             "row_index": first_row, "row_end": row_number},
+            }
+
+
+def csv_to_chunks(file_path: str, company: str, doc_type: str, max_chars: int = CHUNK_CHARS) -> List[Dict[str, Any]]:
     try:
         if os.path.getsize(file_path) == 0:  # quick check for empty file
             print(f"[skip] {file_path} is empty, skipping...")
             return []
 
-        df = pd.read_csv(file_path)
-
-        if df.empty:
+        chunks = list(iter_csv_chunks(file_path, company, doc_type, max_chars))
+        if not chunks:
             print(f"[skip] {file_path} has no rows, skipping...")
-            return []
+        return chunks
 
-        # Convert dataframe to string chunks
-        text = df.to_csv(index=False)
-        chunks = [text[i:i+chunk_size] for i in range(0, len(text), chunk_size)]
-
-        docs = [
-            {
-                "id": f"{company}_{doc_type}_{i}",
-                "text": chunk,
-                "metadata": {
-                    "company": company,
-                    "doc_type": doc_type,
-                    "source": os.path.basename(file_path),
-                    "row_index": i
-                }
-            }
-            for i, chunk in enumerate(chunks)
-        ]
-        return docs
-
-    except pd.errors.EmptyDataError:
-        print(f"[error] {file_path} has no columns to parse, skipping...")
-        return []
     except Exception as e:
         print(f"[error] Failed to read {file_path}: {e}")
         return []
 
 
+class Encoder:
+    """SentenceTransformer encoding, spread over a CPU process pool when EMBED_WORKERS > 1."""
+
+    def __init__(self, workers: int = EMBED_WORKERS, batch_size: int = EMBED_BATCH_SIZE):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.pool = None
+
+    def encode(self, texts: List[str]):
+        model = get_embedder()
+        if self.workers <= 1:
+            return model.encode(texts, batch_size=self.batch_size)
+        # Started on first use: runs where nothing changed never spawn the workers
+        if self.pool is None:
+            self.pool = model.start_multi_process_pool(target_devices=["cpu"] * self.workers)
+        return model.encode_multi_process(texts, self.pool, batch_size=self.batch_size)
+
+    def close(self):
+        if self.pool is not None:
+            get_embedder().stop_multi_process_pool(self.pool)
+            self.pool = None
+
+
+class ChromaWriter:
+    """
+    Applies encoded batches to Chroma on a background thread. The queue is
+    bounded, so encoding runs at most UPSERT_QUEUE_SIZE batches ahead.
+    Ingest state is saved only after a batch's writes have landed.
+    """
+
+    def __init__(self, collection, manifest: Dict[str, Any], ingested: Dict[str, Any],
+                 max_pending: int = UPSERT_QUEUE_SIZE, company_collections: bool = COMPANY_COLLECTIONS):
+        self.collection = collection
+        self.company_collections = company_collections
+        self._partitions = {}
+        self.manifest = manifest
+        self.ingested = ingested
+        self.error = None
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._loop, name="chroma-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, work: Dict[str, Any]):
+        if self.error is not None:
+            raise self.error
+        self._queue.put(work)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def _loop(self):
+        while True:
+            work = self._queue.get()
+            if work is None:
+                return
+            if self.error is not None:
+                continue  # drain so submit() never blocks on a dead writer
+            try:
+                self._apply(work)
+            except Exception as e:
+                print(f"[error] Chroma write failed: {e}")
+                self.error = e
+
+    def _partition(self, company: str):
+        if company not in self._partitions:
+            self._partitions[company] = get_chroma_client().get_or_create_collection(partition_name(company))
+        return self._partitions[company]
+
+    def _targets(self, company: str) -> list:
+        """The main collection plus, when enabled, the company's own collection."""
+        return [self.collection, self._partition(company)] if self.company_collections else [self.collection]
+
+    def _backfill(self, company: str, source: str, ids: List[str]):
+        """Copies a file's chunks, with their stored embeddings, from the main collection to its company's."""
+        partition = self._partition(company)
+        # Drops anything left from before the file was last changed with partitions off
+        partition.delete(where={"source": source})
+        for i in range(0, len(ids), BATCH_SIZE):
+            got = self.collection.get(ids=ids[i:i+BATCH_SIZE], include=["embeddings", "documents", "metadatas"])
+            if got["ids"]:
+                partition.upsert(ids=got["ids"], embeddings=got["embeddings"],
+                                 documents=got["documents"], metadatas=got["metadatas"])
+
+    def _apply(self, work: Dict[str, Any]):
+        if self.company_collections:
+            for company, source, ids in work["backfill"]:
+                self._backfill(company, source, ids)
+
+        for company, source in work["reset_sources"]:
+            # Not tracked yet: clear chunks written under the old position-based ids
+            for collection in self._targets(company):
+                collection.delete(where={"source": source})
+
+        chunks, embeddings = work["chunks"], work["embeddings"]
+        if chunks:
+            print(f"[db] upserting {len(chunks)} chunks...")
+            vectors = embeddings.tolist()
+            by_company = {}
+            for chunk, vector in zip(chunks, vectors):
+                by_company.setdefault(chunk["metadata"]["company"], []).append((chunk, vector))
+            for company, items in by_company.items():
+                for collection in self._targets(company):
+                    collection.upsert(
+                        ids=[c["id"] for c, _ in items],
+                        documents=[c["text"] for c, _ in items],
+                        embeddings=[v for _, v in items],
+                        metadatas=[c["metadata"] for c, _ in items],
+                    )
+        # Kept chunks may have moved within their file; refresh metadata only, no re-embedding
+        kept_by_company = {}
+        for chunk in work["kept"]:
+            kept_by_company.setdefault(chunk["metadata"]["company"], []).append(chunk)
+        for company, kept in kept_by_company.items():
+            for collection in self._targets(company):
+                for i in range(0, len(kept), BATCH_SIZE):
+                    batch = kept[i:i+BATCH_SIZE]
+                    collection.update(ids=[c["id"] for c in batch], metadatas=[c["metadata"] for c in batch])
+        deletes_by_company = {}
+        for company, chunk_id in work["deletes"]:
+            deletes_by_company.setdefault(company, []).append(chunk_id)
+        for company, deletes in deletes_by_company.items():
+            for collection in self._targets(company):
+                for i in range(0, len(deletes), BATCH_SIZE):
+                    collection.delete(ids=deletes[i:i+BATCH_SIZE])
+
+        # Cached retrieval results for these companies are now stale
+        changed = {company for company, _ in work["reset_sources"]}
+        changed.update(company for company, _, _ in work["backfill"])
+        changed.update(c["metadata"]["company"] for c in chunks)
+        changed.update(company for company, _ in work["deletes"])
+        if changed:
+            bump_generations(changed)
+
+        self.ingested.update(work["states"])
+        for filename in work["dropped"]:
+            self.ingested.pop(filename, None)
+        self.manifest["ingested"] = self.ingested
+        save_manifest(self.manifest)
+
+
 def run(reset=False, persist=False):
     if reset:
         print("[db] resetting collection...")
         try:
-            chroma_client.delete_collection(name=COLLECTION_NAME)
+            get_chroma_client().delete_collection(name=COLLECTION_NAME)
         except Exception:
             pass  # if it doesn’t exist yet
+        forget_collection(COLLECTION_NAME)
+        bump_generations([])
+        # Per-company collections are rebuilt from scratch too
+        for c in get_chroma_client().list_collections():
+            name = getattr(c, "name", c)
+            if name.startswith(f"{COLLECTION_NAME}__"):
+                get_chroma_client().delete_collection(name=name)
 
-    collection = chroma_client.get_or_create_collection(COLLECTION_NAME)
+    collection = get_chroma_client().get_or_create_collection(COLLECTION_NAME)
 
     manifest = load_manifest()
     files = manifest.get("files", [])
+    # {filename: {"file_hash", "company", "doc_type", "chunks": {id: chunk hash}, "partitioned", "ingested_at"}}
+    # "partitioned": the file's chunks are also in its company's collection
+    ingested = {} if reset else manifest.get("ingested", {})
+    # The writer thread updates `ingested`; decisions are made against this snapshot
+    previous_states = dict(ingested)
 
     if not files:
         print("[warn] No files listed in manifest.json.")
         return
 
-    all_chunks = []
-    for file_path in files:
-        file_path = normalize_path(file_path)
-
-        if not os.path.exists(file_path):
-            print(f"[skip] file not found: {file_path}")
-            continue
-
-        filename = os.path.basename(file_path)
-        meta = parse_filename(filename)
-
-        company = meta["company"]
-        doc_type = meta["doc_type"]
-
-        print(f"[ingest] {file_path} (company={company}, doc_type={doc_type})")
-        chunks = csv_to_chunks(file_path, company, doc_type)
-        all_chunks.extend(chunks)
-
-    if not all_chunks:
-        print("[warn] No chunks to insert.")
-        return
-
-    # Split into batches (<= 5000 to avoid chroma error)
-    BATCH_SIZE = 5000
-    for i in range(0, len(all_chunks), BATCH_SIZE):
-        batch = all_chunks[i:i+BATCH_SIZE]
-
-        ids = [c["id"] for c in batch]
-        texts = [c["text"] for c in batch]
-        metadatas = [c["metadata"] for c in batch]
+    stats = {"files_skipped": 0, "files_changed": 0, "files_backfilled": 0,
+             "chunks_embedded": 0, "chunks_kept": 0, "chunks_deleted": 0}
+    pending = {"chunks": [], "kept": [], "deletes": [], "reset_sources": [], "backfill": [], "states": {}, "dropped": []}
+
+    encoder = Encoder()
+    writer = ChromaWriter(collection, manifest, ingested)
+    partitioned = writer.company_collections
+
+    def pending_size() -> int:
+        return len(pending["chunks"]) + len(pending["kept"]) + sum(len(ids) for _, _, ids in pending["backfill"])
+
+    def flush():
+        """Encodes pending chunks here and hands the Chroma writes to the writer thread."""
+        chunks = pending["chunks"]
+        started = time.perf_counter()
+        embeddings = encoder.encode([c["text"] for c in chunks]) if chunks else None
+        if chunks:
+            elapsed = time.perf_counter() - started
+            print(f"[embed] {len(chunks)} chunks in {elapsed:.1f}s ({len(chunks) / max(elapsed, 1e-9):.0f}/s)")
+        writer.submit({**pending, "embeddings": embeddings})
+        for k, v in pending.items():
+            pending[k] = type(v)()
 
-        embeddings = model.encode(texts).tolist()
-
-        print(f"[db] upserting batch {i//BATCH_SIZE + 1} with {len(batch)} chunks...")
-        collection.upsert(
-            ids=ids,
-            documents=texts,
-            embeddings=embeddings,
-            metadatas=metadatas,
-        )
+    try:
+        for file_path in files:
+            file_path = normalize_path(file_path)
+
+            if not os.path.exists(file_path):
+                print(f"[skip] file not found: {file_path}")
+                continue
+
+            filename = os.path.basename(file_path)
+            meta = parse_filename(filename)
+
+            company = meta["company"]
+            doc_type = meta["doc_type"]
+
+            digest = file_hash(file_path)
+            previous = previous_states.get(filename)
+            # Ingested while per-company collections were off: its chunks are missing from the company's
+            needs_backfill = partitioned and previous is not None and not previous.get("partitioned")
+            if needs_backfill:
+                pending["backfill"].append((company, filename, list(previous.get("chunks", {}))))
+                stats["files_backfilled"] += 1
+
+            if previous and previous.get("file_hash") == digest:
+                if needs_backfill:
+                    pending["states"][filename] = {**previous, "partitioned": True}
+                    if pending_size() >= BATCH_SIZE:
+                        flush()
+                else:
+                    stats["files_skipped"] += 1
+                continue
+
+            print(f"[ingest] {file_path} (company={company}, doc_type={doc_type})")
+            chunks = csv_to_chunks(file_path, company, doc_type)
+            current = assign_chunk_ids(chunks, filename)
+
+            if previous is None:
+                pending["reset_sources"].append((company, filename))
+                old_ids = set()
+            else:
+                old_ids = set(previous.get("chunks", {}))
+
+            new_chunks = [c for c in chunks if c["id"] not in old_ids]
+            orphans = list(old_ids - set(current))
+            pending["chunks"].extend(new_chunks)
+            pending["kept"].extend(c for c in chunks if c["id"] in old_ids)
+            pending["deletes"].extend((company, chunk_id) for chunk_id in orphans)
+            pending["states"][filename] = {
+                "file_hash": digest,
+                "company": company,
+                "doc_type": doc_type,
+                "chunks": current,
+                "partitioned": partitioned,
+                "ingested_at": int(time.time()),
+            }
+            stats["files_changed"] += 1
+            stats["chunks_embedded"] += len(new_chunks)
+            stats["chunks_kept"] += len(chunks) - len(new_chunks)
+            stats["chunks_deleted"] += len(orphans)
+
+            if pending_size() >= BATCH_SIZE:
+                flush()
+
+        # Files dropped from the manifest leave their chunks behind otherwise
+        listed = {os.path.basename(normalize_path(f)) for f in files}
+        for filename in [f for f in previous_states if f not in listed]:
+            orphans = list(previous_states[filename].get("chunks", {}))
+            pending["deletes"].extend((previous_states[filename].get("company"), chunk_id) for chunk_id in orphans)
+            pending["dropped"].append(filename)
+            stats["chunks_deleted"] += len(orphans)
+
+        flush()
+    finally:
+        encoder.close()
+        writer.close()
+
+    print(f"[done] {stats}")
+    return stats
 
 
 # -------- CLI --------
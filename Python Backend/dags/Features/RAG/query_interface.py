@@ -4,7 +4,8 @@
 
 Agentic RAG pipeline (modular version):
 - Groq LLaMA acts as an agent
-- Uses VectorDBTool for retrieval (Chroma)
+- Uses VectorDBTool for retrieval (Chroma), scoped to the companies and
+  document types the question mentions
 - Combines reasoning + retrieved context
 
 Dependencies:
@@ -12,55 +13,105 @@ Dependencies:
 """
 
 import os
-import chromadb
-from groq import Groq
+import threading
 from dotenv import load_dotenv
+from Utils.blocking import run_blocking
+from ..llm_cache import get_llm_cache, cache_key, market_ttl, STATIC_TTL, ENABLED as LLM_CACHE_ENABLED
+from .router import QueryRouter
+from .retrieval import Retriever, format_chunks
+from .vector_store import get_chroma_client, get_collection, embed_query, embed_cache_info
 load_dotenv()
 
 # -------- CONFIG --------
-COLLECTION_NAME = "stock_data"
-CHROMA_DIR = "vector_store"
 TOP_K = 5
+GROQ_MODEL = "llama-3.1-8b-instant"
+
+# Clients are created on first use so importing this module stays cheap and a
+# missing key or vector store only fails the queries that need them
+_groq_client = None
+_async_groq_client = None
+_vector_tool = None
+_router = None
+_init_lock = threading.Lock()
+
+# -------- Groq client --------
+def get_groq_client():
+    global _groq_client
+    if _groq_client is None:
+        with _init_lock:
+            if _groq_client is None:
+                from groq import Groq
+                api_key = os.getenv("GROQ_API_KEY")
+                if not api_key:
+                    raise RuntimeError("Missing GROQ_API_KEY in environment variables.")
+                _groq_client = Groq(api_key=api_key)
+    return _groq_client
+
+def get_async_groq_client():
+    global _async_groq_client
+    if _async_groq_client is None:
+        with _init_lock:
+            if _async_groq_client is None:
+                from groq import AsyncGroq
+                api_key = os.getenv("GROQ_API_KEY")
+                if not api_key:
+                    raise RuntimeError("Missing GROQ_API_KEY in environment variables.")
+                _async_groq_client = AsyncGroq(api_key=api_key)
+    return _async_groq_client
+
+
+def cached_chat(messages, temperature, ttl=None) -> str:
+    """
+    Groq chat completion through the shared LLM response cache. `ttl=None`
+    ties the entry to market-data freshness.
+    """
+    def call():
+        resp = get_groq_client().chat.completions.create(
+            model=GROQ_MODEL, messages=messages, temperature=temperature
+        )
+        return resp.choices[0].message.content.strip()
 
-# -------- Initialize Groq client --------
-api_key = os.getenv("GROQ_API_KEY")
-if not api_key:
-    raise RuntimeError("Missing GROQ_API_KEY in environment variables.")
-groq_client = Groq(api_key=api_key)
-
-# -------- Initialize Chroma client + collection --------
-chroma_client = chromadb.PersistentClient(path=CHROMA_DIR)
-collection = chroma_client.get_collection(COLLECTION_NAME)
+    return get_llm_cache().cached_call(f"groq/{GROQ_MODEL}", temperature, messages, call, ttl=ttl)
 
 # -------- VectorDBTool --------
-class VectorDBTool:
+class VectorDBTool(Retriever):
     """Tool for retrieving company CSV data from vector database"""
-    def __init__(self, collection, top_k=TOP_K):
-        self.collection = collection
-        self.top_k = top_k
+    def __init__(self, get_collection, get_client=None, embed=None, top_k=TOP_K):
+        super().__init__(get_collection, get_client, embed=embed, top_k=top_k)
         self.name = "VectorDB Retrieval Tool"
         self.description = "Retrieve company CSV data (fundamentals, ratios, news, candlesticks) from vector database."
 
-    def run(self, query: str) -> str:
-        results = self.collection.query(query_texts=[query], n_results=self.top_k)
-        docs = results.get("documents", [[]])[0]
-        metas = results.get("metadatas", [[]])[0]
-        if not docs:
-            return "No relevant data found."
-        return "\n".join([f"[{m['company']} - {m['doc_type']}] {d}" for d, m in zip(docs, metas)])
-
 
-# Initialize VectorDBTool
-vector_tool = VectorDBTool(collection=collection)
-
-# -------- Agent --------
-def agentic_rag(query: str) -> str:
-    """
-    Groq LLaMA acts as an agent:
-    - Decides whether to use retrieval via VectorDBTool
-    - Generates a final answer
-    """
-    # Step 1: Decide if retrieval is needed
+# -------- Chroma client + collection --------
+def get_vector_tool() -> VectorDBTool:
+    global _vector_tool
+    if _vector_tool is None:
+        with _init_lock:
+            if _vector_tool is None:
+                # Shared per process with the agents; queries embedded with the ingest model
+                _vector_tool = VectorDBTool(get_collection, get_chroma_client, embed=embed_query)
+    return _vector_tool
+
+# -------- Retrieval router --------
+def get_router() -> QueryRouter:
+    global _router
+    if _router is None:
+        with _init_lock:
+            if _router is None:
+                _router = QueryRouter(load_companies=lambda: get_vector_tool().vocabulary()[0])
+    return _router
+
+
+def router_stats() -> dict:
+    return {
+        **get_router().stats(),
+        "query_embeddings": embed_cache_info(),
+        "retrieval_cache": get_vector_tool().cache.stats(),
+    }
+
+
+def llm_decide(query: str) -> bool:
+    """Asks the LLM whether `query` needs retrieval; used when the local router isn't confident."""
     decision_prompt = f"""
 You are an intelligent stock research assistant.
 The user asked: "{query}"
@@ -70,20 +121,30 @@ Decide if external data (retrieval) is needed:
 - If it's a general reasoning/explaining question (like 'what is a candlestick pattern?') → say "NO RETRIEVE".
 Answer only with "RETRIEVE" or "NO RETRIEVE".
 """
-    decision_resp = groq_client.chat.completions.create(
-        model="llama-3.1-8b-instant",
-        messages=[
+    # Depends only on the wording of the question, so it can be cached for long
+    decision = cached_chat(
+        [
             {"role": "system", "content": "You are a decision-making agent."},
             {"role": "user", "content": decision_prompt}
         ],
-        temperature=0
-    )
-    decision = decision_resp.choices[0].message.content.strip().upper()
+        temperature=0,
+        ttl=STATIC_TTL,
+    ).upper()
+    return "RETRIEVE" in decision and not decision.startswith("NO")
 
-    # Step 2: Retrieve context if required via VectorDBTool
-    context = vector_tool.run(query) if "RETRIEVE" in decision else ""
+# -------- Agent --------
+ANSWER_TEMPERATURE = 0.3
 
-    # Step 3: Generate final answer
+
+def retrieve_context(query: str):
+    """Returns (route decision, retrieved chunks); chunks is None when retrieval isn't needed."""
+    decision = get_router().route(query, fallback=llm_decide)
+    chunks = get_vector_tool().search(query) if decision.retrieve else None
+    return decision, chunks
+
+
+def answer_messages(query: str, chunks: list) -> list:
+    context = format_chunks(chunks) if chunks is not None else ""
     final_prompt = f"""
 You are a financial assistant.
 User query: {query}
@@ -93,16 +154,57 @@ Context (if available):
 
 Now give the best possible answer.
 """
-    final_resp = groq_client.chat.completions.create(
-        model="llama-3.1-8b-instant",
-        messages=[
-            {"role": "system", "content": "You are a helpful AI assistant with RAG capabilities."},
-            {"role": "user", "content": final_prompt}
-        ],
-        temperature=0.3
-    )
+    return [
+        {"role": "system", "content": "You are a helpful AI assistant with RAG capabilities."},
+        {"role": "user", "content": final_prompt}
+    ]
+
+
+def agentic_rag(query: str) -> str:
+    """
+    Groq LLaMA acts as an agent:
+    - Decides whether to use retrieval via VectorDBTool (local router, LLM when unsure)
+    - Generates a final answer
+    """
+    # Step 1 + 2: Decide if retrieval is needed and retrieve context via VectorDBTool
+    _, chunks = retrieve_context(query)
+
+    # Step 3: Generate final answer
+    # The retrieved context is part of the key, so re-ingested data misses the cache
+    return cached_chat(answer_messages(query, chunks), temperature=ANSWER_TEMPERATURE)
 
-    return final_resp.choices[0].message.content.strip()
+
+async def stream_answer(messages: list):
+    """
+    Yields the answer as Groq produces it. A cached answer is yielded in one
+    piece; a completed stream is stored in the LLM cache.
+    """
+    model = f"groq/{GROQ_MODEL}"
+    key = cache_key(model, ANSWER_TEMPERATURE, messages)
+    if LLM_CACHE_ENABLED:
+        # SQLite reads and writes (and the first connection) stay off the event loop
+        cached = await run_blocking(lambda: get_llm_cache().get(key))
+        if cached is not None:
+            yield cached
+            return
+
+    stream = await get_async_groq_client().chat.completions.create(
+        model=GROQ_MODEL, messages=messages, temperature=ANSWER_TEMPERATURE, stream=True
+    )
+    parts = []
+    try:
+        async for chunk in stream:
+            token = chunk.choices[0].delta.content if chunk.choices else None
+            if token:
+                parts.append(token)
+                yield token
+    finally:
+        # Releases the upstream connection when the client goes away mid-stream
+        await stream.close()
+
+    answer = "".join(parts).strip()
+    if LLM_CACHE_ENABLED and answer:
+        await run_blocking(lambda: get_llm_cache().put(key, model, answer, market_ttl()))
 
 # -------- Interactive Loop --------
 def main():
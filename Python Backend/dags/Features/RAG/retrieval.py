@@ -0,0 +1,355 @@
+"""
+retrieval.py
+
+Scoped vector retrieval shared by the RAG assistant and the CrewAI agents.
+
+- Reads the companies and doc types present in the collection metadata
+- Extracts company/ticker and document-type intent from the query and pushes
+  it down to Chroma as a `where` filter ($in for several values)
+- Optionally queries a per-company collection (RAG_COMPANY_COLLECTIONS),
+  written by the ingestion pipeline next to the main one
+- Falls back to a wider search when a scoped query comes back empty
+- Caches results (LRU + TTL) keyed by normalized query, filters and top_k;
+  ingestion bumps per-company generations that invalidate stale entries
+
+Kept free of package-relative imports so the ingestion scripts can import it
+directly.
+"""
+
+import os
+import re
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+# -------- CONFIG --------
+COLLECTION_NAME = "stock_data"
+TOP_K = 5
+# Maintain and query one extra collection per company
+COMPANY_COLLECTIONS = os.getenv("RAG_COMPANY_COLLECTIONS", "false").lower() in {"1", "true", "yes"}
+# How often companies and doc types are re-read from the collection metadata
+VOCAB_REFRESH_SECONDS = float(os.getenv("RAG_VOCAB_REFRESH_SECONDS", "600"))
+METADATA_PAGE = 10000
+MAX_NGRAM = 4
+# Retrieval result cache
+RESULT_CACHE_SIZE = int(os.getenv("RAG_RESULT_CACHE_SIZE", "1024"))
+RESULT_CACHE_TTL = float(os.getenv("RAG_RESULT_CACHE_TTL", "600"))
+# Bumped by ingestion for every company whose documents change; lives with the store (vector_store.CHROMA_DIR)
+GENERATIONS_PATH = os.getenv("RAG_GENERATIONS_PATH",
+                             os.path.join(os.getenv("CHROMA_DIR", "vector_store"), "generations.json"))
+
+TOKEN_RE = re.compile(r"[a-z0-9&]+")
+TICKER_RE = re.compile(r"\b([A-Z][A-Z0-9&-]{1,14})\.(?:NS|BO)\b|\b(?:NSE|BSE)\s*:\s*([A-Z][A-Z0-9&-]{1,14})\b")
+
+# Query words pointing at a kind of document; matched against the doc types in the collection
+DOC_TYPE_HINTS = {
+    "news": {"news", "headline", "headlines", "announcement", "announced"},
+    "ratio": {"ratio", "ratios", "pe", "p e", "eps", "roe", "roce", "margin", "valuation"},
+    "balance": {"balance sheet", "assets", "liabilities", "debt", "equity", "reserves"},
+    "candle": {"candle", "candles", "candlestick", "candlesticks", "ohlc", "pattern", "patterns", "doji", "hammer"},
+    "report": {"report", "reports", "annual report", "results", "quarterly"},
+}
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(TOKEN_RE.findall(text.lower().replace("_", " ").replace("/", " ")))
+
+
+def ngrams(tokens, max_n: int = MAX_NGRAM) -> Set[str]:
+    return {" ".join(tokens[i:i + n]) for n in range(1, max_n + 1) for i in range(len(tokens) - n + 1)}
+
+
+def partition_name(company: str) -> str:
+    """Chroma-safe name of a company's own collection."""
+    slug = re.sub(r"[^a-z0-9_-]+", "-", company.lower()).strip("-_") or "unknown"
+    return f"{COLLECTION_NAME}__{slug}"[:63]
+
+
+def build_where(companies: List[str] = None, doc_types: List[str] = None) -> Optional[dict]:
+    clauses = []
+    for field, values in (("company", companies), ("doc_type", doc_types)):
+        if values:
+            clauses.append({field: values[0]} if len(values) == 1 else {field: {"$in": sorted(values)}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def format_chunks(chunks: list) -> str:
+    if not chunks:
+        return "No relevant data found."
+    return "\n".join([f"[{c['company']} - {c['doc_type']}] {c['text']}" for c in chunks])
+
+
+# -------- Invalidation --------
+def read_generations(path: str = GENERATIONS_PATH) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"global": 0, "companies": {}}
+
+
+def bump_generations(companies, path: str = GENERATIONS_PATH):
+    """
+    Marks `companies` as changed; the global generation always moves too, so
+    unscoped cached results are dropped as well. Called by the ingestion writer.
+    """
+    gens = read_generations(path)
+    gens["global"] = gens.get("global", 0) + 1
+    per_company = gens.setdefault("companies", {})
+    for company in set(companies):
+        if company:
+            per_company[company] = per_company.get(company, 0) + 1
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(gens, f)
+    os.replace(tmp_path, path)
+
+
+class ResultCache:
+    """
+    LRU + TTL cache of retrieval results. Each entry remembers the generation
+    of the companies it was scoped to (or the global one when unscoped) and is
+    dropped once ingestion bumps it.
+    """
+
+    def __init__(self, max_entries: int = RESULT_CACHE_SIZE, ttl: float = RESULT_CACHE_TTL,
+                 generations_path: str = GENERATIONS_PATH):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.generations_path = generations_path
+        self._entries = OrderedDict()   # key -> (expires, deps, generations, chunks, seconds)
+        self._gens = {"global": 0, "companies": {}}
+        self._gens_mtime = None
+        self._lock = threading.Lock()
+        self.metrics = {"hits": 0, "misses": 0, "expired": 0, "invalidated": 0, "evicted": 0,
+                        "saved_seconds": 0.0, "miss_seconds": 0.0}
+
+    def _generations(self) -> dict:
+        # A stat per lookup; the file is only re-read after ingestion rewrote it
+        try:
+            mtime = os.stat(self.generations_path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime != self._gens_mtime:
+            self._gens, self._gens_mtime = read_generations(self.generations_path), mtime
+        return self._gens
+
+    def generations(self) -> dict:
+        """Current generations. Take them before searching and pass them to put()."""
+        with self._lock:
+            return self._generations()
+
+    @staticmethod
+    def _select(gens: dict, deps: Optional[Tuple[str, ...]]) -> tuple:
+        if deps is None:
+            return (gens.get("global", 0),)
+        return tuple(gens.get("companies", {}).get(c, 0) for c in deps)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, deps, generations, chunks, seconds = entry
+                if time.monotonic() > expires:
+                    self.metrics["expired"] += 1
+                elif self._select(self._generations(), deps) != generations:
+                    self.metrics["invalidated"] += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.metrics["hits"] += 1
+                    self.metrics["saved_seconds"] += seconds
+                    return chunks
+                del self._entries[key]
+            self.metrics["misses"] += 1
+            return None
+
+    def put(self, key, chunks: list, deps: Optional[Tuple[str, ...]], seconds: float, generations: dict):
+        """
+        `deps` are the companies the result was scoped to, None for the whole
+        collection. `generations` must be taken before the search, so a bump
+        that lands during the search leaves the entry already stale.
+        """
+        with self._lock:
+            self.metrics["miss_seconds"] += seconds
+            self._entries[key] = (time.monotonic() + self.ttl, deps, self._select(generations, deps), chunks, seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.metrics["evicted"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            m = dict(self.metrics)
+            size = len(self._entries)
+        lookups = m["hits"] + m["misses"]
+        return {
+            **{k: v for k, v in m.items() if not k.endswith("_seconds")},
+            "size": size,
+            "max_size": self.max_entries,
+            "hit_ratio": round(m["hits"] / lookups, 3) if lookups else None,
+            "latency_saved_seconds": round(m["saved_seconds"], 3),
+            "avg_miss_ms": round(m["miss_seconds"] / m["misses"] * 1000, 2) if m["misses"] else None,
+        }
+
+
+def scan_metadata(collection) -> Tuple[Set[str], Set[str]]:
+    """Distinct `company` and `doc_type` values in a collection, read page by page."""
+    companies, doc_types, offset = set(), set(), 0
+    while True:
+        page = collection.get(include=["metadatas"], limit=METADATA_PAGE, offset=offset)
+        metas = page.get("metadatas") or []
+        for m in metas:
+            if m and m.get("company"):
+                companies.add(m["company"])
+            if m and m.get("doc_type"):
+                doc_types.add(m["doc_type"])
+        if len(metas) < METADATA_PAGE:
+            return companies, doc_types
+        offset += METADATA_PAGE
+
+
+class Retriever:
+    """
+    `embed(query) -> vector` embeds queries with the ingest model; without
+    it, Chroma embeds the query text with the collection's default embedder.
+    """
+
+    def __init__(self, get_collection: Callable, get_client: Callable = None, embed: Callable = None,
+                 top_k: int = TOP_K, company_collections: bool = COMPANY_COLLECTIONS,
+                 refresh_seconds: float = VOCAB_REFRESH_SECONDS, cache: Optional[ResultCache] = None):
+        self.get_collection = get_collection
+        self.cache = cache if cache is not None else ResultCache()
+        self.get_client = get_client
+        self.embed = embed
+        self.top_k = top_k
+        self.company_collections = company_collections and get_client is not None
+        self.refresh_seconds = refresh_seconds
+        self._companies: Dict[str, str] = {}     # normalized name -> metadata value
+        self._doc_types: Set[str] = set()
+        self._loaded_at = None
+        self._refreshing = False
+        self._partitions: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    # -------- vocabulary --------
+    def vocabulary(self) -> Tuple[Dict[str, str], Set[str]]:
+        """
+        ({normalized company: metadata value}, doc types). The first scan runs
+        inline; later ones run every `refresh_seconds` on a background thread
+        while queries keep using the previous vocabulary.
+        """
+        if self._loaded_at is None:
+            with self._lock:
+                if self._loaded_at is None:
+                    self._reload_vocabulary()
+        elif time.monotonic() - self._loaded_at > self.refresh_seconds and not self._refreshing:
+            with self._lock:
+                if not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(target=self._background_reload, name="rag-vocab-refresh", daemon=True).start()
+        return self._companies, self._doc_types
+
+    def _reload_vocabulary(self):
+        try:
+            companies, doc_types = scan_metadata(self.get_collection())
+            self._companies = {normalize_text(c): c for c in companies if normalize_text(c)}
+            self._doc_types = doc_types
+            # Partitions missing at the last lookup may have been built since
+            self._partitions = {c: p for c, p in self._partitions.items() if p is not None}
+        except Exception as e:
+            print(f"⚠️ Could not read vector store metadata: {e}")
+        self._loaded_at = time.monotonic()
+
+    def _background_reload(self):
+        try:
+            self._reload_vocabulary()
+        finally:
+            self._refreshing = False
+
+    def extract_filters(self, query: str) -> Dict[str, List[str]]:
+        """Companies and doc types the query is about, as metadata values."""
+        companies, doc_types = self.vocabulary()
+        text = normalize_text(query)
+        grams = ngrams(text.split())
+
+        matched = {companies[g] for g in grams & companies.keys()}
+        for groups in TICKER_RE.findall(query):
+            symbol = normalize_text(next(g for g in groups if g))
+            if symbol in companies:
+                matched.add(companies[symbol])
+
+        roots = [root for root, words in DOC_TYPE_HINTS.items() if grams & words]
+        types = {dt for dt in doc_types if any(root in dt for root in roots)}
+        return {"companies": sorted(matched), "doc_types": sorted(types)}
+
+    # -------- search --------
+    def _partition(self, company: str):
+        if company not in self._partitions:
+            try:
+                self._partitions[company] = self.get_client().get_collection(partition_name(company))
+            except Exception:
+                self._partitions[company] = None   # not built (yet); retried after the next vocabulary refresh
+        return self._partitions[company]
+
+    def _query(self, collection, query: str, top_k: int, where: Optional[dict]) -> list:
+        kwargs = {"where": where} if where else {}
+        if self.embed is not None:
+            kwargs["query_embeddings"] = [self.embed(query)]
+        else:
+            kwargs["query_texts"] = [query]
+        results = collection.query(n_results=top_k, **kwargs)
+        docs = results.get("documents", [[]])[0]
+        metas = results.get("metadatas", [[]])[0]
+        return [
+            {"company": (m or {}).get("company", "unknown"), "doc_type": (m or {}).get("doc_type", "unknown"), "text": d}
+            for d, m in zip(docs, metas)
+        ]
+
+    def search(self, query: str, top_k: int = None, filters: Dict[str, List[str]] = None) -> list:
+        """
+        Top matches as [{"company", "doc_type", "text"}], scoped by `filters`
+        (extracted from the query when not given). Widens to the company
+        alone, then to the whole collection, when a scope has no matches.
+        """
+        top_k = top_k or self.top_k
+        filters = self.extract_filters(query) if filters is None else filters
+        companies, doc_types = sorted(filters.get("companies") or []), sorted(filters.get("doc_types") or [])
+
+        key = (" ".join(query.lower().split()), tuple(companies), tuple(doc_types), top_k)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        generations = self.cache.generations()
+        started = time.perf_counter()
+        chunks, deps = self._search(query, top_k, companies, doc_types)
+        self.cache.put(key, chunks, deps, time.perf_counter() - started, generations)
+        return chunks
+
+    def _search(self, query: str, top_k: int, companies: List[str], doc_types: List[str]):
+        """Returns (chunks, companies the result depends on, or None for the whole collection)."""
+        attempts = [(companies, doc_types)]
+        if companies and doc_types:
+            attempts.append((companies, []))
+        if companies or doc_types:
+            attempts.append(([], []))
+
+        for scope_companies, scope_types in attempts:
+            collection = self.get_collection()
+            where = build_where(scope_companies, scope_types)
+            if self.company_collections and len(scope_companies) == 1:
+                partition = self._partition(scope_companies[0])
+                if partition is not None:
+                    collection, where = partition, build_where(None, scope_types)
+            chunks = self._query(collection, query, top_k, where)
+            if chunks:
+                return chunks, (tuple(scope_companies) if scope_companies else None)
+        return [], None
+
+    def run(self, query: str) -> str:
+        return format_chunks(self.search(query))
@@ -0,0 +1,172 @@
+"""
+router.py
+
+Local retrieve / no-retrieve router for agentic RAG.
+
+- Matches query n-grams against the companies known to the vector store
+  (from the Chroma metadata) and against NSE/BSE ticker symbols
+- Scores market-data wording ("today", "latest", "news", "Q2 results") against
+  conceptual wording ("what is", "explain", "difference between")
+- Decides locally when confident; otherwise defers to the LLM decision prompt
+
+Usage:
+    router = QueryRouter(load_companies=lambda: retriever.vocabulary()[0])
+    decision = router.route(query, fallback=llm_decide)
+"""
+
+import os
+import re
+import time
+import threading
+from typing import Callable, Iterable, NamedTuple, Optional, Set
+from .retrieval import TICKER_RE, normalize_text, ngrams
+
+# -------- CONFIG --------
+# Below this confidence the LLM makes the call
+MIN_CONFIDENCE = float(os.getenv("RAG_ROUTER_MIN_CONFIDENCE", "0.75"))
+# How often the company list is re-read from the vector store
+REFRESH_SECONDS = float(os.getenv("RAG_ROUTER_REFRESH_SECONDS", "600"))
+
+YEAR_RE = re.compile(r"\b(?:19|20)\d{2}\b|\bq[1-4]\b|\bfy\s?\d{2,4}\b")
+
+# Point at a specific, current or dated piece of data
+SPECIFIC_TERMS = {
+    "today", "todays", "yesterday", "latest", "current", "currently", "now", "recent", "recently",
+    "news", "headline", "headlines", "this week", "last week", "this month", "last month",
+    "this year", "last year", "quarter", "quarterly", "results", "announced", "closed", "opened",
+}
+# Market data the vector store holds, but also used in conceptual questions
+DATA_TERMS = {
+    "price", "share price", "stock price", "close", "closing", "open", "high", "low", "volume",
+    "ratio", "ratios", "pe", "p e", "eps", "revenue", "profit", "earnings", "dividend",
+    "market cap", "valuation", "book value", "debt", "roe", "roce", "margin", "fundamentals",
+    "candlestick", "candlesticks", "52 week", "performance", "trend", "shares", "stock",
+}
+CONCEPT_PHRASES = (
+    "what is", "what are", "what does", "whats", "explain", "define", "definition",
+    "meaning of", "how does", "how do", "how to", "difference between", "why do", "why does",
+    "tell me about the concept", "in general",
+)
+
+
+class RouteDecision(NamedTuple):
+    retrieve: bool
+    confidence: float
+    source: str          # "rules" or "llm"
+    reason: str
+    seconds: float
+
+
+class QueryRouter:
+    def __init__(self, load_companies: Callable[[], Iterable[str]], min_confidence: float = MIN_CONFIDENCE,
+                 refresh_seconds: float = REFRESH_SECONDS):
+        self.load_companies = load_companies
+        self.min_confidence = min_confidence
+        self.refresh_seconds = refresh_seconds
+        self._companies: Set[str] = set()
+        self._loaded_at = None
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.metrics = {
+            "queries": 0,
+            "rule_decisions": 0,
+            "llm_fallbacks": 0,
+            "retrieve": 0,
+            "no_retrieve": 0,
+            "rule_seconds": 0.0,
+            "llm_seconds": 0.0,
+        }
+
+    # -------- companies --------
+    def companies(self) -> Set[str]:
+        """
+        Normalized company names. Only the first load runs inline; after that a
+        background thread refreshes them every `refresh_seconds` while routing
+        keeps using the previous set. A failed refresh keeps the old list.
+        """
+        if self._loaded_at is None:
+            with self._lock:
+                if self._loaded_at is None:
+                    self._reload()
+        elif time.monotonic() - self._loaded_at > self.refresh_seconds and not self._refreshing:
+            with self._lock:
+                if not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(target=self._background_reload, name="rag-router-refresh", daemon=True).start()
+        return self._companies
+
+    def _reload(self):
+        try:
+            self._companies = {normalize_text(c) for c in self.load_companies() if normalize_text(c)}
+        except Exception as e:
+            print(f"⚠️ RAG router could not load companies: {e}")
+        self._loaded_at = time.monotonic()
+
+    def _background_reload(self):
+        try:
+            self._reload()
+        finally:
+            self._refreshing = False
+
+    # -------- rules --------
+    def classify(self, query: str) -> RouteDecision:
+        """Rule-based decision; low confidence means the rules could not tell."""
+        started = time.perf_counter()
+        text = normalize_text(query)
+        grams = ngrams(text.split())
+
+        def decide(retrieve, confidence, reason):
+            return RouteDecision(retrieve, confidence, "rules", reason, time.perf_counter() - started)
+
+        company = next(iter(grams & self.companies()), None)
+        if company:
+            return decide(True, 0.95, f"company '{company}'")
+        if TICKER_RE.search(query):
+            return decide(True, 0.9, "ticker symbol")
+
+        specific = bool(grams & SPECIFIC_TERMS) or bool(YEAR_RE.search(text))
+        data = bool(grams & DATA_TERMS)
+        concept = any(text.startswith(p) or f" {p} " in f" {text} " for p in CONCEPT_PHRASES)
+
+        if specific and not concept:
+            return decide(True, 0.85, "asks for current or dated data")
+        if concept and not specific:
+            return decide(False, 0.85, "conceptual question")
+        if data and not concept:
+            return decide(True, 0.6, "mentions market data")
+        return decide(True, 0.5, "no clear signal")
+
+    def route(self, query: str, fallback: Optional[Callable[[str], bool]] = None) -> RouteDecision:
+        """Decides locally, asking `fallback(query)` only when the rules aren't confident enough."""
+        decision = self.classify(query)
+        rule_seconds = decision.seconds
+        if decision.confidence < self.min_confidence and fallback is not None:
+            started = time.perf_counter()
+            retrieve = fallback(query)
+            decision = RouteDecision(retrieve, decision.confidence, "llm", decision.reason,
+                                     rule_seconds + time.perf_counter() - started)
+
+        with self._stats_lock:
+            m = self.metrics
+            m["queries"] += 1
+            m["rule_seconds"] += rule_seconds
+            if decision.source == "llm":
+                m["llm_fallbacks"] += 1
+                m["llm_seconds"] += decision.seconds - rule_seconds
+            else:
+                m["rule_decisions"] += 1
+            m["retrieve" if decision.retrieve else "no_retrieve"] += 1
+        return decision
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            m = dict(self.metrics)
+        queries = m["queries"]
+        return {
+            **{k: v for k, v in m.items() if not k.endswith("_seconds")},
+            "known_companies": len(self._companies),
+            "rule_hit_rate": round(m["rule_decisions"] / queries, 3) if queries else None,
+            "avg_rule_microseconds": round(m["rule_seconds"] / queries * 1e6, 1) if queries else None,
+            "avg_llm_fallback_seconds": round(m["llm_seconds"] / m["llm_fallbacks"], 3) if m["llm_fallbacks"] else None,
+        }
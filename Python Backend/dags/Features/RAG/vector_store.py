@@ -0,0 +1,81 @@
+"""
+vector_store.py
+
+One embedding model and one Chroma client per process, created on first use
+and shared by the RAG assistant, the CrewAI agents and the ingestion scripts.
+
+- Queries are embedded explicitly with the same model used at ingest and sent
+  as `query_embeddings`, so Chroma never loads its own default embedder
+- Query embeddings are cached (LRU), so repeated questions skip the encoder
+
+Kept free of package-relative imports so the ingestion scripts can import it
+directly.
+"""
+
+import os
+import threading
+from functools import lru_cache
+from typing import Dict, List
+
+# -------- CONFIG --------
+CHROMA_DIR = os.getenv("CHROMA_DIR", "vector_store")
+COLLECTION_NAME = "stock_data"
+EMBED_MODEL_NAME = os.getenv("EMBED_MODEL_NAME", "all-MiniLM-L6-v2")
+QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "2048"))
+
+_embedder = None
+_client = None
+_collections: Dict[str, object] = {}
+_lock = threading.Lock()
+
+
+def get_embedder():
+    """The process-wide SentenceTransformer."""
+    global _embedder
+    if _embedder is None:
+        with _lock:
+            if _embedder is None:
+                from sentence_transformers import SentenceTransformer
+                _embedder = SentenceTransformer(EMBED_MODEL_NAME)
+    return _embedder
+
+
+def get_chroma_client():
+    """The process-wide persistent Chroma client."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                import chromadb
+                _client = chromadb.PersistentClient(path=CHROMA_DIR)
+    return _client
+
+
+def get_collection(name: str = COLLECTION_NAME, create: bool = False):
+    """A collection handle, cached per name; `create=True` creates it if missing."""
+    collection = _collections.get(name)
+    if collection is None:
+        client = get_chroma_client()
+        collection = client.get_or_create_collection(name) if create else client.get_collection(name)
+        _collections[name] = collection
+    return collection
+
+
+def forget_collection(name: str = COLLECTION_NAME):
+    """Drops a cached handle, e.g. after the collection was deleted and recreated."""
+    _collections.pop(name, None)
+
+
+@lru_cache(maxsize=QUERY_EMBED_CACHE_SIZE)
+def _embed_cached(text: str) -> tuple:
+    return tuple(get_embedder().encode(text).tolist())
+
+
+def embed_query(text: str) -> List[float]:
+    """Embedding of a query with the ingest model; identical queries hit the cache."""
+    return list(_embed_cached(" ".join(text.split())))
+
+
+def embed_cache_info() -> dict:
+    info = _embed_cached.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "max_size": info.maxsize}
@@ -1,7 +1,6 @@
 import os
 import sys
-import time
-import random
+import threading
 import traceback
 from dotenv import load_dotenv
 
@@ -27,27 +26,40 @@ from .tools.candlestick_tool import AngelOneCandlestickTool
 from .tools.yfinance_tool import YFinanceFundamentalsTool
 from crewai_tools.tools import ScrapeWebsiteTool
 from crewai.tools.base_tool import Tool
-import chromadb
 from litellm.exceptions import RateLimitError
-from sentence_transformers import SentenceTransformer
 from pydantic import PrivateAttr
+from .concurrency import provider_slot
+from .rate_limiter import get_limiter, gemini_api_keys, retry_after_from_error, estimate_tokens
+from .llm_cache import get_llm_cache
+from .RAG.retrieval import Retriever, bump_generations
+from .RAG.vector_store import get_chroma_client, get_collection, get_embedder, embed_query
 
 # ─── SAFE LLM CALL ─────────────────────────────────────────────────
-def safe_call(llm, prompt, retries=5):
-    for attempt in range(retries):
+def _call_limited(limiter, call, messages, retries, label):
+    """
+    Runs `call(lease, messages)` under the shared rate limiter. A 429 puts
+    only the key that hit it on cooldown and the retry goes to whichever key
+    frees up first, instead of sleeping blindly.
+    """
+    estimate = estimate_tokens(messages)
+    for _ in range(retries):
+        lease = limiter.acquire(estimate)
         try:
-            return llm.call(prompt)
+            response = call(lease, messages)
         except RateLimitError as e:
-            wait_time = 2 ** attempt + random.uniform(0, 1)
-            try:
-                msg = str(e)
-                if "Please try again in" in msg:
-                    wait_time = float(msg.split("Please try again in ")[1].split("s")[0]) + random.uniform(0, 1)
-            except Exception:
-                pass
-            print(f"⏳ Rate limit hit for {llm.model}. Retrying in {wait_time:.2f}s...")
-            time.sleep(wait_time)
-    raise RuntimeError(f"Exceeded max retries for {llm.model}")
+            limiter.penalize(lease, retry_after_from_error(e))
+            print(f"⏳ Rate limit hit for {label} on key #{lease.index + 1}, retrying on the next free key...")
+            continue
+        limiter.record_usage(lease, estimate + estimate_tokens(response))
+        return response
+    raise RuntimeError(f"Exceeded max retries for {label}")
+
+
+def safe_call(llm, prompt, retries=5):
+    if isinstance(llm, RateLimitedLLM):
+        return llm.call(prompt)
+    limiter = get_limiter(f"llm:{llm.model}", [llm.api_key or "default"])
+    return _call_limited(limiter, lambda lease, messages: llm.call(messages), prompt, retries, llm.model)
 
 # ─── SAFE LLM WRAPPER ──────────────────────────────────────────────
 class SafeLLMWrapper:
@@ -58,13 +70,75 @@ class SafeLLMWrapper:
     def call(self, prompt):
         return safe_call(self.llm, prompt, self.retries)
 
-api_key = os.getenv("GEMINI_API_KEY1")
+# ─── PROVIDER-CAPPED LLM ───────────────────────────────────────────
+class ProviderCappedLLM(LLM):
+    """LLM whose calls share the provider's concurrency cap across parallel crew branches."""
+    def __init__(self, *args, cap_provider: str, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cap_provider = cap_provider
+
+    def call(self, *args, **kwargs):
+        with provider_slot(self.cap_provider):
+            return super().call(*args, **kwargs)
+
+# ─── RATE-LIMITED LLM ──────────────────────────────────────────────
+_llm_setup_lock = threading.Lock()
+
+class RateLimitedLLM(ProviderCappedLLM):
+    """
+    LLM that takes every call from the shared token-bucket limiter and rotates
+    across API keys, with one underlying LLM per key.
+
+    api_keys may be a list or a callable returning one. Keys are read on the
+    first call, so importing this module without keys configured still works.
+    """
+    def __init__(self, model: str, api_keys, limiter_name: str, retries: int = 5, **kwargs):
+        super().__init__(model=model, cap_provider=limiter_name, **kwargs)
+        self.limiter_name = limiter_name
+        self.retries = retries
+        self.limiter = None
+        self._api_keys = api_keys
+        self._llm_kwargs = kwargs
+        self._delegates = []
+
+    def _get_limiter(self):
+        """Creates the per-key LLMs and the shared limiter on first use; raises if no keys are configured."""
+        if self.limiter is None:
+            with _llm_setup_lock:
+                if self.limiter is None:
+                    keys = list(self._api_keys() if callable(self._api_keys) else self._api_keys)
+                    limiter = get_limiter(self.limiter_name, keys)
+                    self._delegates = [
+                        ProviderCappedLLM(model=self.model, api_key=key, cap_provider=self.limiter_name,
+                                          **self._llm_kwargs)
+                        for key in keys
+                    ]
+                    self.limiter = limiter
+        return self.limiter
+
+    def _call(self, messages, *args, **kwargs):
+        return _call_limited(
+            self._get_limiter(),
+            lambda lease, msgs: self._delegates[lease.index].call(msgs, *args, **kwargs),
+            messages, self.retries, self.model,
+        )
 
-llm = LLM(model="gemini/gemini-2.0-flash", temperature=0.7, api_key=api_key)
+    def call(self, messages, tools=None, *args, **kwargs):
+        # Calls that execute functions inline have side effects; only cache plain completions
+        if args or kwargs.get("available_functions"):
+            return self._call(messages, tools, *args, **kwargs)
+        return get_llm_cache().cached_call(
+            self.model, self.temperature, messages,
+            lambda: self._call(messages, tools, **kwargs),
+            tools=tools,
+        )
+
+llm = RateLimitedLLM(model="gemini/gemini-2.0-flash", temperature=0.7,
+                     api_keys=gemini_api_keys, limiter_name="gemini")
 
 # ─── VECTOR DB ─────────────────────────────────────────────────────
-chroma_client = chromadb.PersistentClient(path="vector_store")
-collection = chroma_client.get_collection("stock_data")
+# Client, collection and embedder are shared per process and created on first query
+retriever = Retriever(get_collection, get_chroma_client, embed=embed_query)
 
 class VectorDBTool(Tool):
     def __init__(self):
@@ -75,14 +149,8 @@ class VectorDBTool(Tool):
         )
 
     def run(self, query: str):
-        results = collection.query(query_texts=[query], n_results=5)
-        docs = results.get("documents", [[]])[0]
-        metas = results.get("metadatas", [[]])[0]
-        if not docs:
-            return "No relevant data found."
-        return "\n".join(
-            [f"[{m['company']} - {m['doc_type']}] {d}" for d, m in zip(docs, metas)]
-        )
+        # Scoped to the companies / doc types named in the query via `where` filters
+        return retriever.run(query)
 
 # ─── SAFE SCRAPER ──────────────────────────────────────────────────
 class SafeScrapeWebsiteTool(ScrapeWebsiteTool):
@@ -164,19 +232,17 @@ def get_agents(company_name: str, stock_ticker: str):
             llm=llm,
             verbose=True
         ),
-        "ingestion_agent": VectorDBIngestionAgent(collection=collection, embed_model=embed_model)
+        "ingestion_agent": VectorDBIngestionAgent()
 
     }
 
 
 
-embed_model = SentenceTransformer("all-MiniLM-L6-v2")
-
 class VectorDBIngestionAgent(Agent):
     _collection: any = PrivateAttr()
     _embed_model: any = PrivateAttr()
 
-    def __init__(self, collection, embed_model, **kwargs):
+    def __init__(self, collection=None, embed_model=None, **kwargs):
         super().__init__(
             role="VectorDB Ingestion Agent",
             goal="Keep the vector DB up-to-date with outputs from other agents.",
@@ -198,14 +264,18 @@ class VectorDBIngestionAgent(Agent):
         if not text_blocks:
             return "No new content to ingest."
 
-        embeddings = self._embed_model.encode(text_blocks).tolist()
+        embed_model = self._embed_model or get_embedder()
+        collection = self._collection or get_collection()
+        embeddings = embed_model.encode(text_blocks).tolist()
         ids = [f"doc_{hash(t)}" for t in text_blocks]
         metadatas = [{"source": "agent_output"} for _ in text_blocks]
 
-        self._collection.upsert(
+        collection.upsert(
             ids=ids,
             documents=text_blocks,
             embeddings=embeddings,
             metadatas=metadatas
         )
+        # Unscoped cached retrievals may now miss these documents
+        bump_generations([])
         return f"Ingested {len(text_blocks)} items into Chroma."
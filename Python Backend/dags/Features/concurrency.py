@@ -0,0 +1,33 @@
+import os
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# -------- CONFIG --------
+# Max in-flight calls per upstream provider, shared by every crew branch and
+# request running in this process
+PROVIDER_LIMITS = {
+    "gemini": int(os.getenv("GEMINI_MAX_CONCURRENCY", "4")),
+    "serper": int(os.getenv("SERPER_MAX_CONCURRENCY", "2")),
+    "newsapi": int(os.getenv("NEWSAPI_MAX_CONCURRENCY", "1")),
+    "angelone": int(os.getenv("ANGELONE_MAX_CONCURRENCY", "2")),
+}
+
+_semaphores = {name: threading.BoundedSemaphore(max(1, limit)) for name, limit in PROVIDER_LIMITS.items()}
+
+
+@contextmanager
+def provider_slot(provider: str):
+    """Holds one of the provider's concurrency slots for the duration of a call."""
+    semaphore = _semaphores.get(provider)
+    if semaphore is None:
+        yield
+        return
+    with semaphore:
+        yield
+
+
+class JobCancelled(Exception):
+    """Raised from a progress callback to abort a report run, e.g. once its job timed out."""
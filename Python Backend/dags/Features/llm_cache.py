@@ -0,0 +1,213 @@
+"""
+llm_cache.py
+
+Persistent, content-addressed cache for LLM responses (SQLite in WAL mode).
+
+- Key: sha256 over (model, temperature, messages, tools). Tool results reach
+  the model through the messages, so new tool output means a new key.
+- TTL follows market-data freshness: a few minutes while NSE is trading,
+  until the next session opens otherwise. Prompts that don't depend on
+  market data can pass their own TTL.
+- Size-bounded: once the file holds more than LLM_CACHE_MAX_MB of responses,
+  the least recently used entries are dropped.
+- Each thread gets its own connection; WAL lets readers run alongside a writer,
+  including from other processes (API workers, the Airflow DAG).
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import datetime as dt
+from typing import Optional
+from zoneinfo import ZoneInfo
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# -------- CONFIG --------
+# Anchored to this file, so every process shares one database whatever its working directory
+CACHE_PATH = os.getenv(
+    "LLM_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "tools", "Tools_Data", "llm_cache.sqlite"),
+)
+MAX_BYTES = int(float(os.getenv("LLM_CACHE_MAX_MB", "256")) * 1024 * 1024)
+# TTL while the market is open; data-driven answers go stale quickly
+INTRADAY_TTL = float(os.getenv("LLM_CACHE_INTRADAY_TTL", "300"))
+# TTL for prompts that don't depend on market data
+STATIC_TTL = float(os.getenv("LLM_CACHE_STATIC_TTL", str(7 * 24 * 60 * 60)))
+ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() not in {"0", "false", "no"}
+
+MARKET_TZ = ZoneInfo("Asia/Kolkata")
+MARKET_OPEN = dt.time(9, 15)
+MARKET_CLOSE = dt.time(15, 30)
+# Check the size bound every this many writes
+EVICT_EVERY = 50
+
+
+def market_ttl(now: Optional[dt.datetime] = None) -> float:
+    """Seconds a market-data-dependent response stays valid: INTRADAY_TTL in session, else until the next open."""
+    now = now or dt.datetime.now(MARKET_TZ)
+    if now.weekday() < 5 and MARKET_OPEN <= now.time() < MARKET_CLOSE:
+        return INTRADAY_TTL
+
+    next_open = dt.datetime.combine(now.date(), MARKET_OPEN, tzinfo=MARKET_TZ)
+    if now.time() >= MARKET_OPEN:
+        next_open += dt.timedelta(days=1)
+    while next_open.weekday() >= 5:
+        next_open += dt.timedelta(days=1)
+    return max(INTRADAY_TTL, (next_open - now).total_seconds())
+
+
+def cache_key(model: str, temperature, messages, tools=None) -> str:
+    payload = json.dumps(
+        {"model": model, "temperature": temperature, "messages": messages, "tools": tools},
+        sort_keys=True, default=str, ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    def __init__(self, path: str = CACHE_PATH, max_bytes: int = MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._writes = 0
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, response TEXT NOT NULL, "
+            "created REAL, expires REAL, last_access REAL, size INTEGER)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses(last_access)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, hit: bool):
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        try:
+            conn = self._conn()
+            row = conn.execute(
+                "SELECT response FROM responses WHERE key = ? AND expires > ?", (key, now)
+            ).fetchone()
+            if row is not None:
+                # Refresh recency at most once a minute to keep reads mostly read-only
+                conn.execute(
+                    "UPDATE responses SET last_access = ? WHERE key = ? AND last_access < ?",
+                    (now, key, now - 60),
+                )
+                conn.commit()
+        except sqlite3.Error as e:
+            print(f"⚠️ LLM cache read failed: {e}")
+            row = None
+        self._count(row is not None)
+        return row[0] if row else None
+
+    def put(self, key: str, model: str, response: str, ttl: float):
+        now = time.time()
+        try:
+            conn = self._conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model, response, now, now + ttl, now, len(response.encode("utf-8"))),
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"⚠️ LLM cache write failed: {e}")
+            return
+        with self._stats_lock:
+            self._writes += 1
+            due = self._writes % EVICT_EVERY == 0
+        if due:
+            self.evict()
+
+    def evict(self):
+        """Drops expired entries, then least recently used ones until under the size bound."""
+        conn = self._conn()
+        try:
+            removed = conn.execute("DELETE FROM responses WHERE expires <= ?", (time.time(),)).rowcount
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                # Trim to 90% so we don't evict again on the next write
+                excess = total - int(self.max_bytes * 0.9)
+                freed = 0
+                victims = []
+                for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access"):
+                    if freed >= excess:
+                        break
+                    victims.append((key,))
+                    freed += size
+                conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+                removed += len(victims)
+            conn.commit()
+            self.evicted += removed
+        except sqlite3.Error as e:
+            print(f"⚠️ LLM cache eviction failed: {e}")
+
+    def cached_call(self, model: str, temperature, messages, call, ttl: Optional[float] = None, tools=None) -> str:
+        """Returns the cached response for these inputs, or runs `call()` and stores its string result."""
+        if not ENABLED:
+            return call()
+        key = cache_key(model, temperature, messages, tools)
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        response = call()
+        if isinstance(response, str) and response:
+            self.put(key, model, response, market_ttl() if ttl is None else ttl)
+        return response
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        try:
+            entries, size = self._conn().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        except sqlite3.Error:
+            entries, size = None, None
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+            "entries": entries,
+            "size_bytes": size,
+            "max_bytes": self.max_bytes,
+            "evicted": self.evicted,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMCache:
+    """Returns the process-wide LLM response cache."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMCache()
+    return _cache
@@ -0,0 +1,258 @@
+"""
+rate_limiter.py
+
+Shared LLM rate limiting: token buckets for requests and tokens per minute,
+one pair per API key, behind a fair FIFO queue.
+
+- Callers take a ticket; only the oldest waiting ticket may acquire, so
+  concurrent crews are served in arrival order instead of racing.
+- The head of the queue gets the key that can serve it soonest; if every key
+  is empty it waits exactly until the first bucket refills (no blind backoff).
+- A 429 puts only that key on cooldown for the provider's retry hint; the
+  other keys keep serving.
+
+Usage:
+    limiter = get_limiter("gemini", gemini_api_keys())
+    lease = limiter.acquire(estimated_tokens=1200)
+    ... call with lease.api_key ...
+    limiter.record_usage(lease, actual_tokens)
+"""
+
+import os
+import re
+import time
+import asyncio
+import itertools
+import threading
+from collections import deque
+from typing import Dict, List, NamedTuple, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# -------- CONFIG --------
+# Gemini 2.0 Flash free-tier limits per key; override for paid keys
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", "15"))
+GEMINI_TPM = float(os.getenv("GEMINI_TPM", "1000000"))
+# Cooldown for a key after a 429 with no retry hint
+DEFAULT_COOLDOWN = float(os.getenv("LLM_RATE_LIMIT_COOLDOWN", "30"))
+# How often async waiters re-check their turn
+ASYNC_POLL = 0.05
+
+
+def gemini_api_keys() -> List[str]:
+    """GEMINI_API_KEY1, GEMINI_API_KEY2, ... (stops at the first gap), else GEMINI_API_KEY."""
+    keys = []
+    for i in itertools.count(1):
+        key = os.getenv(f"GEMINI_API_KEY{i}")
+        if not key:
+            break
+        keys.append(key)
+    if not keys and os.getenv("GEMINI_API_KEY"):
+        keys.append(os.getenv("GEMINI_API_KEY"))
+    return keys
+
+
+def retry_after_from_error(error: Exception) -> Optional[float]:
+    """Reads the provider's retry hint ("Please try again in 7.5s" or "retryDelay": "27s") from an error."""
+    msg = str(error)
+    match = re.search(r"try again in ([\d.]+)\s*s", msg) or re.search(r'retryDelay"?:\s*"?([\d.]+)s', msg)
+    return float(match.group(1)) if match else None
+
+
+class TokenBucket:
+    """Classic token bucket: holds up to `capacity`, refills `capacity` per `period` seconds."""
+
+    def __init__(self, capacity: float, period: float = 60.0):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        # Requests larger than the bucket only wait for a full bucket
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def take(self, amount: float, now: float):
+        self._refill(now)
+        self.tokens -= amount
+
+
+class KeyState:
+    def __init__(self, index: int, api_key: str, rpm: float, tpm: float):
+        self.index = index
+        self.api_key = api_key
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.cooldown_until = 0.0
+        self.served = 0
+        self.used_tokens = 0
+        self.rate_limited = 0
+
+    def wait_time(self, tokens: float, now: float) -> float:
+        return max(
+            self.cooldown_until - now,
+            self.requests.wait_time(1, now),
+            self.tokens.wait_time(tokens, now),
+            0.0,
+        )
+
+
+class Lease(NamedTuple):
+    index: int
+    api_key: str
+    estimated_tokens: int
+    granted_at: float
+
+
+class RateLimiter:
+    """Fair, multi-key RPM/TPM limiter shared by every crew and request in the process."""
+
+    def __init__(self, name: str, api_keys: List[str], rpm: float, tpm: float):
+        if not api_keys:
+            raise ValueError(f"No API keys configured for {name}")
+        self.name = name
+        self.keys = [KeyState(i, key, rpm, tpm) for i, key in enumerate(api_keys)]
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._tickets = itertools.count()
+        self.metrics = {
+            "requests": 0,
+            "queue_wait_seconds": 0.0,
+            "max_queue_wait_seconds": 0.0,
+            "throttled_seconds": 0.0,
+            "rate_limit_errors": 0,
+        }
+
+    # -------- core --------
+    def _try_grant(self, ticket: int, tokens: int):
+        """Returns (lease, 0) if `ticket` is at the head and a key is free, else (None, seconds to wait)."""
+        if self._queue[0] != ticket:
+            return None, None
+        now = time.monotonic()
+        key = min(self.keys, key=lambda k: (k.wait_time(tokens, now), k.served))
+        wait = key.wait_time(tokens, now)
+        if wait > 0:
+            return None, wait
+        key.requests.take(1, now)
+        key.tokens.take(tokens, now)
+        key.served += 1
+        self._queue.popleft()
+        self._cond.notify_all()
+        return Lease(key.index, key.api_key, tokens, now), 0.0
+
+    def _granted(self, lease: Lease, enqueued: float, throttled: float) -> Lease:
+        waited = lease.granted_at - enqueued
+        m = self.metrics
+        m["requests"] += 1
+        m["queue_wait_seconds"] += waited
+        m["max_queue_wait_seconds"] = max(m["max_queue_wait_seconds"], waited)
+        m["throttled_seconds"] += throttled
+        return lease
+
+    def acquire(self, estimated_tokens: int = 1) -> Lease:
+        """Blocks until this caller's turn and a key with capacity; returns the key to use."""
+        with self._cond:
+            ticket = next(self._tickets)
+            self._queue.append(ticket)
+            enqueued = time.monotonic()
+            throttled = 0.0
+            while True:
+                lease, wait = self._try_grant(ticket, estimated_tokens)
+                if lease is not None:
+                    return self._granted(lease, enqueued, throttled)
+                started = time.monotonic()
+                self._cond.wait(timeout=wait)
+                if wait is not None:
+                    throttled += time.monotonic() - started
+
+    async def acquire_async(self, estimated_tokens: int = 1) -> Lease:
+        """Same as acquire(), but waits without blocking the event loop."""
+        with self._cond:
+            ticket = next(self._tickets)
+            self._queue.append(ticket)
+        enqueued = time.monotonic()
+        throttled = 0.0
+        try:
+            while True:
+                with self._cond:
+                    lease, wait = self._try_grant(ticket, estimated_tokens)
+                    if lease is not None:
+                        return self._granted(lease, enqueued, throttled)
+                sleep_for = min(wait, 1.0) if wait else ASYNC_POLL
+                await asyncio.sleep(sleep_for)
+                if wait:
+                    throttled += sleep_for
+        except asyncio.CancelledError:
+            with self._cond:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                    self._cond.notify_all()
+            raise
+
+    # -------- feedback --------
+    def record_usage(self, lease: Lease, actual_tokens: int):
+        """Corrects the token bucket once the real usage of a call is known."""
+        with self._cond:
+            key = self.keys[lease.index]
+            key.tokens.take(actual_tokens - lease.estimated_tokens, time.monotonic())
+            key.used_tokens += actual_tokens
+
+    def penalize(self, lease: Lease, retry_after: Optional[float] = None):
+        """Puts a key that returned 429 on cooldown; other keys keep serving."""
+        with self._cond:
+            key = self.keys[lease.index]
+            key.cooldown_until = max(key.cooldown_until, time.monotonic() + (retry_after or DEFAULT_COOLDOWN))
+            key.rate_limited += 1
+            self.metrics["rate_limit_errors"] += 1
+            self._cond.notify_all()
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        with self._cond:
+            return {
+                **{k: round(v, 3) if isinstance(v, float) else v for k, v in self.metrics.items()},
+                "waiting": len(self._queue),
+                "keys": [
+                    {
+                        "key": f"#{k.index + 1}",
+                        "served": k.served,
+                        "used_tokens": k.used_tokens,
+                        "rate_limited": k.rate_limited,
+                        "cooldown_seconds": round(max(0.0, k.cooldown_until - now), 1),
+                        "requests_available": round(k.requests.tokens, 2),
+                        "tokens_available": round(k.tokens.tokens),
+                    }
+                    for k in self.keys
+                ],
+            }
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(name: str, api_keys: List[str] = None, rpm: float = GEMINI_RPM,
+                tpm: float = GEMINI_TPM) -> RateLimiter:
+    """Returns the process-wide limiter for a provider, creating it on first use."""
+    with _limiters_lock:
+        if name not in _limiters:
+            _limiters[name] = RateLimiter(name, api_keys or [], rpm, tpm)
+        return _limiters[name]
+
+
+def metrics() -> dict:
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {name: limiter.snapshot() for name, limiter in limiters.items()}
+
+
+def estimate_tokens(payload) -> int:
+    """Rough token count (~4 characters per token) used to reserve TPM before a call."""
+    return len(str(payload)) // 4 + 1
@@ -23,7 +23,37 @@ from crewai import Task
 from .tools.candlestick_chart_tool import IndianCandlestickChartSearchTool
 
 
+# Names of the report tasks, in the order the sequential crew runs them
+TASK_NAMES = [
+    "scrape",
+    "fundamentals",
+    "chart_search",
+    "chart_interpret",
+    "candles_fetch",
+    "technicals",
+    "news",
+    "summary",
+]
+
+# Independent branches of the report. Tasks inside a branch run in order; the
+# branches don't read each other's output, so they can run concurrently and
+# only the final summary task waits for all of them.
+BRANCHES = {
+    "scraper": ["scrape"],
+    "fundamentals": ["fundamentals"],
+    "chart": ["chart_search", "chart_interpret"],
+    "candles": ["candles_fetch", "technicals"],
+    "news": ["news"],
+}
+FINAL_TASK = "summary"
+
+
 def get_tasks(company_name: str, stock_ticker: str, agents: dict):
+    return list(get_task_graph(company_name, stock_ticker, agents).values())
+
+
+def get_task_graph(company_name: str, stock_ticker: str, agents: dict) -> dict:
+    """Report tasks keyed by TASK_NAMES, in sequential order."""
     csv_path = f"{company_name.lower().replace(' ', '_')}_candles_angel.csv"
     chart_search_tool = IndianCandlestickChartSearchTool()
     
@@ -41,7 +71,7 @@ def get_tasks(company_name: str, stock_ticker: str, agents: dict):
         agent=agents["chart_analysis_agent"]
     )
 
-    return [
+    tasks = [
         Task(
             description=f"Scrape the Yahoo Finance page for {company_name} and extract price, volume, P/E ratio, and company summary.",
     expected_output=f"Raw scraped stock data for {company_name}.",
@@ -119,4 +149,6 @@ Task(
     output_file=os.path.join("Reports", f"{company_name.lower().replace(' ', '_')}.md")
 )
 
-    ]
\ No newline at end of file
+    ]
+
+    return dict(zip(TASK_NAMES, tasks))
@@ -0,0 +1,164 @@
+import os
+import json
+import time
+import base64
+import threading
+from dotenv import load_dotenv
+from SmartApi.smartConnect import SmartConnect
+import pyotp
+from ..concurrency import provider_slot
+
+load_dotenv()
+
+# -------- CONFIG --------
+# Refresh the JWT this many seconds before it expires
+REFRESH_MARGIN = int(os.getenv("ANGELONE_REFRESH_MARGIN", "300"))
+# Used when the JWT carries no readable "exp" claim
+FALLBACK_TTL = int(os.getenv("ANGELONE_SESSION_TTL", str(6 * 60 * 60)))
+# Minimum gap between two full logins, to stay under broker rate limits
+MIN_LOGIN_INTERVAL = float(os.getenv("ANGELONE_MIN_LOGIN_INTERVAL", "5"))
+
+# Error codes Angel One returns when the JWT is no longer accepted
+TOKEN_ERROR_CODES = {"AG8001", "AG8002", "AG8003", "AB1010", "AB8050", "AB8051"}
+# Session messages seen without one of the codes above ("Invalid symboltoken" is not one of them)
+TOKEN_ERROR_MESSAGES = ("invalid token", "token expired", "token is expired", "invalid session", "session expired")
+
+
+def _jwt_expiry(jwt_token: str):
+    """Reads the "exp" claim from a JWT without verifying it. Returns None if unreadable."""
+    try:
+        token = jwt_token.split(" ", 1)[-1]
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload)).get("exp"))
+    except Exception:
+        return None
+
+
+def is_token_error(response) -> bool:
+    """True if a SmartAPI response says the session is invalid or expired."""
+    if not isinstance(response, dict) or response.get("status", True):
+        return False
+    code = str(response.get("errorcode") or "")
+    message = str(response.get("message") or "").lower()
+    return code in TOKEN_ERROR_CODES or any(m in message for m in TOKEN_ERROR_MESSAGES)
+
+
+class AngelOneSession:
+    """
+    Process-wide Angel One SmartAPI session.
+
+    Logs in once, shares the authenticated SmartConnect client across calls and
+    threads, and refreshes the JWT shortly before it expires. Re-login is
+    serialized behind a lock so concurrent callers wait for a single login
+    instead of each hitting the broker.
+    """
+
+    def __init__(self, api_key: str = None, client_id: str = None,
+                 password: str = None, totp_secret: str = None):
+        self.api_key = api_key or os.getenv("ANGELONE_API_KEY")
+        self.client_id = client_id or os.getenv("CLIENT_ID")
+        self.password = password or os.getenv("PASSWORD")
+        self.totp_secret = totp_secret or os.getenv("TOTP_SECRET")
+
+        self._lock = threading.Lock()
+        self._client = None
+        self._refresh_token = None
+        self._expires_at = 0.0
+        self._last_login = 0.0
+        self.login_count = 0
+        self.refresh_count = 0
+
+    def _valid(self) -> bool:
+        return self._client is not None and time.time() < self._expires_at - REFRESH_MARGIN
+
+    def _set_tokens(self, data: dict):
+        jwt_token = data["jwtToken"]
+        self._refresh_token = data.get("refreshToken", self._refresh_token)
+        self._expires_at = _jwt_expiry(jwt_token) or (time.time() + FALLBACK_TTL)
+
+    def _login(self):
+        wait = self._last_login + MIN_LOGIN_INTERVAL - time.time()
+        if wait > 0:
+            time.sleep(wait)
+
+        totp = pyotp.TOTP(self.totp_secret).now()
+        obj = SmartConnect(api_key=self.api_key)
+        data = obj.generateSession(self.client_id, self.password, totp)
+        self._last_login = time.time()
+
+        if not data or not data.get("data") or "jwtToken" not in data["data"]:
+            raise RuntimeError("Login failed. Check credentials or TOTP.")
+
+        obj.getfeedToken()
+        self._client = obj
+        self._set_tokens(data["data"])
+        self.login_count += 1
+        print(f"🔐 Angel One login ok (session valid until {time.ctime(self._expires_at)})")
+
+    def _refresh(self) -> bool:
+        """Renews the JWT with the refresh token. Returns False if a full login is needed."""
+        if self._client is None or not self._refresh_token:
+            return False
+        try:
+            data = self._client.generateToken(self._refresh_token)
+        except Exception as e:
+            print(f"⚠️ Angel One token refresh failed: {e}")
+            return False
+        if not data or not data.get("data") or "jwtToken" not in data["data"]:
+            return False
+        self._client.setAccessToken(data["data"]["jwtToken"])
+        self._set_tokens(data["data"])
+        self.refresh_count += 1
+        return True
+
+    def client(self) -> SmartConnect:
+        """Returns an authenticated SmartConnect client, logging in or refreshing if needed."""
+        if self._valid():
+            return self._client
+        with self._lock:
+            # Another thread may have logged in while we waited for the lock
+            if not self._valid():
+                if not self._refresh():
+                    self._login()
+            return self._client
+
+    def invalidate(self, client: SmartConnect = None):
+        """
+        Marks the session as expired so the next caller logs in again.
+        Pass the client that failed so a session renewed meanwhile isn't dropped.
+        """
+        with self._lock:
+            if client is None or client is self._client:
+                self._expires_at = 0.0
+                self._refresh_token = None
+
+    def call(self, method: str, *args, **kwargs):
+        """
+        Calls a SmartConnect method on the shared client, retrying once with a
+        fresh session if the broker rejects the token.
+        """
+        obj = self.client()
+        with provider_slot("angelone"):
+            response = getattr(obj, method)(*args, **kwargs)
+        if is_token_error(response):
+            print(f"🔁 Angel One rejected the session on {method}, logging in again...")
+            self.invalidate(obj)
+            obj = self.client()
+            with provider_slot("angelone"):
+                response = getattr(obj, method)(*args, **kwargs)
+        return response
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> AngelOneSession:
+    """Returns the process-wide Angel One session."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = AngelOneSession()
+    return _session
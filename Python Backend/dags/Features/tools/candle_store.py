@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+candle_store.py
+
+Columnar candle storage (Parquet via pyarrow) with typed columns.
+
+Layout:
+    <root>/symbol=<SYMBOL>/interval=<INTERVAL>/date=<YYYY-MM-DD>/part-<ns>.parquet
+
+- append() splits a DataFrame by trading day and writes one part file per day
+- read() loads a time range with partition pruning on `date` and a row filter
+  on `timestamp` pushed down into the Parquet scan
+- compact() merges a day's part files into one, de-duplicating on timestamp
+
+Usage:
+    python -m dags.Features.tools.candle_store import <file.csv> --symbol SBIN --interval ONE_MINUTE
+
+Dependencies:
+    pip install pyarrow pandas
+"""
+
+import os
+import time
+import argparse
+import threading
+import datetime as dt
+from typing import Optional, List, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# -------- CONFIG --------
+# Shared with the legacy CSV readers so both resolve to the same files whatever the CWD
+TOOLS_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Tools_Data")
+STORE_DIR = os.getenv("CANDLE_STORE_DIR", os.path.join(TOOLS_DATA_DIR, "candle_store"))
+MARKET_TZ = "Asia/Kolkata"
+# Merge a day's part files once it has more than this many
+MAX_PARTS_PER_DAY = int(os.getenv("CANDLE_STORE_MAX_PARTS", "32"))
+
+SCHEMA = pa.schema([
+    ("timestamp", pa.timestamp("ns", tz=MARKET_TZ)),
+    ("open", pa.float64()),
+    ("high", pa.float64()),
+    ("low", pa.float64()),
+    ("close", pa.float64()),
+    ("volume", pa.int64()),
+    ("RSI", pa.float64()),
+    ("MACD", pa.float64()),
+    ("MACD_signal", pa.float64()),
+    ("MACD_hist", pa.float64()),
+    ("Doji", pa.float64()),
+])
+COLUMNS = SCHEMA.names
+
+# Bar length per Angel One interval
+INTERVAL_STEPS = {
+    "ONE_MINUTE": dt.timedelta(minutes=1),
+    "FIVE_MINUTE": dt.timedelta(minutes=5),
+    "FIFTEEN_MINUTE": dt.timedelta(minutes=15),
+    "ONE_HOUR": dt.timedelta(hours=1),
+    "ONE_DAY": dt.timedelta(days=1),
+}
+
+
+def _to_market_time(ts: pd.Series) -> pd.Series:
+    if not pd.api.types.is_datetime64_any_dtype(ts):
+        # Text or mixed-offset values: parse through UTC so offsets are honoured
+        ts = pd.to_datetime(ts, utc=True)
+    if ts.dt.tz is None:
+        return ts.dt.tz_localize(MARKET_TZ)
+    return ts.dt.tz_convert(MARKET_TZ)
+
+
+def _as_timestamp(value) -> pd.Timestamp:
+    value = pd.Timestamp(value)
+    if value.tzinfo is None:
+        return value.tz_localize(MARKET_TZ)
+    return value.tz_convert(MARKET_TZ)
+
+
+def infer_interval(timestamps: pd.Series) -> Optional[str]:
+    """Interval whose bar length matches the spacing of `timestamps`, or None when it is unclear."""
+    ts = pd.Series(_to_market_time(timestamps).dropna().unique()).sort_values(ignore_index=True)
+    days = ts.dt.normalize()
+    intraday = ts.diff()[days == days.shift()]
+    if intraday.empty:
+        return "ONE_DAY" if len(ts) > 1 else None
+    step = intraday.min()
+    if (intraday % step != pd.Timedelta(0)).any():
+        return None
+    return next((name for name, length in INTERVAL_STEPS.items() if length == step), None)
+
+
+class CandleStore:
+    """Parquet candle store partitioned by symbol, interval and trading day."""
+
+    def __init__(self, root: str = STORE_DIR):
+        self.root = root
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._high_water_marks = {}
+
+    # -------- paths --------
+    def _series_dir(self, symbol: str, interval: str) -> str:
+        return os.path.join(self.root, f"symbol={symbol.upper()}", f"interval={interval.upper()}")
+
+    def _day_dir(self, symbol: str, interval: str, day: str) -> str:
+        return os.path.join(self._series_dir(symbol, interval), f"date={day}")
+
+    def _lock(self, symbol: str, interval: str) -> threading.Lock:
+        key = (symbol.upper(), interval.upper())
+        with self._locks_guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def days(self, symbol: str, interval: str) -> List[str]:
+        """Trading days stored for a series, oldest first."""
+        series_dir = self._series_dir(symbol, interval)
+        if not os.path.isdir(series_dir):
+            return []
+        return sorted(
+            name.split("=", 1)[1] for name in os.listdir(series_dir)
+            if name.startswith("date=") and os.listdir(os.path.join(series_dir, name))
+        )
+
+    def _parts(self, day_dir: str) -> List[str]:
+        return sorted(
+            os.path.join(day_dir, name) for name in os.listdir(day_dir) if name.endswith(".parquet")
+        )
+
+    # -------- write --------
+    def _to_table(self, df: pd.DataFrame) -> pa.Table:
+        df = df.reindex(columns=COLUMNS).copy()
+        df["timestamp"] = _to_market_time(df["timestamp"])
+        df["volume"] = pd.to_numeric(df["volume"], errors="coerce").fillna(0).astype("int64")
+        return pa.Table.from_pandas(df, schema=SCHEMA, preserve_index=False, safe=False)
+
+    def _write_part(self, day_dir: str, table: pa.Table):
+        os.makedirs(day_dir, exist_ok=True)
+        name = f"part-{time.time_ns()}.parquet"
+        path = os.path.join(day_dir, name)
+        # Leading underscore keeps half-written files out of dataset scans
+        tmp_path = os.path.join(day_dir, f"_{name}.tmp")
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, path)
+
+    def append(self, symbol: str, interval: str, df: pd.DataFrame, dedupe: bool = True) -> int:
+        """
+        Appends candles to the store, one part file per trading day.
+        With dedupe, rows before the stored high-water mark are dropped; a row at
+        the mark replaces the stored bar, which may have been written while still forming.
+        Returns the number of rows written.
+        """
+        if df is None or df.empty:
+            return 0
+        with self._lock(symbol, interval):
+            df = df.copy()
+            df["timestamp"] = _to_market_time(df["timestamp"])
+            df = df.sort_values("timestamp").drop_duplicates(subset="timestamp", keep="last")
+            if dedupe:
+                hwm = self._last_timestamp(symbol, interval)
+                if hwm is not None:
+                    df = df[df["timestamp"] >= hwm]
+            if df.empty:
+                return 0
+
+            for day, day_df in df.groupby(df["timestamp"].dt.strftime("%Y-%m-%d"), sort=True):
+                day_dir = self._day_dir(symbol, interval, day)
+                self._write_part(day_dir, self._to_table(day_df))
+                if len(self._parts(day_dir)) > MAX_PARTS_PER_DAY:
+                    self._compact_day(day_dir)
+
+            key = (symbol.upper(), interval.upper())
+            latest = df["timestamp"].max()
+            if self._high_water_marks.get(key) is None or latest > self._high_water_marks[key]:
+                self._high_water_marks[key] = latest
+            return len(df)
+
+    def _compact_day(self, day_dir: str):
+        parts = self._parts(day_dir)
+        if len(parts) <= 1:
+            return
+        table = pa.concat_tables([pq.read_table(p, schema=SCHEMA) for p in parts])
+        df = table.to_pandas()
+        df = df.drop_duplicates(subset="timestamp", keep="last").sort_values("timestamp")
+        self._write_part(day_dir, pa.Table.from_pandas(df, schema=SCHEMA, preserve_index=False))
+        for p in parts:
+            os.remove(p)
+
+    def compact(self, symbol: str, interval: str, day: Optional[str] = None):
+        """Merges part files for one day, or for every stored day when day is None."""
+        with self._lock(symbol, interval):
+            for d in ([day] if day else self.days(symbol, interval)):
+                day_dir = self._day_dir(symbol, interval, d)
+                if os.path.isdir(day_dir):
+                    self._compact_day(day_dir)
+
+    # -------- read --------
+    def _last_timestamp(self, symbol: str, interval: str):
+        key = (symbol.upper(), interval.upper())
+        if key not in self._high_water_marks:
+            hwm = None
+            days = self.days(symbol, interval)
+            if days:
+                day_dir = self._day_dir(symbol, interval, days[-1])
+                ts = pa.concat_tables(
+                    [pq.read_table(p, columns=["timestamp"], schema=SCHEMA) for p in self._parts(day_dir)]
+                ).column("timestamp")
+                if len(ts):
+                    hwm = pd.Timestamp(pc.max(ts).as_py()).tz_convert(MARKET_TZ)
+            self._high_water_marks[key] = hwm
+        return self._high_water_marks[key]
+
+    def last_timestamp(self, symbol: str, interval: str):
+        """Newest stored bar for a series, or None. Only the latest day partition is read."""
+        with self._lock(symbol, interval):
+            return self._last_timestamp(symbol, interval)
+
+    def read(self, symbol: str, interval: str, start=None, end=None,
+             columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Loads candles with start <= timestamp <= end (both optional) as a typed DataFrame.
+        Day partitions outside the range are pruned before any file is opened.
+        """
+        # Compaction removes part files, so scans hold the series lock
+        with self._lock(symbol, interval):
+            return self._read(symbol, interval, start, end, columns)
+
+    def _read(self, symbol: str, interval: str, start=None, end=None,
+              columns: Optional[List[str]] = None) -> pd.DataFrame:
+        days = self.days(symbol, interval)
+        if not days:
+            return pd.DataFrame({name: pd.Series(dtype=field.type.to_pandas_dtype())
+                                 for name, field in zip(COLUMNS, SCHEMA)}).reindex(columns=columns or COLUMNS)
+
+        series_dir = self._series_dir(symbol, interval)
+        dataset = ds.dataset(
+            series_dir,
+            schema=SCHEMA.append(pa.field("date", pa.string())),
+            format="parquet",
+            partitioning=ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive"),
+        )
+
+        condition = None
+        if start is not None:
+            start = _as_timestamp(start)
+            condition = (ds.field("date") >= start.strftime("%Y-%m-%d")) & (ds.field("timestamp") >= start)
+        if end is not None:
+            end = _as_timestamp(end)
+            end_cond = (ds.field("date") <= end.strftime("%Y-%m-%d")) & (ds.field("timestamp") <= end)
+            condition = end_cond if condition is None else condition & end_cond
+
+        table = dataset.to_table(columns=columns or COLUMNS, filter=condition)
+        df = table.to_pandas()
+        if "timestamp" in df.columns:
+            df = df.drop_duplicates(subset="timestamp", keep="last").sort_values("timestamp")
+        return df.reset_index(drop=True)
+
+    def tail(self, symbol: str, interval: str, n_rows: int) -> pd.DataFrame:
+        """Loads the newest n_rows bars, reading day partitions from the newest backwards."""
+        frames, count = [], 0
+        with self._lock(symbol, interval):
+            for day in reversed(self.days(symbol, interval)):
+                day_dir = self._day_dir(symbol, interval, day)
+                df = pa.concat_tables([pq.read_table(p, schema=SCHEMA) for p in self._parts(day_dir)]).to_pandas()
+                frames.append(df)
+                count += len(df)
+                if count >= n_rows:
+                    break
+            if not frames:
+                return self._read(symbol, interval)
+        df = pd.concat(frames[::-1], ignore_index=True)
+        df = df.drop_duplicates(subset="timestamp", keep="last").sort_values("timestamp")
+        return df.tail(n_rows).reset_index(drop=True)
+
+    # -------- migration --------
+    def import_csv(self, path: str, symbol: str, interval: Optional[str] = None) -> Tuple[Optional[str], int]:
+        """
+        Loads a legacy <company>_candles_angel.csv into the store. The filename carries
+        no interval, so by default it is inferred from the bar spacing; the file is
+        skipped when that is unclear or the inferred series is already stored.
+        Returns the interval used (None when skipped) and the number of rows written.
+        """
+        df = pd.read_csv(path, parse_dates=["timestamp"])
+        if interval is None:
+            interval = infer_interval(df["timestamp"])
+            if interval is None:
+                print(f"⚠️ Skipping {path}: can't tell its candle interval from the timestamps")
+                return None, 0
+            if self.last_timestamp(symbol, interval) is not None:
+                return interval, 0
+        written = self.append(symbol, interval, df, dedupe=False)
+        self.compact(symbol, interval)
+        return interval, written
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_candle_store() -> CandleStore:
+    """Returns the process-wide candle store."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = CandleStore()
+    return _store
+
+
+# -------- CLI --------
+def parse_args():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    imp = sub.add_parser("import", help="Import legacy candle CSVs into the store")
+    imp.add_argument("paths", nargs="+")
+    imp.add_argument("--symbol", required=True)
+    imp.add_argument("--interval", default=None, help="Defaults to the interval inferred from the bar spacing")
+
+    comp = sub.add_parser("compact", help="Merge part files of a series")
+    comp.add_argument("--symbol", required=True)
+    comp.add_argument("--interval", default="ONE_MINUTE")
+    return ap.parse_args()
+
+
+def main():
+    args = parse_args()
+    store = get_candle_store()
+    if args.command == "import":
+        for path in args.paths:
+            interval, written = store.import_csv(path, args.symbol, args.interval)
+            print(f"[store] {path} -> {args.symbol}/{interval}: {written} rows")
+    elif args.command == "compact":
+        store.compact(args.symbol, args.interval)
+        print(f"[store] compacted {args.symbol}/{args.interval}")
+
+
+if __name__ == "__main__":
+    main()
@@ -24,6 +24,7 @@ from crewai_tools.tools import SerperDevTool
 
 
 from crewai.tools import BaseTool
+from ..concurrency import provider_slot
 
 class IndianCandlestickChartSearchTool(BaseTool):
     name: str = "Indian Candlestick Chart Search Tool"
@@ -42,7 +43,8 @@ class IndianCandlestickChartSearchTool(BaseTool):
                 f"{query} candlestick chart site:tradingview.com OR site:moneycontrol.com OR site:investing.com"
             )
 
-            results = tool._run(query=search_query)  # ✅ Fixed: keyword argument
+            with provider_slot("serper"):
+                results = tool._run(query=search_query)  # ✅ Fixed: keyword argument
 
             if not isinstance(results, dict) or "organic" not in results or not results["organic"]:
                 return f"❌ No chart found for {query}. Try a more specific stock name or symbol."
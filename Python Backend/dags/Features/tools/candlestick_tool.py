@@ -19,127 +19,319 @@ def _new_request(self, *args, **kwargs):
 
 requests.Session.request = _new_request
 from crewai.tools import BaseTool
+import threading
+from typing import NamedTuple
 import pandas as pd
 import datetime as dt
-from SmartApi.smartConnect import SmartConnect
-import pyotp
 import pandas_ta as ta
 from dotenv import load_dotenv
 from Utils.cloudinary import upload_csv_to_cloudinary
+from Utils.blocking import run_blocking, submit_blocking
+from .angel_session import get_session
+from .scrip_master import get_scrip_master
+from .candle_store import get_candle_store, MARKET_TZ, INTERVAL_STEPS, TOOLS_DATA_DIR
 import os
 
 
-class AngelOneCandlestickTool(BaseTool):
-    name: str = "AngelOneCandlestickTool"
-    description: str = "Fetches historical candlestick data for Indian stocks using Angel One SmartAPI and saves to CSV."
-
-    def _run(self, company_name: str, stock_name: str, exchange: str = "NSE",
-             from_date: str = None, to_date: str = None, interval: str = "ONE_MINUTE") -> str:
-        try:
-            today = dt.datetime.now()
-
-            interval = interval.upper()
-            valid_intervals = {"ONE_MINUTE", "FIVE_MINUTE", "FIFTEEN_MINUTE", "ONE_HOUR", "ONE_DAY"}
-            if interval not in valid_intervals:
-                return f"❌ Invalid interval '{interval}'. Choose from {valid_intervals}."
-
-            from_date = (today - dt.timedelta(days=7)).strftime("%Y-%m-%d 09:15")
-            to_date = today.strftime("%Y-%m-%d %H:%M")
-                
-
-            # Step 2: Setup credentials & login
-            load_dotenv()
-            API_KEY = os.getenv("ANGELONE_API_KEY")
-            CLIENT_ID = os.getenv("CLIENT_ID")
-            PASSWORD = os.getenv("PASSWORD")
-            TOTP_SECRET = os.getenv("TOTP_SECRET")
-
-            totp = pyotp.TOTP(TOTP_SECRET).now()
-            obj = SmartConnect(api_key=API_KEY)
-            data = obj.generateSession(CLIENT_ID, PASSWORD, totp)
+OUTPUT_DIR = os.path.join(TOOLS_DATA_DIR, "candlestick_data")
+CANDLE_COLUMNS = ["timestamp", "open", "high", "low", "close", "volume"]
+INDICATOR_COLUMNS = ['RSI', 'MACD', 'MACD_signal', 'MACD_hist', 'Doji']
 
-            if not data.get("data") or "jwtToken" not in data["data"]:
-                return "❌ Login failed. Check credentials or TOTP."
-
-            obj.getfeedToken()
-
-            # Step 3: Find token
-            search_result = obj.searchScrip(exchange, stock_name.upper())
-            if not search_result or 'data' not in search_result or not search_result['data']:
-                return f"❌ Could not find token for stock: {stock_name}"
-
-            target_symbol = f"{stock_name.upper()}-EQ"
-            stock_eq = next(
-                (item for item in search_result['data'] if item['tradingsymbol'].upper() == target_symbol),
-                None
-            )
-
-            if not stock_eq:
-                return f"❌ Exact trading symbol '{target_symbol}' not found in search results."
+# Stored bars re-read as warm-up so RSI/MACD on new bars continue from history
+WARMUP_ROWS = int(os.getenv("CANDLE_WARMUP_ROWS", "200"))
+# How much of the CSV export's end is scanned for bars being rewritten
+CSV_TAIL_BYTES = 64 * 1024
 
-            print(f"DEBUG: Found exact symbol: {stock_eq['tradingsymbol']}, token: {stock_eq['symboltoken']}")
-            print(f"REQUEST DATES => From: {from_date}, To: {to_date}, Interval: {interval}")
+# Last Cloudinary URL per CSV, returned when a poll brings no new bars
+_last_cloud_urls = {}
+# CSVs with a background upload queued but not started yet
+_pending_uploads = set()
+_pending_uploads_lock = threading.Lock()
+_sync_locks = {}
+_sync_locks_guard = threading.Lock()
 
-            # Step 4: Request candle data
-            historical_params = {
-                "exchange": exchange,
-                "symboltoken": stock_eq['symboltoken'],
-                "interval": interval,
-                "fromdate": from_date,
-                "todate": to_date
-            }
 
-            response = obj.getCandleData(historical_params)
-            candles = response.get('data', [])
+class CandleFetchError(Exception):
+    """Candles could not be fetched; the message is the user-facing error string."""
 
-            if not candles:
-                return "❌ No candle data received."
 
-            df = pd.DataFrame(candles, columns=["timestamp", "open", "high", "low", "close", "volume"])
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
+class SyncResult(NamedTuple):
+    filename: str
+    symbol: str
+    interval: str
+    status: str  # "unchanged", "updated" or "created"
 
-            for col in ['open', 'high', 'low', 'close', 'volume']:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-            df = df.dropna(subset=['open', 'high', 'low', 'close', 'volume'])
 
+def add_indicators(df: pd.DataFrame) -> pd.DataFrame:
+    df['RSI'] = ta.momentum.rsi(df['close'], length=14)
+    macd = ta.momentum.macd(df['close'])
+    df['MACD'] = macd['MACD_12_26_9']
+    df['MACD_signal'] = macd['MACDs_12_26_9']
+    df['MACD_hist'] = macd['MACDh_12_26_9']
+    df['Doji'] = ta.candles.cdl_doji(df['open'], df['high'], df['low'], df['close'])
 
-            # Check data length first
-            if len(df) < 35:
-                return f" Not enough data ({len(df)} rows) to compute indicators like MACD and RSI."
+    # Fill any NaNs that may appear at the start
+    df[INDICATOR_COLUMNS] = df[INDICATOR_COLUMNS].fillna(0)
+    return df
 
-            df['RSI'] = ta.momentum.rsi(df['close'], length=14)
-            macd = ta.momentum.macd(df['close'])
-            df['MACD'] = macd['MACD_12_26_9']
-            df['MACD_signal'] = macd['MACDs_12_26_9']
-            df['MACD_hist'] = macd['MACDh_12_26_9']
-            df['Doji'] = ta.candles.cdl_doji(df['open'], df['high'], df['low'], df['close'])
-
-            # Fill any NaNs that may appear at the start
-            df[['RSI', 'MACD', 'MACD_signal', 'MACD_hist', 'Doji']] = df[['RSI', 'MACD', 'MACD_signal', 'MACD_hist', 'Doji']].fillna(0)
 
+class AngelOneCandlestickTool(BaseTool):
+    name: str = "AngelOneCandlestickTool"
+    description: str = "Fetches historical candlestick data for Indian stocks using Angel One SmartAPI and saves to CSV."
 
+    def _run(self, company_name: str, stock_name: str, exchange: str = "NSE",
+             from_date: str = None, to_date: str = None, interval: str = "ONE_MINUTE",
+             incremental: bool = True) -> str:
+        try:
+            result = self._sync(company_name, stock_name, exchange, interval, incremental)
+            if result.status == "created":
+                return f"✅ Saved candlestick + indicator data to new file: {result.filename}"
+            return self._publish(result.filename, force=result.status == "updated")
+        except CandleFetchError as e:
+            return str(e)
+        except Exception as e:
+            return f"❌ Error fetching candlestick data: {str(e)}"
 
-            output_dir = "dags/Features/tools/Tools_Data/candlestick_data"
-            os.makedirs(output_dir, exist_ok=True)  # ensure the folder exists
-            filename = os.path.join(output_dir, f"{company_name.lower().replace(' ', '_')}_candles_angel.csv")
+    def fetch_dataframe(self, company_name: str, stock_name: str, exchange: str = "NSE",
+                        interval: str = "ONE_MINUTE", lookback: int = 500,
+                        upload: str = "background") -> pd.DataFrame:
+        """
+        Brings the candle store up to date and returns the newest `lookback` bars
+        as a typed DataFrame, without a Cloudinary round trip.
+
+        upload: "sync" uploads the CSV before returning, "background" uploads it on
+        the blocking pool after returning, "skip" leaves Cloudinary untouched.
+        Raises CandleFetchError when the broker data can't be fetched.
+        """
+        result = self.sync(company_name, stock_name, exchange, interval, upload)
+        return get_candle_store().tail(result.symbol, result.interval, lookback)
+
+    def sync(self, company_name: str, stock_name: str, exchange: str = "NSE",
+             interval: str = "ONE_MINUTE", upload: str = "background") -> SyncResult:
+        """
+        Brings the candle store up to date without reading it back, for callers
+        that only need new bars (result.status is "unchanged" when there are none).
+        `upload` works as in fetch_dataframe; raises CandleFetchError likewise.
+        """
+        result = self._sync(company_name, stock_name, exchange, interval, incremental=True)
+        changed = result.status != "unchanged"
+        if upload == "sync":
+            self._publish(result.filename, force=changed)
+        elif upload == "background" and changed:
+            self._publish_in_background(result.filename)
+        return result
+
+    def _sync(self, company_name: str, stock_name: str, exchange: str,
+              interval: str, incremental: bool) -> SyncResult:
+        """
+        Fetches new bars from Angel One into the candle store and the CSV export.
+        Returns which file was touched and whether it is unchanged, updated or created.
+        """
+        # One sync per company at a time, so concurrent callers don't append the same bars twice
+        with _sync_locks_guard:
+            lock = _sync_locks.setdefault(company_name.lower(), threading.Lock())
+        with lock:
+            return self._sync_unlocked(company_name, stock_name, exchange, interval, incremental)
+
+    def _sync_unlocked(self, company_name: str, stock_name: str, exchange: str,
+                       interval: str, incremental: bool) -> SyncResult:
+        today = dt.datetime.now()
+
+        interval = interval.upper()
+        valid_intervals = set(INTERVAL_STEPS)
+        if interval not in valid_intervals:
+            raise CandleFetchError(f"❌ Invalid interval '{interval}'. Choose from {valid_intervals}.")
+
+        os.makedirs(OUTPUT_DIR, exist_ok=True)  # ensure the folder exists
+        filename = os.path.join(OUTPUT_DIR, f"{company_name.lower().replace(' ', '_')}_candles_angel.csv")
+
+        window_start = today - dt.timedelta(days=7)
+        from_date = window_start.strftime("%Y-%m-%d 09:15")
+        to_date = today.strftime("%Y-%m-%d %H:%M")
+
+        # Incremental mode: ask for bars from the high-water mark in the candle store onwards.
+        # The newest stored bar is fetched again because it may still have been forming.
+        store = get_candle_store()
+        symbol = stock_name.upper()
+        history = None
+        high_water_mark = None
+        if incremental and os.path.exists(filename) and os.path.getsize(filename) > 0:
+            if store.last_timestamp(symbol, interval) is None:
+                # One-time migration of the legacy CSV, filed under the interval its bars are spaced at
+                store.import_csv(filename, symbol)
+            high_water_mark = store.last_timestamp(symbol, interval)
+            if high_water_mark is not None:
+                history = store.tail(symbol, interval, WARMUP_ROWS)
+                if high_water_mark.replace(tzinfo=None) > window_start:
+                    from_date = high_water_mark.strftime("%Y-%m-%d %H:%M")
+
+        # Step 2: Reuse the shared broker session (logs in only when needed)
+        session = get_session()
+        try:
+            session.client()
+        except RuntimeError:
+            raise CandleFetchError("❌ Login failed. Check credentials or TOTP.")
 
+        # Step 3: Find token (local instrument master first, searchScrip as fallback)
+        target_symbol = f"{stock_name.upper()}-EQ"
+        scrip_master = get_scrip_master()
+        try:
+            symbol_token = scrip_master.resolve(exchange, target_symbol)
+        except Exception as e:
+            print(f"⚠️ Instrument master unavailable, falling back to searchScrip: {e}")
+            symbol_token = None
 
-            # === Check if file exists and append new data ===
-            if os.path.exists(filename):
-                existing_df = pd.read_csv(filename, parse_dates=['timestamp'])
-                combined_df = pd.concat([existing_df, df], ignore_index=True)
-                combined_df.drop_duplicates(subset='timestamp', keep='last', inplace=True)
-                combined_df.sort_values(by='timestamp', inplace=True)
-                combined_df.to_csv(filename, index=False)
-                cloud_url = upload_csv_to_cloudinary(filename, folder="candlestick_patterns")
+        if not symbol_token:
+            search_result = session.call("searchScrip", exchange, stock_name.upper())
+            if not search_result or 'data' not in search_result or not search_result['data']:
+                raise CandleFetchError(f"❌ Could not find token for stock: {stock_name}")
 
-                return f"{cloud_url}"
-            else:
-                df.to_csv(filename, index=False)
-                return f"✅ Saved candlestick + indicator data to new file: {filename}"
+            stock_eq = next(
+                (item for item in search_result['data'] if item['tradingsymbol'].upper() == target_symbol),
+                None
+            )
 
-        except Exception as e:
-            return f"❌ Error fetching candlestick data: {str(e)}"
+            if not stock_eq:
+                raise CandleFetchError(f"❌ Exact trading symbol '{target_symbol}' not found in search results.")
+
+            symbol_token = stock_eq['symboltoken']
+            scrip_master.remember(exchange, target_symbol, symbol_token)
+
+        print(f"DEBUG: Found exact symbol: {target_symbol}, token: {symbol_token}")
+        print(f"REQUEST DATES => From: {from_date}, To: {to_date}, Interval: {interval}")
+
+        # Step 4: Request candle data
+        historical_params = {
+            "exchange": exchange,
+            "symboltoken": symbol_token,
+            "interval": interval,
+            "fromdate": from_date,
+            "todate": to_date
+        }
+
+        response = session.call("getCandleData", historical_params)
+        candles = response.get('data', [])
+
+        if not candles:
+            if high_water_mark is not None:
+                return SyncResult(filename, symbol, interval, "unchanged")
+            raise CandleFetchError("❌ No candle data received.")
+
+        df = pd.DataFrame(candles, columns=CANDLE_COLUMNS)
+        df['timestamp'] = pd.to_datetime(df['timestamp'], utc=True).dt.tz_convert(MARKET_TZ)
+
+        for col in ['open', 'high', 'low', 'close', 'volume']:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+        df = df.dropna(subset=['open', 'high', 'low', 'close', 'volume'])
+
+        if high_water_mark is not None:
+            # Rewrite the last stored bar and append newer ones, warming indicators up on the stored tail
+            df = df[df['timestamp'] >= high_water_mark]
+            if df.empty or self._same_as_stored(df, history):
+                return SyncResult(filename, symbol, interval, "unchanged")
+
+            warmup = history[history['timestamp'] < df['timestamp'].min()]
+            combined = pd.concat([warmup[CANDLE_COLUMNS], df], ignore_index=True)
+            if len(combined) < 35:
+                raise CandleFetchError(f" Not enough data ({len(combined)} rows) to compute indicators like MACD and RSI.")
+
+            new_rows = add_indicators(combined).iloc[len(warmup):]
+            store.append(symbol, interval, new_rows)
+
+            # Keep the CSV export (Cloudinary, RAG ingestion) in step with the store
+            self._replace_csv_tail(filename, new_rows)
+            print(f"➕ Wrote {len(new_rows)} bars from {new_rows['timestamp'].min()} to {symbol} {interval}")
+            return SyncResult(filename, symbol, interval, "updated")
+
+        # Check data length first
+        if len(df) < 35:
+            raise CandleFetchError(f" Not enough data ({len(df)} rows) to compute indicators like MACD and RSI.")
+
+        df = add_indicators(df)
+        store.append(symbol, interval, df)
+
+        # === Check if file exists and merge new data ===
+        if os.path.exists(filename):
+            existing_df = pd.read_csv(filename, parse_dates=['timestamp'])
+            combined_df = pd.concat([existing_df, df], ignore_index=True)
+            combined_df.drop_duplicates(subset='timestamp', keep='last', inplace=True)
+            combined_df.sort_values(by='timestamp', inplace=True)
+            combined_df.to_csv(filename, index=False)
+            return SyncResult(filename, symbol, interval, "updated")
+        else:
+            df.to_csv(filename, index=False)
+            return SyncResult(filename, symbol, interval, "created")
+
+    @staticmethod
+    def _same_as_stored(df: pd.DataFrame, history: pd.DataFrame) -> bool:
+        """True when the broker returned only the last stored bar, with the same OHLCV."""
+        if len(df) != 1 or history.empty:
+            return False
+        fetched, stored = df.iloc[0], history.iloc[-1]
+        return fetched['timestamp'] == stored['timestamp'] and all(
+            fetched[col] == stored[col] for col in ['open', 'high', 'low', 'close', 'volume']
+        )
+
+    @staticmethod
+    def _replace_csv_tail(filename: str, rows: pd.DataFrame):
+        """Drops trailing CSV lines at or after the first of `rows` (normally just the last bar), then appends `rows`."""
+        csv_columns = pd.read_csv(filename, nrows=0).columns
+        ts_index = list(csv_columns).index('timestamp')
+        cutoff = rows['timestamp'].min()
+        with open(filename, "rb+") as f:
+            size = f.seek(0, os.SEEK_END)
+            offset = max(0, size - CSV_TAIL_BYTES)
+            f.seek(offset)
+            lines = f.read().splitlines(keepends=True)
+            if offset > 0:
+                lines = lines[1:]  # may start mid-line
+            keep = size
+            for line in reversed(lines):
+                fields = line.decode("utf-8").rstrip("\r\n").split(",")
+                try:
+                    ts = pd.Timestamp(fields[ts_index])
+                except (IndexError, ValueError):
+                    break  # header or unparsable line
+                if pd.isna(ts):
+                    break
+                if ts.tzinfo is None:
+                    ts = ts.tz_localize(MARKET_TZ)
+                if ts < cutoff:
+                    break
+                keep -= len(line)
+            f.truncate(keep)
+        rows.reindex(columns=csv_columns).to_csv(filename, mode="a", header=False, index=False)
+
+    async def _arun(self, company_name: str, stock_name: str, exchange: str = "NSE",
+                    from_date: str = None, to_date: str = None, interval: str = "ONE_MINUTE",
+                    incremental: bool = True) -> str:
+        return await run_blocking(
+            self._run, company_name, stock_name, exchange,
+            from_date=from_date, to_date=to_date, interval=interval, incremental=incremental
+        )
+
+    def _publish(self, filename: str, force: bool = False) -> str:
+        """Uploads the CSV to Cloudinary, reusing the last URL when nothing changed."""
+        if not force and filename in _last_cloud_urls:
+            return _last_cloud_urls[filename]
+        cloud_url = upload_csv_to_cloudinary(filename, folder="candlestick_patterns")
+        if cloud_url.startswith("http"):
+            _last_cloud_urls[filename] = cloud_url
+        return f"{cloud_url}"
+
+    def _publish_in_background(self, filename: str):
+        """Queues a Cloudinary upload, skipping it if one for the same file is still pending."""
+        with _pending_uploads_lock:
+            if filename in _pending_uploads:
+                return
+            _pending_uploads.add(filename)
+
+        def upload():
+            with _pending_uploads_lock:
+                _pending_uploads.discard(filename)
+            self._publish(filename, force=True)
+
+        submit_blocking(upload)
 
 if __name__ == "__main__":
     tool = AngelOneCandlestickTool()
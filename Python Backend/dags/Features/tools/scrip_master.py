@@ -0,0 +1,156 @@
+import os
+import time
+import sqlite3
+import threading
+import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# -------- CONFIG --------
+SCRIP_MASTER_URL = os.getenv(
+    "ANGELONE_SCRIP_MASTER_URL",
+    "https://margincalculator.angelbroking.com/OpenAPI_File/files/OpenAPIScripMaster.json",
+)
+# Next to the module (as in candle_store.py), so the DAG, the app and scripts share one index
+INDEX_PATH = os.getenv(
+    "ANGELONE_SCRIP_INDEX",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "Tools_Data", "scrip_master.sqlite"),
+)
+# Re-download the instrument master once it is older than this
+MAX_AGE = int(os.getenv("ANGELONE_SCRIP_MAX_AGE", str(24 * 60 * 60)))
+# Wait this long before retrying a failed download (the previous index keeps serving meanwhile)
+RETRY_AFTER = int(os.getenv("ANGELONE_SCRIP_RETRY_AFTER", "600"))
+# (connect, read) timeout for the master download
+DOWNLOAD_TIMEOUT = (10, float(os.getenv("ANGELONE_SCRIP_TIMEOUT", "60")))
+
+
+class ScripMaster:
+    """
+    Symbol -> token resolver backed by Angel One's instrument master.
+
+    The master JSON is downloaded at most once per MAX_AGE and stored as a
+    compact SQLite index on disk. Lookups are served from an in-memory dict
+    that is filled per exchange from the index, so resolving a symbol needs
+    no network round trip.
+    """
+
+    def __init__(self, index_path: str = INDEX_PATH, url: str = SCRIP_MASTER_URL, max_age: int = MAX_AGE):
+        self.index_path = index_path
+        self.url = url
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._tokens = {}          # exchange -> {tradingsymbol: token}
+        self._extra = {}           # (exchange, tradingsymbol) -> token, found outside the master
+        self._loaded_at = 0.0
+        self._failed_at = 0.0
+
+    # -------- index build --------
+    def _stale(self) -> bool:
+        if not os.path.exists(self.index_path):
+            return True
+        return time.time() - os.path.getmtime(self.index_path) > self.max_age
+
+    def refresh(self):
+        """Downloads the instrument master and rebuilds the on-disk index."""
+        print(f"⬇️ Downloading Angel One instrument master from {self.url}")
+        # Session.send, not requests.get: the tools patch Session.request to force timeout=None
+        with requests.Session() as session:
+            prepared = session.prepare_request(requests.Request("GET", self.url))
+            response = session.send(prepared, timeout=DOWNLOAD_TIMEOUT)
+        response.raise_for_status()
+        instruments = response.json()
+
+        rows = [
+            (
+                item.get("exch_seg", "").upper(),
+                item.get("symbol", "").upper(),
+                item.get("name", ""),
+                str(item.get("token", "")),
+            )
+            for item in instruments
+            if item.get("symbol") and item.get("token")
+        ]
+
+        os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+        tmp_path = self.index_path + ".tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        conn = sqlite3.connect(tmp_path)
+        try:
+            conn.execute(
+                "CREATE TABLE instruments ("
+                "exchange TEXT NOT NULL, tradingsymbol TEXT NOT NULL, name TEXT, token TEXT NOT NULL, "
+                "PRIMARY KEY (exchange, tradingsymbol)) WITHOUT ROWID"
+            )
+            conn.executemany("INSERT OR REPLACE INTO instruments VALUES (?, ?, ?, ?)", rows)
+            conn.commit()
+        finally:
+            conn.close()
+        os.replace(tmp_path, self.index_path)
+
+        self._tokens = {}
+        print(f"✅ Indexed {len(rows)} instruments into {self.index_path}")
+
+    def _ensure_fresh(self):
+        if not self._stale() and self._loaded_at:
+            return
+        if time.time() - self._failed_at < RETRY_AFTER:
+            if not os.path.exists(self.index_path):
+                raise RuntimeError("instrument master download failed recently")
+            return  # stale index keeps serving until the retry window passes
+        with self._lock:
+            if self._stale() and time.time() - self._failed_at >= RETRY_AFTER:
+                try:
+                    self.refresh()
+                    self._failed_at = 0.0
+                except Exception as e:
+                    self._failed_at = time.time()
+                    if not os.path.exists(self.index_path):
+                        raise
+                    # Keep serving the previous index and retry after RETRY_AFTER, not a full MAX_AGE
+                    print(f"⚠️ Instrument master refresh failed, using cached index: {e}")
+            self._loaded_at = time.time()
+
+    def _load_exchange(self, exchange: str) -> dict:
+        with self._lock:
+            if exchange not in self._tokens:
+                conn = sqlite3.connect(self.index_path)
+                try:
+                    cur = conn.execute(
+                        "SELECT tradingsymbol, token FROM instruments WHERE exchange = ?", (exchange,)
+                    )
+                    self._tokens[exchange] = dict(cur.fetchall())
+                finally:
+                    conn.close()
+            return self._tokens[exchange]
+
+    # -------- lookups --------
+    def resolve(self, exchange: str, tradingsymbol: str):
+        """Returns the symbol token for an exact trading symbol (e.g. 'SBIN-EQ'), or None."""
+        key = (exchange.upper(), tradingsymbol.upper())
+        if key in self._extra:
+            return self._extra[key]
+        self._ensure_fresh()
+        tokens = self._tokens.get(key[0])
+        if tokens is None:
+            tokens = self._load_exchange(key[0])
+        return tokens.get(key[1])
+
+    def remember(self, exchange: str, tradingsymbol: str, token: str):
+        """Adds a token found by other means (e.g. searchScrip) to the in-memory index."""
+        self._extra[(exchange.upper(), tradingsymbol.upper())] = str(token)
+
+
+_scrip_master = None
+_scrip_master_lock = threading.Lock()
+
+
+def get_scrip_master() -> ScripMaster:
+    """Returns the process-wide instrument master resolver."""
+    global _scrip_master
+    if _scrip_master is None:
+        with _scrip_master_lock:
+            if _scrip_master is None:
+                _scrip_master = ScripMaster()
+    return _scrip_master
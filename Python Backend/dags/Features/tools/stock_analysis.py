@@ -23,6 +23,7 @@ from crewai.tools import BaseTool
 import os
 import requests
 from dotenv import load_dotenv
+from Utils.blocking import run_blocking
 
 load_dotenv()
 
@@ -74,7 +75,7 @@ class IndianStockTool(BaseTool):
             return f"❌ Failed to fetch data: {str(e)}"
 
     async def _arun(self, query: str) -> str:
-        return self._run(query)
+        return await run_blocking(self._run, query)
 
 # Optional test run:
 if __name__ == "__main__":
@@ -27,6 +27,8 @@ import pandas as pd
 from dotenv import load_dotenv
 from textblob import TextBlob
 from Utils.cloudinary import upload_csv_to_cloudinary
+from Utils.blocking import run_blocking
+from ..concurrency import provider_slot
 
 load_dotenv()
 
@@ -50,7 +52,8 @@ class IndianStockNewsTool(BaseTool):
         }
 
         try:
-            response = requests.get(url, params=params)
+            with provider_slot("newsapi"):
+                response = requests.get(url, params=params)
             articles = response.json().get("articles", [])
 
             if not articles:
@@ -89,7 +92,7 @@ class IndianStockNewsTool(BaseTool):
             return f"❌ Error fetching or saving news: {str(e)}"
 
     async def _arun(self, query: str) -> str:
-        return self._run(query)
+        return await run_blocking(self._run, query)
 
 
 # if __name__ == "__main__":
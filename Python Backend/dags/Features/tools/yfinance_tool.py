@@ -25,6 +25,7 @@ import yfinance as yf
 import pandas as pd
 import os
 from Utils.cloudinary import upload_csv_to_cloudinary
+from Utils.blocking import run_blocking
 
 class YFinanceFundamentalsTool(BaseTool):
     name: str = "Yahoo Finance Fundamentals Tool"
@@ -92,7 +93,7 @@ class YFinanceFundamentalsTool(BaseTool):
             return f"❌ Error fetching data for {symbol}: {str(e)}"
 
     async def _arun(self, symbol: str) -> str:
-        return self._run(symbol)
+        return await run_blocking(self._run, symbol)
 
 
 # Debug/testing
@@ -22,47 +22,140 @@ requests.Session.request = _new_request
 # --- Now import CrewAI ---
 from crewai import Crew, Process
 from dags.Features.agents import get_agents
-from dags.Features.tasks import get_tasks
+from dags.Features.tasks import get_task_graph, BRANCHES, FINAL_TASK
 from qualifire import client
 import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from Utils.final_datasets import generate_final_dataset
 from Utils.cloudinary import upload_md_to_cloudinary
+from dags.Features.concurrency import JobCancelled
 
 QUALIFIRE_API_KEY = os.getenv("QUALIFIRE_API_KEY")
+# "dag" runs the independent task branches concurrently and then the summary;
+# "sequential" runs every task one after another in a single crew
+EXECUTION_MODE = os.getenv("REPORT_EXECUTION_MODE", "dag")
 
 company_name = "RELIANCE"
 stock_ticker = "RELIANCE.NSE"
 
-def run(company_name: str = company_name, stock_ticker: str = stock_ticker) -> str:
-    agents = get_agents(company_name, stock_ticker)
-    tasks = get_tasks(company_name, stock_ticker, agents)
+def _notify(on_progress, stage: str, **info):
+    if on_progress is not None:
+        on_progress(stage, info)
+
 
-    crew = Crew(
-        agents=list(agents.values()),
+def _crew(agents: list, tasks: list, task_callback) -> Crew:
+    return Crew(
+        agents=agents,
         tasks=tasks,
         process=Process.sequential,
         use_mcp=True,
-        telemetry=False
+        telemetry=False,
+        task_callback=task_callback
     )
 
+
+def _kickoff_dag(graph: dict, inputs: dict, task_callback, on_progress=None):
+    """
+    Runs each branch of independent tasks as its own crew, all branches at
+    once, then the summary task with the branches' last outputs as context.
+    Per-provider caps (dags.Features.concurrency) keep the parallel branches
+    within Gemini, Serper, NewsAPI and Angel One limits.
+    """
+    branches = {name: [graph[t] for t in names] for name, names in BRANCHES.items()}
+
+    # An agent runs one task at a time, so branches that share one get their own copy
+    claimed = set()
+    for tasks in branches.values():
+        local = {}
+        for task in tasks:
+            original = task.agent
+            if id(original) not in local:
+                local[id(original)] = original.copy() if id(original) in claimed else original
+            task.agent = local[id(original)]
+        claimed.update(local)
+
+    def run_branch(name: str, tasks: list):
+        started = time.time()
+        agents = list({id(t.agent): t.agent for t in tasks}.values())
+        _crew(agents, tasks, task_callback).kickoff(inputs)
+        _notify(on_progress, "branch_finished", branch=name, seconds=round(time.time() - started, 2))
+
+    with ThreadPoolExecutor(max_workers=len(branches), thread_name_prefix="crew-branch") as pool:
+        futures = {pool.submit(run_branch, name, tasks): name for name, tasks in branches.items()}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except JobCancelled:
+                raise
+            except Exception as e:
+                # A failed branch leaves a gap in the report instead of sinking it
+                print(f"❌ Branch '{futures[future]}' failed: {e}")
+                _notify(on_progress, "branch_failed", branch=futures[future], error=str(e))
+
+    summary = graph[FINAL_TASK]
+    summary.context = [tasks[-1] for tasks in branches.values() if tasks[-1].output is not None]
+    return _crew([summary.agent], [summary], task_callback).kickoff(inputs)
+
+
+def run(company_name: str = company_name, stock_ticker: str = stock_ticker, on_progress=None,
+        mode: str = None) -> str:
+    """
+    Runs the report crew and uploads the Markdown report.
+    on_progress(stage, info), if given, is called as each step finishes.
+    mode: "dag" or "sequential" (defaults to REPORT_EXECUTION_MODE).
+    """
+    mode = mode or EXECUTION_MODE
+    agents = get_agents(company_name, stock_ticker)
+    graph = get_task_graph(company_name, stock_ticker, agents)
+    tasks = list(graph.values())
+    completed = []
+    completed_lock = threading.Lock()
+
+    def task_done(output):
+        with completed_lock:
+            completed.append(output)
+            index = len(completed)
+        _notify(
+            on_progress, "task_completed",
+            index=index, total=len(tasks),
+            agent=str(getattr(output, "agent", "")),
+            summary=getattr(output, "summary", None),
+        )
+
+    inputs = {
+        "query": f"Fetch stock insights for {company_name} ({stock_ticker})",
+        "company_name": company_name,
+        "stock_ticker": stock_ticker,
+    }
+    _notify(on_progress, "crew_started", total=len(tasks), mode=mode)
+
     try:
-        result = crew.kickoff({
-    "query": f"Fetch stock insights for {company_name} ({stock_ticker})",
-    "company_name": company_name,
-    "stock_ticker": stock_ticker,
-})
+        if mode == "dag":
+            result = _kickoff_dag(graph, inputs, task_done, on_progress)
+        else:
+            result = _crew(list(agents.values()), tasks, task_done).kickoff(inputs)
 
         print("\n📝 Final Output:\n", result)
+    except JobCancelled:
+        raise
     except Exception as e:
         import traceback
         print("❌ Unhandled CrewAI Error:", str(e))
         traceback.print_exc()
         return "ERROR: CrewAI kickoff failed"
 
+    _notify(on_progress, "crew_finished")
+
     try:
-        generate_final_dataset(company_name.lower().replace(" ", "_"))
+        generate_final_dataset(
+            company_name.lower().replace(" ", "_"),
+            symbol=stock_ticker.split(".")[0],
+        )
     except Exception as e:
         print(f"❌ Error generating final dataset CSV: {e}")
+    _notify(on_progress, "dataset_ready")
 
     try:
         q = client.Client(api_key=QUALIFIRE_API_KEY)
@@ -88,6 +181,7 @@ def run(company_name: str = company_name, stock_ticker: str = stock_ticker) -> s
             print("📄 Saved evaluation results to qualifire_eval_report.json")
     except Exception as e:
         print(f"❌ Qualifire evaluation failed: {e}")
+    _notify(on_progress, "evaluated")
 
     md_file_path = f"./Reports/{company_name.lower().replace(' ', '_')}.md"
     
@@ -100,6 +194,7 @@ def run(company_name: str = company_name, stock_ticker: str = stock_ticker) -> s
     except Exception as e:
         print(f"❌ Upload to Cloudinary failed: {e}")
         md_cloud_url = None
+    _notify(on_progress, "uploaded", report_url=md_cloud_url)
 
     return md_cloud_url
 
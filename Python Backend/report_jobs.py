@@ -0,0 +1,279 @@
+# report_jobs.py
+import os
+import json
+import time
+import uuid
+import threading
+import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+from dotenv import load_dotenv
+from dags.Features.concurrency import JobCancelled
+
+load_dotenv()
+
+# -------- CONFIG --------
+# Reports generated at the same time; each one is a full CrewAI run
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "2"))
+# Jobs waiting or running before new submissions are refused
+MAX_PENDING_JOBS = int(os.getenv("REPORT_MAX_PENDING", "20"))
+# A job still running after this many seconds is marked as timed out
+REPORT_JOB_TIMEOUT = float(os.getenv("REPORT_JOB_TIMEOUT", str(30 * 60)))
+# Finished jobs stay queryable for this long
+JOB_RETENTION = float(os.getenv("REPORT_JOB_RETENTION", str(24 * 60 * 60)))
+CACHE_PATH = os.getenv(
+    "REPORT_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "Reports", "report_cache.json"),
+)
+MARKET_TZ = ZoneInfo("Asia/Kolkata")
+
+FINISHED = {"succeeded", "failed", "timed_out"}
+
+# (company, ticker, trading day)
+JobKey = Tuple[str, str, str]
+
+
+class QueueFull(Exception):
+    pass
+
+
+def trading_day() -> str:
+    return dt.datetime.now(MARKET_TZ).strftime("%Y-%m-%d")
+
+
+def job_key(company_name: str, stock_ticker: str, day: Optional[str] = None) -> JobKey:
+    return (company_name.strip().lower(), stock_ticker.strip().upper(), day or trading_day())
+
+
+class ReportJob:
+    """One report generation request and its progress events."""
+
+    def __init__(self, key: JobKey, company_name: str, stock_ticker: str):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.company_name = company_name
+        self.stock_ticker = stock_ticker
+        self.status = "queued"
+        self.cached = False
+        self.report_url = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.events: List[dict] = []
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def deadline(self) -> Optional[float]:
+        return self.started_at + REPORT_JOB_TIMEOUT if self.started_at else None
+
+    def emit(self, stage: str, info: Optional[dict] = None):
+        with self._lock:
+            self.events.append({"seq": len(self.events), "time": time.time(), "stage": stage, **(info or {})})
+
+    def progress(self, stage: str, info: dict):
+        """Progress hook handed to the report pipeline; aborts the run once the job timed out."""
+        self.emit(stage, info)
+        if self.expired():
+            raise JobCancelled(f"Report job exceeded {REPORT_JOB_TIMEOUT:.0f}s")
+
+    def finish(self, status: str, report_url: str = None, error: str = None):
+        with self._lock:
+            if self.status in FINISHED:
+                return
+            self.status, self.report_url, self.error = status, report_url, error
+            self.finished_at = time.time()
+        self.emit(status, {"report_url": report_url, "error": error})
+        self._done.set()
+
+    def expired(self) -> bool:
+        """Marks a running job as timed out once it passes its deadline."""
+        deadline = self.deadline
+        if self.status == "running" and deadline is not None and time.time() > deadline:
+            self.finish("timed_out", error=f"Report job exceeded {REPORT_JOB_TIMEOUT:.0f}s")
+        return self.status == "timed_out"
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._done.wait(timeout)
+
+    def events_since(self, seq: int) -> List[dict]:
+        with self._lock:
+            return self.events[seq:]
+
+    def to_dict(self) -> dict:
+        self.expired()
+        return {
+            "job_id": self.id,
+            "company": self.company_name,
+            "stock_ticker": self.stock_ticker,
+            "trading_day": self.key[2],
+            "status": self.status,
+            "cached": self.cached,
+            "report_url": self.report_url,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": self.events[-1] if self.events else None,
+        }
+
+
+def _default_runner(company_name: str, stock_ticker: str, on_progress: Callable) -> str:
+    from main import run
+    return run(company_name, stock_ticker, on_progress=on_progress)
+
+
+class ReportJobQueue:
+    """
+    Runs report generation with at most `max_workers` jobs at a time.
+
+    A running crew can't be killed, so a job that passes its deadline is marked
+    timed out and its slot goes to the next job; the stray run stops at its next
+    progress callback. Identical (company, ticker, trading day) requests share one in-flight job,
+    and a report that already succeeded today is served from a small on-disk
+    cache instead of running the crew again.
+    """
+
+    def __init__(self, runner: Callable = _default_runner, max_workers: int = REPORT_WORKERS,
+                 max_pending: int = MAX_PENDING_JOBS, cache_path: str = CACHE_PATH):
+        self.runner = runner
+        self.max_pending = max_pending
+        self.cache_path = cache_path
+        # Slots bound the concurrency; the extra threads let queued jobs start while timed-out runs wind down
+        self._slots = threading.Semaphore(max_workers)
+        self._holding = set()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers + max_pending, thread_name_prefix="report-job")
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, ReportJob] = {}
+        self._in_flight: Dict[JobKey, ReportJob] = {}
+        self._cache = self._load_cache()
+
+    # -------- result cache --------
+    def _load_cache(self) -> dict:
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_cache(self):
+        # Only today's entries can ever hit again
+        today = trading_day()
+        self._cache = {k: v for k, v in self._cache.items() if k.endswith(f"|{today}")}
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._cache, f, indent=2)
+        os.replace(tmp_path, self.cache_path)
+
+    # -------- jobs --------
+    def _prune(self):
+        cutoff = time.time() - JOB_RETENTION
+        for job_id in [j.id for j in self._jobs.values() if j.finished_at and j.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def submit(self, company_name: str, stock_ticker: str) -> Tuple[ReportJob, bool]:
+        """
+        Returns (job, is_new). An identical request in flight or a cached
+        report for today returns an existing or already finished job.
+        """
+        key = job_key(company_name, stock_ticker)
+        cache_key = "|".join(key)
+        with self._lock:
+            self._prune()
+
+            cached = self._cache.get(cache_key)
+            if cached:
+                job = ReportJob(key, company_name, stock_ticker)
+                job.cached = True
+                job.started_at = cached.get("finished_at")
+                job.finish("succeeded", report_url=cached["report_url"])
+                self._jobs[job.id] = job
+                return job, False
+
+            job = self._in_flight.get(key)
+            if job is not None and not job.expired():
+                return job, False
+
+            pending = sum(1 for j in self._in_flight.values() if j.status not in FINISHED)
+            if pending >= self.max_pending:
+                raise QueueFull(f"{pending} report jobs already pending, try again later")
+
+            job = ReportJob(key, company_name, stock_ticker)
+            self._jobs[job.id] = job
+            self._in_flight[key] = job
+
+        job.emit("queued")
+        self._executor.submit(self._execute, job)
+        return job, True
+
+    def _release(self, job: ReportJob):
+        """Frees the job's slot and in-flight entry; safe to call more than once."""
+        with self._lock:
+            if job.id in self._holding:
+                self._holding.discard(job.id)
+                self._slots.release()
+            if self._in_flight.get(job.key) is job:
+                del self._in_flight[job.key]
+
+    def _watchdog(self, job: ReportJob):
+        if job.expired():
+            print(f"⏱️ Report job {job.id} timed out, releasing its worker slot")
+            self._release(job)
+
+    def _execute(self, job: ReportJob):
+        self._slots.acquire()
+        with self._lock:
+            self._holding.add(job.id)
+        # started_at first: a concurrent expired() must never see "running" without a deadline
+        with job._lock:
+            job.started_at = time.time()
+            job.status = "running"
+        job.emit("running")
+        watchdog = threading.Timer(REPORT_JOB_TIMEOUT + 1, self._watchdog, args=(job,))
+        watchdog.daemon = True
+        watchdog.start()
+        try:
+            report_url = self.runner(job.company_name, job.stock_ticker, job.progress)
+            if not report_url or str(report_url).startswith("ERROR"):
+                job.finish("failed", error=report_url or "Report upload failed")
+            else:
+                job.finish("succeeded", report_url=report_url)
+                with self._lock:
+                    self._cache["|".join(job.key)] = {"report_url": report_url, "finished_at": job.finished_at}
+                    self._save_cache()
+        except JobCancelled as e:
+            job.finish("timed_out", error=str(e))
+        except Exception as e:
+            print(f"❌ Report job {job.id} failed: {e}")
+            job.finish("failed", error=str(e))
+        finally:
+            watchdog.cancel()
+            self._release(job)
+
+    def get(self, job_id: str) -> Optional[ReportJob]:
+        return self._jobs.get(job_id)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_report_queue() -> ReportJobQueue:
+    """Returns the process-wide report job queue."""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = ReportJobQueue()
+    return _queue
+
+
+def shutdown_report_queue():
+    if _queue is not None:
+        _queue.shutdown()
@@ -0,0 +1,6 @@
+"""Puts the backend root on sys.path so tests import modules as `dags.Features...` and `Utils...`."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
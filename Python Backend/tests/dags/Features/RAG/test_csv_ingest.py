@@ -0,0 +1,77 @@
+"""Tests for CSV chunking and content-addressed chunk ids in the ingestion script."""
+
+import csv
+import importlib.util
+import io
+import os
+import pytest
+
+pytest.importorskip("chromadb")
+
+SCRIPT = os.path.join(os.path.dirname(__file__), "..", "..", "..", "..",
+                      "dags", "Features", "RAG", "ingestion", "02_csv_ingest_embed.py")
+
+
+@pytest.fixture(scope="module")
+def ingest():
+    spec = importlib.util.spec_from_file_location("csv_ingest_embed", os.path.abspath(SCRIPT))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def write_csv(path, rows, header=("date", "headline")):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+    return str(path)
+
+
+def test_chunks_end_on_row_boundaries(ingest, tmp_path):
+    rows = [(f"2025-01-{i:02d}", f"headline {i}, with a comma") for i in range(1, 31)]
+    path = write_csv(tmp_path / "acme_news.csv", rows)
+    chunks = list(ingest.iter_csv_chunks(path, "acme", "news", max_chars=200))
+
+    assert len(chunks) > 1
+    seen = []
+    for chunk in chunks:
+        parsed = list(csv.reader(io.StringIO(chunk["text"])))
+        assert parsed[0] == ["date", "headline"]
+        meta = chunk["metadata"]
+        assert meta["source"] == "acme_news.csv"
+        assert meta["row_end"] - meta["row_index"] + 1 == len(parsed) - 1
+        seen.extend(tuple(r) for r in parsed[1:])
+    assert seen == rows
+
+
+def test_long_row_gets_its_own_chunk(ingest, tmp_path):
+    path = write_csv(tmp_path / "acme_news.csv", [("d1", "x" * 500), ("d2", "short")])
+    chunks = list(ingest.iter_csv_chunks(path, "acme", "news", max_chars=100))
+    assert [c["metadata"]["row_index"] for c in chunks] == [0, 1]
+
+
+def test_empty_file_yields_nothing(ingest, tmp_path):
+    path = tmp_path / "acme_news.csv"
+    path.write_text("")
+    assert ingest.csv_to_chunks(str(path), "acme", "news") == []
+
+
+def test_chunk_ids_are_stable_and_unique(ingest):
+    chunks = [{"text": "same"}, {"text": "other"}, {"text": "same"}]
+    ids = ingest.assign_chunk_ids(chunks, "acme_news.csv")
+    assert len(ids) == 3
+    assert chunks[2]["id"] == chunks[0]["id"] + "_1"
+    again = [{"text": "same"}, {"text": "other"}, {"text": "same"}]
+    assert ingest.assign_chunk_ids(again, "acme_news.csv") == ids
+
+
+def test_chunk_ids_differ_between_source_files(ingest):
+    a = ingest.assign_chunk_ids([{"text": "shared header and rows"}], "acme_news.csv")
+    b = ingest.assign_chunk_ids([{"text": "shared header and rows"}], "Acme_news.csv")
+    assert not set(a) & set(b)
+
+
+def test_parse_filename(ingest):
+    assert ingest.parse_filename("Reliance_balance_sheet.csv") == {"company": "reliance", "doc_type": "balance_sheet"}
+    assert ingest.parse_filename("infy.csv") == {"company": "infy", "doc_type": "unknown"}
@@ -0,0 +1,148 @@
+"""Tests for scoped retrieval: metadata filters, partitions and the result cache."""
+
+import time
+import pytest
+
+from dags.Features.RAG.retrieval import (
+    ResultCache, Retriever, build_where, bump_generations, normalize_text, partition_name,
+)
+
+
+class FakeCollection:
+    """Just enough of a Chroma collection: equality / $in / $and filters over stored metadata."""
+
+    def __init__(self, docs):
+        self.docs = docs          # [(text, metadata)]
+        self.queries = []
+
+    @staticmethod
+    def _match(meta, where):
+        if not where:
+            return True
+        if "$and" in where:
+            return all(FakeCollection._match(meta, w) for w in where["$and"])
+        (field, value), = where.items()
+        return meta.get(field) in value["$in"] if isinstance(value, dict) else meta.get(field) == value
+
+    def get(self, include, limit, offset):
+        return {"metadatas": [m for _, m in self.docs][offset:offset + limit]}
+
+    def query(self, n_results, where=None, query_texts=None, query_embeddings=None):
+        self.queries.append(where)
+        hits = [(t, m) for t, m in self.docs if self._match(m, where)][:n_results]
+        return {"documents": [[t for t, _ in hits]], "metadatas": [[m for _, m in hits]]}
+
+
+DOCS = [
+    ("tata news", {"company": "tata_motors", "doc_type": "news"}),
+    ("tata ratios", {"company": "tata_motors", "doc_type": "ratios"}),
+    ("infy ratios", {"company": "infy", "doc_type": "ratios"}),
+]
+
+
+@pytest.fixture
+def gens_path(tmp_path):
+    return str(tmp_path / "generations.json")
+
+
+def make_retriever(gens_path, docs=DOCS, **kwargs):
+    collection = FakeCollection(docs)
+    retriever = Retriever(lambda: collection, cache=ResultCache(generations_path=gens_path),
+                          company_collections=False, **kwargs)
+    return retriever, collection
+
+
+def test_build_where():
+    assert build_where() is None
+    assert build_where(["a"]) == {"company": "a"}
+    assert build_where(["b", "a"]) == {"company": {"$in": ["a", "b"]}}
+    assert build_where(["a"], ["news"]) == {"$and": [{"company": "a"}, {"doc_type": "news"}]}
+
+
+def test_partition_name_is_chroma_safe():
+    assert partition_name("Tata Motors") == "stock_data__tata-motors"
+    assert len(partition_name("x" * 100)) <= 63
+
+
+def test_normalize_text():
+    assert normalize_text("Tata_Motors / M&M, Q2!") == "tata motors m&m q2"
+
+
+def test_extract_filters(gens_path):
+    retriever, _ = make_retriever(gens_path)
+    filters = retriever.extract_filters("Latest news on Tata Motors and NSE:INFY")
+    assert filters == {"companies": ["infy", "tata_motors"], "doc_types": ["news"]}
+
+
+def test_search_widens_when_scope_is_empty(gens_path):
+    retriever, collection = make_retriever(gens_path)
+    chunks = retriever.search("infy news", filters={"companies": ["infy"], "doc_types": ["news"]})
+    assert [c["text"] for c in chunks] == ["infy ratios"]
+    assert collection.queries == [
+        {"$and": [{"company": "infy"}, {"doc_type": "news"}]},
+        {"company": "infy"},
+    ]
+
+
+def test_search_is_cached_until_company_generation_moves(gens_path):
+    retriever, collection = make_retriever(gens_path)
+    filters = {"companies": ["infy"], "doc_types": []}
+    retriever.search("infy", filters=filters)
+    retriever.search("  INFY ", filters=filters)
+    assert len(collection.queries) == 1
+
+    bump_generations(["tata_motors"], gens_path)
+    time.sleep(0.01)
+    retriever.search("infy", filters=filters)
+    # The global generation moved, but this result only depends on infy
+    assert len(collection.queries) == 1
+
+    bump_generations(["infy"], gens_path)
+    time.sleep(0.01)
+    retriever.search("infy", filters=filters)
+    assert len(collection.queries) == 2
+
+
+def test_result_cache_rejects_result_from_before_a_bump(gens_path):
+    cache = ResultCache(generations_path=gens_path)
+    before = cache.generations()
+    bump_generations(["infy"], gens_path)      # lands while the search runs
+    cache.put("k", ["stale"], ("infy",), 0.1, before)
+    assert cache.get("k") is None
+    assert cache.stats()["invalidated"] == 1
+
+
+def test_result_cache_ttl_and_lru(gens_path):
+    cache = ResultCache(max_entries=2, ttl=60, generations_path=gens_path)
+    gens = cache.generations()
+    for key in ("a", "b", "c"):
+        cache.put(key, [key], None, 0.0, gens)
+    assert cache.get("a") is None and cache.get("c") == ["c"]
+    assert cache.stats()["evicted"] == 1
+
+    short = ResultCache(ttl=0, generations_path=gens_path)
+    short.put("k", ["v"], None, 0.0, short.generations())
+    time.sleep(0.01)
+    assert short.get("k") is None
+
+
+def test_missing_partition_is_retried_after_vocabulary_refresh(gens_path):
+    partition = FakeCollection([("infy only", {"company": "infy", "doc_type": "ratios"})])
+
+    class Client:
+        built = False
+
+        def get_collection(self, name):
+            if not self.built:
+                raise ValueError(name)
+            return partition
+
+    client = Client()
+    retriever = Retriever(lambda: FakeCollection(DOCS), lambda: client, company_collections=True,
+                          cache=ResultCache(generations_path=gens_path))
+
+    assert retriever._partition("infy") is None
+    client.built = True
+    assert retriever._partition("infy") is None     # negative entry still cached
+    retriever._reload_vocabulary()
+    assert retriever._partition("infy") is partition
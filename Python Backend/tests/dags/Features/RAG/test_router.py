@@ -0,0 +1,85 @@
+"""Tests for the local retrieve / no-retrieve router."""
+
+import time
+
+from dags.Features.RAG.router import QueryRouter
+
+
+def make_router(companies=("Tata Motors", "Reliance"), **kwargs):
+    return QueryRouter(load_companies=lambda: list(companies), **kwargs)
+
+
+def test_known_company_retrieves():
+    decision = make_router().route("How is tata motors doing?")
+    assert decision.retrieve and decision.source == "rules"
+    assert "tata motors" in decision.reason
+
+
+def test_ticker_retrieves():
+    assert make_router().route("Compare INFY.NS with peers").retrieve
+
+
+def test_conceptual_question_skips_retrieval():
+    decision = make_router().route("What is a price to earnings ratio?")
+    assert not decision.retrieve and decision.source == "rules"
+
+
+def test_dated_question_retrieves():
+    assert make_router().route("Latest news for the auto sector").retrieve
+
+
+def test_low_confidence_defers_to_fallback():
+    asked = []
+
+    def fallback(query):
+        asked.append(query)
+        return False
+
+    decision = make_router().route("tell me something", fallback=fallback)
+    assert asked == ["tell me something"]
+    assert decision.source == "llm" and not decision.retrieve
+
+
+def test_stats_count_decisions():
+    router = make_router()
+    router.route("How is reliance doing?")
+    router.route("tell me something", fallback=lambda q: True)
+    stats = router.stats()
+    assert (stats["queries"], stats["rule_decisions"], stats["llm_fallbacks"]) == (2, 1, 1)
+    assert stats["known_companies"] == 2
+
+
+def test_failed_load_keeps_previous_companies():
+    loads = []
+
+    def load():
+        loads.append(1)
+        if len(loads) > 1:
+            raise RuntimeError("store offline")
+        return ["Infosys"]
+
+    router = QueryRouter(load_companies=load, refresh_seconds=0)
+    assert router.companies() == {"infosys"}
+    router.companies()
+    time.sleep(0.1)
+    assert router.companies() == {"infosys"}
+
+
+def test_refresh_runs_in_background_and_serves_previous_set():
+    loads = []
+
+    def load():
+        loads.append(1)
+        if len(loads) > 1:
+            time.sleep(0.3)
+            return ["Infosys", "Wipro"]
+        return ["Infosys"]
+
+    router = QueryRouter(load_companies=load, refresh_seconds=0.01)
+    assert router.companies() == {"infosys"}
+    time.sleep(0.02)
+    started = time.perf_counter()
+    assert router.companies() == {"infosys"}
+    assert time.perf_counter() - started < 0.1
+    time.sleep(0.5)
+    assert "wipro" in router.companies()
@@ -0,0 +1,73 @@
+"""Tests for the persistent LLM response cache."""
+
+import datetime as dt
+import pytest
+
+from dags.Features import llm_cache
+from dags.Features.llm_cache import LLMCache, cache_key, market_ttl, MARKET_TZ
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return LLMCache(path=str(tmp_path / "llm_cache.sqlite"))
+
+
+def test_market_ttl_in_session():
+    monday_noon = dt.datetime(2025, 1, 6, 12, 0, tzinfo=MARKET_TZ)
+    assert market_ttl(monday_noon) == llm_cache.INTRADAY_TTL
+
+
+def test_market_ttl_after_friday_close_lasts_until_monday_open():
+    friday_evening = dt.datetime(2025, 1, 10, 18, 0, tzinfo=MARKET_TZ)
+    monday_open = dt.datetime(2025, 1, 13, 9, 15, tzinfo=MARKET_TZ)
+    assert market_ttl(friday_evening) == (monday_open - friday_evening).total_seconds()
+
+
+def test_cache_key_ignores_dict_order_but_not_inputs():
+    a = cache_key("m", 0.2, [{"role": "user", "content": "hi"}])
+    b = cache_key("m", 0.2, [{"content": "hi", "role": "user"}])
+    assert a == b
+    assert a != cache_key("m", 0.7, [{"role": "user", "content": "hi"}])
+    assert a != cache_key("m", 0.2, [{"role": "user", "content": "hi"}], tools=[{"name": "t"}])
+
+
+def test_put_get_and_expiry(cache):
+    cache.put("fresh", "m", "answer", ttl=60)
+    cache.put("stale", "m", "old answer", ttl=-1)
+    assert cache.get("fresh") == "answer"
+    assert cache.get("stale") is None
+    assert cache.get("missing") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 2)
+
+
+def test_cached_call_runs_once(cache):
+    calls = []
+
+    def call():
+        calls.append(1)
+        return "response"
+
+    messages = [{"role": "user", "content": "q"}]
+    assert cache.cached_call("m", 0.0, messages, call, ttl=60) == "response"
+    assert cache.cached_call("m", 0.0, messages, call, ttl=60) == "response"
+    assert len(calls) == 1
+
+
+def test_cached_call_skips_empty_responses(cache):
+    messages = [{"role": "user", "content": "q"}]
+    cache.cached_call("m", 0.0, messages, lambda: "", ttl=60)
+    assert cache.get(cache_key("m", 0.0, messages)) is None
+
+
+def test_evict_drops_least_recently_used(tmp_path):
+    cache = LLMCache(path=str(tmp_path / "small.sqlite"), max_bytes=100)
+    for i in range(4):
+        cache.put(f"k{i}", "m", "x" * 40, ttl=60)
+        # Distinct access times, oldest first
+        cache._conn().execute("UPDATE responses SET last_access = ? WHERE key = ?", (i, f"k{i}"))
+    cache._conn().commit()
+    cache.evict()
+    assert cache.get("k0") is None and cache.get("k1") is None
+    assert cache.get("k3") == "x" * 40
+    assert cache.stats()["size_bytes"] <= 90
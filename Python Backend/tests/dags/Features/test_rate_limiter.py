@@ -0,0 +1,84 @@
+"""Tests for the shared token-bucket LLM rate limiter."""
+
+import time
+import pytest
+
+from dags.Features import rate_limiter
+from dags.Features.rate_limiter import RateLimiter, TokenBucket, gemini_api_keys, retry_after_from_error
+
+
+def test_gemini_api_keys_numbered_stop_at_gap(monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY1", "a")
+    monkeypatch.setenv("GEMINI_API_KEY2", "b")
+    monkeypatch.delenv("GEMINI_API_KEY3", raising=False)
+    monkeypatch.setenv("GEMINI_API_KEY4", "d")
+    assert gemini_api_keys() == ["a", "b"]
+
+
+def test_gemini_api_keys_single_fallback(monkeypatch):
+    monkeypatch.delenv("GEMINI_API_KEY1", raising=False)
+    monkeypatch.setenv("GEMINI_API_KEY", "solo")
+    assert gemini_api_keys() == ["solo"]
+
+
+@pytest.mark.parametrize("message,expected", [
+    ("Rate limit reached. Please try again in 7.5s.", 7.5),
+    ('{"retryDelay": "27s"}', 27.0),
+    ("quota exceeded", None),
+])
+def test_retry_after_from_error(message, expected):
+    assert retry_after_from_error(Exception(message)) == expected
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(capacity=60, period=60)   # 1 token per second
+    now = bucket.updated
+    bucket.take(60, now)
+    assert bucket.wait_time(5, now) == pytest.approx(5.0)
+    assert bucket.wait_time(5, now + 5) == 0.0
+    # Larger than the bucket: only waits for a full one
+    assert bucket.wait_time(600, now + 5) == pytest.approx(55.0)
+
+
+def test_no_keys_raises():
+    with pytest.raises(ValueError):
+        RateLimiter("empty", [], rpm=10, tpm=1000)
+
+
+def test_acquire_spreads_over_keys():
+    limiter = RateLimiter("spread", ["k1", "k2"], rpm=1, tpm=1_000_000)
+    first, second = limiter.acquire(10), limiter.acquire(10)
+    assert {first.api_key, second.api_key} == {"k1", "k2"}
+    assert limiter.snapshot()["requests"] == 2
+
+
+def test_penalized_key_is_skipped():
+    limiter = RateLimiter("cooldown", ["k1", "k2"], rpm=100, tpm=1_000_000)
+    lease = limiter.acquire(10)
+    limiter.penalize(lease, retry_after=60)
+    for _ in range(3):
+        assert limiter.acquire(10).index != lease.index
+    assert limiter.snapshot()["rate_limit_errors"] == 1
+
+
+def test_acquire_waits_for_refill():
+    limiter = RateLimiter("refill", ["k1"], rpm=600, tpm=1_000_000)   # 10 requests per second
+    limiter.keys[0].requests.tokens = 0
+    started = time.monotonic()
+    limiter.acquire(1)
+    assert 0.05 <= time.monotonic() - started < 1.0
+
+
+def test_record_usage_corrects_estimate():
+    limiter = RateLimiter("usage", ["k1"], rpm=100, tpm=1000)
+    lease = limiter.acquire(100)
+    limiter.record_usage(lease, 400)
+    key = limiter.keys[0]
+    assert key.used_tokens == 400
+    assert key.tokens.tokens == pytest.approx(600, abs=1)
+
+
+def test_get_limiter_is_shared():
+    rate_limiter._limiters.pop("shared-test", None)
+    assert rate_limiter.get_limiter("shared-test", ["k"]) is rate_limiter.get_limiter("shared-test")
+    assert "shared-test" in rate_limiter.metrics()
@@ -0,0 +1,99 @@
+"""Tests for the partitioned Parquet candle store."""
+
+import os
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from dags.Features.tools.candle_store import CandleStore, infer_interval, MARKET_TZ
+
+
+def bars(start, count, freq="1min", close=100.0):
+    ts = pd.date_range(start, periods=count, freq=freq, tz=MARKET_TZ)
+    return pd.DataFrame({"timestamp": ts, "open": close, "high": close + 1, "low": close - 1,
+                         "close": close, "volume": 10})
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CandleStore(str(tmp_path / "store"))
+
+
+def test_append_partitions_by_day_and_reads_back(store):
+    store.append("sbin", "ONE_MINUTE", bars("2025-01-06 15:25", 5))
+    store.append("sbin", "ONE_MINUTE", bars("2025-01-07 09:15", 5))
+    assert store.days("SBIN", "ONE_MINUTE") == ["2025-01-06", "2025-01-07"]
+    df = store.read("SBIN", "ONE_MINUTE")
+    assert len(df) == 10 and df["timestamp"].is_monotonic_increasing
+    assert str(df["timestamp"].dt.tz) == MARKET_TZ
+
+
+def test_read_prunes_to_range(store):
+    store.append("sbin", "ONE_MINUTE", bars("2025-01-06 09:15", 10))
+    store.append("sbin", "ONE_MINUTE", bars("2025-01-07 09:15", 10))
+    df = store.read("sbin", "ONE_MINUTE", start="2025-01-07 09:17", end="2025-01-07 09:19")
+    assert list(df["timestamp"].dt.strftime("%H:%M")) == ["09:17", "09:18", "09:19"]
+
+
+def test_read_of_unknown_series_is_empty_and_typed(store):
+    df = store.read("nope", "ONE_MINUTE")
+    assert df.empty and "close" in df.columns
+
+
+def test_dedupe_drops_old_rows_and_replaces_the_last_bar(store):
+    store.append("sbin", "ONE_MINUTE", bars("2025-01-06 09:15", 5, close=100.0))
+    # Re-sent bars: older ones are ignored, the last stored one is rewritten
+    written = store.append("sbin", "ONE_MINUTE", bars("2025-01-06 09:17", 4, close=105.0))
+    assert written == 2
+    df = store.read("sbin", "ONE_MINUTE")
+    assert len(df) == 6
+    assert list(df["close"]) == [100.0, 100.0, 100.0, 100.0, 105.0, 105.0]
+    assert store.last_timestamp("sbin", "ONE_MINUTE") == df["timestamp"].iloc[-1]
+
+
+def test_tail_reads_newest_days_only(store):
+    for day in ("2025-01-06", "2025-01-07", "2025-01-08"):
+        store.append("sbin", "ONE_MINUTE", bars(f"{day} 09:15", 5))
+    tail = store.tail("sbin", "ONE_MINUTE", 7)
+    assert len(tail) == 7
+    assert tail["timestamp"].iloc[0] == pd.Timestamp("2025-01-07 09:18", tz=MARKET_TZ)
+
+
+def test_compact_merges_parts_without_losing_rows(store):
+    for i in range(4):
+        store.append("sbin", "ONE_MINUTE", bars(f"2025-01-06 09:{15 + i * 5}", 5), dedupe=False)
+    day_dir = store._day_dir("sbin", "ONE_MINUTE", "2025-01-06")
+    assert len(store._parts(day_dir)) == 4
+    store.compact("sbin", "ONE_MINUTE")
+    assert len(store._parts(day_dir)) == 1
+    assert len(store.read("sbin", "ONE_MINUTE")) == 20
+
+
+@pytest.mark.parametrize("freq,count,expected", [
+    ("1min", 30, "ONE_MINUTE"),
+    ("5min", 30, "FIVE_MINUTE"),
+    ("15min", 10, "FIFTEEN_MINUTE"),
+    ("1h", 6, "ONE_HOUR"),
+    ("1B", 10, "ONE_DAY"),
+    ("7min", 10, None),
+])
+def test_infer_interval(freq, count, expected):
+    ts = pd.Series(pd.date_range("2025-01-06 09:15", periods=count, freq=freq))
+    assert infer_interval(ts) == expected
+
+
+def test_import_csv_uses_the_inferred_interval(store, tmp_path):
+    path = tmp_path / "sbi_candles_angel.csv"
+    bars("2025-01-06 09:15", 12, freq="5min").to_csv(path, index=False)
+    assert store.import_csv(str(path), "SBIN") == ("FIVE_MINUTE", 12)
+    assert store.last_timestamp("SBIN", "ONE_MINUTE") is None
+    # Already stored: a second migration is a no-op
+    assert store.import_csv(str(path), "SBIN") == ("FIVE_MINUTE", 0)
+
+
+def test_import_csv_skips_unclear_spacing(store, tmp_path):
+    path = tmp_path / "odd_candles_angel.csv"
+    bars("2025-01-06 09:15", 5, freq="7min").to_csv(path, index=False)
+    assert store.import_csv(str(path), "ODD") == (None, 0)
+    assert not os.path.exists(store._series_dir("ODD", "ONE_MINUTE"))
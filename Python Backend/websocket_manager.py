@@ -1,10 +1,62 @@
 # websocket_manager.py
-from typing import List
+import json
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Tuple
 from fastapi import WebSocket
+from starlette.websockets import WebSocketState
+
+# (symbol, exchange, interval)
+Topic = Tuple[str, str, str]
+
+# "full": every update carries the whole history (original protocol)
+# "delta": one snapshot on subscribe, then only new or changed bars with a sequence number
+MODES = {"full", "delta"}
+
+
+class TopicFeed:
+    """Subscribers of one topic plus the single upstream poller feeding them."""
+
+    def __init__(self, fetch: Callable[[], Awaitable[dict]]):
+        self.fetch = fetch
+        self.subscribers: Dict[WebSocket, str] = {}   # socket -> mode
+        self.task: asyncio.Task = None
+        self.last_message: dict = None
+        self.bars: Dict[str, dict] = {}                # timestamp -> latest record
+        self.seq = 0
+
+    def apply(self, records: List[dict]) -> List[dict]:
+        """
+        Merges a fresh poll (the whole history or just the latest bars) into the
+        known bars and returns the new or changed ones.
+        """
+        changed = []
+        for record in records:
+            ts = record["timestamp"]
+            if self.bars.get(ts) != record:
+                self.bars[ts] = record
+                changed.append(record)
+        if changed:
+            self.seq += 1
+        return changed
+
+    def snapshot(self) -> dict:
+        return {"type": "snapshot", "seq": self.seq, "data": list(self.bars.values())}
+
 
 class ConnectionManager:
-    def __init__(self):
+    """
+    Topic-based WebSocket hub.
+
+    Clients subscribe to a (symbol, exchange, interval) topic. Each topic runs
+    one upstream poller no matter how many clients watch it; every update is
+    broadcast to all subscribers, and the poller stops when the last one leaves.
+    """
+
+    def __init__(self, poll_interval: float = 60):
+        self.poll_interval = poll_interval
         self.active_connections: List[WebSocket] = []
+        self.topics: Dict[Topic, TopicFeed] = {}
+        self._lock = asyncio.Lock()
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
@@ -13,3 +65,102 @@ class ConnectionManager:
     def disconnect(self, websocket: WebSocket):
         if websocket in self.active_connections:
             self.active_connections.remove(websocket)
+        for topic in [t for t, feed in self.topics.items() if websocket in feed.subscribers]:
+            self._remove_subscriber(topic, websocket)
+
+    async def subscribe(self, websocket: WebSocket, topic: Topic,
+                        fetch: Callable[[], Awaitable[dict]], mode: str = "full"):
+        """
+        Adds a socket to a topic, starting the topic's poller if needed.
+        `fetch` is only used when this subscription creates the topic.
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode '{mode}'. Choose from {MODES}.")
+        async with self._lock:
+            feed = self.topics.get(topic)
+            if feed is None:
+                feed = self.topics[topic] = TopicFeed(fetch)
+            feed.subscribers[websocket] = mode
+            if feed.task is None or feed.task.done():
+                feed.task = asyncio.create_task(self._poll(topic, feed))
+            last_message = feed.last_message
+
+        # Late joiners get the latest state right away instead of waiting a full interval
+        if last_message is not None:
+            if mode == "delta":
+                await self._send(websocket, json.dumps(feed.snapshot()))
+            else:
+                await self._send(websocket, json.dumps(last_message))
+
+    async def resync(self, websocket: WebSocket, topic: Topic):
+        """Sends a fresh snapshot to a delta subscriber that detected a sequence gap."""
+        feed = self.topics.get(topic)
+        if feed is not None and feed.last_message is not None:
+            await self._send(websocket, json.dumps(feed.snapshot()))
+
+    def unsubscribe(self, websocket: WebSocket, topic: Topic):
+        self._remove_subscriber(topic, websocket)
+
+    def _remove_subscriber(self, topic: Topic, websocket: WebSocket):
+        feed = self.topics.get(topic)
+        if feed is None:
+            return
+        feed.subscribers.pop(websocket, None)
+        if not feed.subscribers:
+            if feed.task is not None:
+                feed.task.cancel()
+            del self.topics[topic]
+            print(f"🛑 Stopped poller for {topic} (no subscribers left)")
+
+    async def _send(self, websocket: WebSocket, text: str) -> bool:
+        if websocket.application_state != WebSocketState.CONNECTED:
+            return False
+        try:
+            await websocket.send_text(text)
+            return True
+        except Exception as e:
+            print(f"WebSocket send failed: {e}")
+            return False
+
+    async def broadcast(self, topic: Topic, message: dict, mode: str = None):
+        """Sends a message to a topic's subscribers (optionally only those in one mode), encoding it once."""
+        feed = self.topics.get(topic)
+        if feed is None:
+            return
+        subscribers = [ws for ws, m in feed.subscribers.items() if mode is None or m == mode]
+        if not subscribers:
+            return
+        text = json.dumps(message)
+        results = await asyncio.gather(*(self._send(ws, text) for ws in subscribers))
+        for websocket, ok in zip(subscribers, results):
+            if not ok:
+                self._remove_subscriber(topic, websocket)
+
+    async def _poll(self, topic: Topic, feed: TopicFeed):
+        print(f"▶️ Started poller for {topic}")
+        while feed.subscribers:
+            try:
+                message = await feed.fetch()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Poller error for {topic}:", e)
+                message = {"error": str(e)}
+
+            if "data" in message:
+                first_update = feed.last_message is None
+                changed = feed.apply(message["data"])
+                if first_update or changed:
+                    # fetch may return only the bars since its last call, so full
+                    # subscribers get the merged history, rebuilt only when it changed
+                    feed.last_message = {"data": list(feed.bars.values())}
+                await self.broadcast(topic, feed.last_message, mode="full")
+                if first_update:
+                    # Delta subscribers that joined before any data start from a snapshot
+                    await self.broadcast(topic, feed.snapshot(), mode="delta")
+                elif changed:
+                    await self.broadcast(topic, {"type": "delta", "seq": feed.seq, "data": changed}, mode="delta")
+            else:
+                await self.broadcast(topic, message)
+
+            await asyncio.sleep(self.poll_interval)